@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# Benchmark the offline tools on synthetic pcap files (see generate_pcap.py).
+#
+# Each stage is run in its own process to measure:
+#  - wall time
+#  - packets per second
+#  - peak RSS (resident set size) of the process
+#
+# Stages:
+#  - generate : generate_pcap.py
+#  - extract-<mode>: extract_features.py on the pcap file of the first class, for each mode
+#  - process  : process_pcaps.py on all pcap files
+#  - train    : train_model.py on the extracted features
+#
+# Results are written into a json file. Use `--compare` to compare them with the ones of another version, e.g.,
+#  ./benchmark.py -n 1000000 -o bench-new.json --compare bench-old.json
+#
+
+import argparse, json, os, platform, subprocess, sys, tempfile, time
+
+# directory containing this script
+__DIR__ = os.path.dirname(os.path.realpath(__file__))
+
+STAGES = ["generate", "extract", "process", "train"]
+
+
+# run a python script of this folder, return its wall time (in second) and peak RSS (in MB)
+def run_stage( script, args, cwd ):
+    cmd = [sys.executable, os.path.join( __DIR__, script )] + [str(a) for a in args]
+    print(" ".join( cmd ))
+    start = time.perf_counter()
+    p = subprocess.Popen( cmd, cwd=cwd, stdout=subprocess.DEVNULL )
+    # wait4 gives resource usage of this child only
+    (pid, status, usage) = os.wait4( p.pid, 0 )
+    wall = time.perf_counter() - start
+    p.returncode = os.waitstatus_to_exitcode( status )
+    if p.returncode != 0:
+        raise Exception("stage failed", cmd, p.returncode)
+
+    # ru_maxrss is in KB on Linux, in byte on macOS
+    rss = usage.ru_maxrss / 1024
+    if platform.system() == "Darwin":
+        rss /= 1024
+    return {"wall": round(wall, 3), "peak_rss_mb": round(rss, 1)}
+
+def get_version():
+    try:
+        return subprocess.check_output( ["git", "describe", "--always", "--dirty"], cwd=__DIR__, text=True ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark( args, work_dir ):
+    pcap_dir = os.path.join( work_dir, "pcaps" )
+    features = os.path.join( work_dir, "features.store" )
+    nb_packets = args.n * args.c
+    results = {}
+
+    def add( name, result, packets ):
+        if packets:
+            result["packets_per_sec"] = round( packets / max(result["wall"], 1e-9) )
+        results[ name ] = result
+        print(" ", name, result)
+
+    add( "generate", run_stage( "generate_pcap.py", ["-o", pcap_dir, "-n", args.n, "-f", args.f, "-c", args.c], work_dir ), nb_packets )
+
+    if "extract" in args.stages:
+        pcap = os.path.join( pcap_dir, "class1.synth.pcap" )
+        for mode in args.modes:
+            output = os.path.join( work_dir, "extract-{0}.store".format( mode ))
+            add( "extract-" + mode, run_stage( "extract_features.py", ["-i", pcap, "-o", output, "-c", 1, "-m", mode], work_dir ), args.n )
+        if args.f > 1:
+            output = os.path.join( work_dir, "extract-flows.store" )
+            add( "extract-flows", run_stage( "extract_features.py", ["-i", pcap, "-o", output, "-c", 1, "--flows"], work_dir ), args.n )
+        if args.j > 1:
+            output = os.path.join( work_dir, "extract-jobs.store" )
+            add( "extract-jobs", run_stage( "extract_features.py", ["-i", pcap, "-o", output, "-c", 1, "-j", args.j], work_dir ), args.n )
+
+    if "process" in args.stages or "train" in args.stages:
+        add( "process", run_stage( "process_pcaps.py", ["-d", pcap_dir, "-o", features, "-m", "batch", "-j", args.j], work_dir ), nb_packets )
+
+    if "train" in args.stages:
+        model = os.path.join( work_dir, "dt.npz" )
+        add( "train", run_stage( "train_model.py", ["-i", features, "-o", model, "--plot", ""], work_dir ), nb_packets )
+
+    return results
+
+# print ratios of wall time and peak RSS wrt another result file
+def compare( results, old_file ):
+    with open( old_file ) as f:
+        old = json.load( f )
+    print("comparison with {0} ({1}):".format( old_file, old.get("version") ))
+    for name in results["stages"]:
+        if name not in old["stages"]:
+            continue
+        new_val = results["stages"][ name ]
+        old_val = old["stages"][ name ]
+        print("  {0:16} wall x{1:.2f}  peak_rss x{2:.2f}".format( name,
+            new_val["wall"] / max(old_val["wall"], 1e-9),
+            new_val["peak_rss_mb"] / max(old_val["peak_rss_mb"], 1e-9) ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-n', default=100000, type=int, help='number of packets per class')
+    parser.add_argument('-f', default=1, type=int, help='number of flows per class')
+    parser.add_argument('-c', default=3, type=int, help='number of classes')
+    parser.add_argument('-j', default=1, type=int, help='number of worker processes')
+    parser.add_argument('-o', default="./benchmark.json", help='path to the output json file')
+    parser.add_argument('--stages', default=",".join(STAGES[1:]), help='comma-separated stages to run after "generate"')
+    parser.add_argument('--modes', default="stream,batch", help='comma-separated extraction modes, "memory" is slow on large files')
+    parser.add_argument('--compare', help='path to a json file of a previous benchmark')
+    parser.add_argument('-w', help='path to the working folder, a temporary folder is used by default')
+    args = parser.parse_args()
+    args.stages = args.stages.split(",")
+    args.modes  = args.modes.split(",")
+
+    if args.w:
+        os.makedirs( args.w, exist_ok=True )
+        stages = benchmark( args, args.w )
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            stages = benchmark( args, work_dir )
+
+    results = {
+        "version": get_version(),
+        "date"   : time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host"   : platform.node(),
+        "params" : {"packets": args.n, "flows": args.f, "classes": args.c, "jobs": args.j},
+        "stages" : stages,
+    }
+
+    print("write results to", args.o)
+    with open( args.o, "w" ) as f:
+        json.dump( results, f, indent=3 )
+
+    if args.compare:
+        compare( results, args.compare )
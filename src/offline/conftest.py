@@ -0,0 +1,51 @@
+# Fixtures of the tests of the scripts of this folder, e.g.,
+#  cd src/offline && python -m pytest -q
+#
+# The tests import the scripts as modules, as they import each other, from this folder.
+#
+
+import struct
+import numpy as np
+import pytest
+
+# magic number of a pcap file having timestamps in microsecond, and its link type
+PCAP_MAGIC = 0xa1b2c3d4
+LINKTYPE_ETHERNET = 1
+
+
+# write a pcap file of Ethernet/IPv4/UDP packets
+#  ts: timestamps in microsecond, ip_len: IP total lengths, ports: optional (sport, dport) of each packet
+def write_pcap( path, ts, ip_len, ports = None ):
+    with open( path, "wb" ) as f:
+        f.write( struct.pack( "<IHHiIII", PCAP_MAGIC, 2, 4, 0, 0, 65535, LINKTYPE_ETHERNET ))
+        for (i, (t, l)) in enumerate( zip( ts, ip_len )):
+            (sport, dport) = ports[ i ] if ports is not None else (1000, 2000)
+            ip  = struct.pack( ">BBHHHBBH4s4s", 0x45, 0, l, 0, 0, 64, 17, 0, bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2]) )
+            udp = struct.pack( ">HHHH", sport, dport, max( 8, l - 20 ), 0 )
+            data = b"\x00" * 12 + b"\x08\x00" + ip + udp
+            # only the headers are captured
+            f.write( struct.pack( "<IIII", t // 1000000, t % 1000000, len(data), 14 + l ))
+            f.write( data )
+    return str( path )
+
+# timestamps (in microsecond) and IP lengths of n packets, a few of them being unordered
+def make_packets( n, seed = 0, start = 1000000 ):
+    rng = np.random.default_rng( seed )
+    ts  = start + np.cumsum( rng.integers( 0, 50000, n ))
+    # some packets arrive late
+    late = rng.choice( n, n // 50, replace=False )
+    ts[ late ] -= rng.integers( 0, 200000, len(late) )
+    ts  = np.maximum( ts, 0 )
+    ip_len = rng.integers( 28, 1500, n )
+    return (ts.tolist(), ip_len.tolist())
+
+
+@pytest.fixture
+def pcap_file( tmp_path ):
+    def write( ts, ip_len, name = "test.pcap", ports = None ):
+        return write_pcap( tmp_path / name, ts, ip_len, ports )
+    return write
+
+@pytest.fixture
+def random_packets():
+    return make_packets
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+# Train a small ensemble of decision trees which are compiled to several `ml_code` stages of basic.p4.
+#
+# Each tree is expanded to its own range table: `MyIngress.ml_code` for the first tree, then
+#  `MyIngress.ml_code_<i>` whose action writes the vote of the i-th tree.
+#  The final class is matched in `MyIngress.ml_vote` table by the combination of the votes. Its entries
+#  are computed here for all combinations, thus the switch needs no arithmetic for a majority or a weighted vote.
+#
+# An ensemble is either:
+#  - forest: trees trained on bootstrap samples of the rows (random forest), majority vote
+#  - boost : trees trained one after the other on the rows misclassified by the previous ones (AdaBoost),
+#            the vote of each tree has its own weight
+# The entry budget is shared by the trees, each one has at most budget / nb_trees leaves.
+#
+# The per-packet cost of a configuration in the pipeline is:
+#  - the number of tables applied per packet: one range table per tree, then ml_vote table
+#  - the number of range entries, and of ternary entries if a target expands the ranges to prefixes
+#  - the number of exact entries of ml_vote table
+#
+# This script compares several configurations, e.g.,
+#  ./ensemble.py -i pcaps/features.csv --kinds forest,boost --trees 1,2,3,4 -j 4 --report pcaps/ensemble.csv
+#
+
+import argparse, csv, itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import feature_store, tree_model
+from tree_model import int_bound
+
+KINDS = ["forest", "boost"]
+
+# number of ml_code tables of basic.p4
+MAX_TREES = 4
+
+# see model_search.py
+BUDGET    = 8192
+TEST_SIZE = 0.3
+
+NB_TREES = 3
+
+# number of bits of the match fields of the features in basic.p4
+FIELD_BITS = {"iat": 64, "len": 16, "diffLen": 32}
+
+
+# train an ensemble of `nb_trees` trees having at most `max_leaf_nodes` leaves each
+#  sklearn is imported only here as the table generator needs only the cost and the votes
+def fit( X, Y, kind = "forest", nb_trees = NB_TREES, max_leaf_nodes = None, max_depth = None, seed = 0 ):
+    from sklearn import tree
+    from sklearn.ensemble import AdaBoostClassifier, RandomForestClassifier
+
+    if nb_trees > MAX_TREES:
+        raise ValueError("too many trees for the P4 program", nb_trees, MAX_TREES)
+    if kind == "forest":
+        model = RandomForestClassifier( n_estimators=nb_trees, max_leaf_nodes=max_leaf_nodes, max_depth=max_depth, random_state=seed )
+        model.fit( X, Y )
+        weights = np.ones( len(model.estimators_) )
+    elif kind == "boost":
+        base  = tree.DecisionTreeClassifier( max_leaf_nodes=max_leaf_nodes, max_depth=max_depth )
+        model = AdaBoostClassifier( estimator=base, n_estimators=nb_trees, random_state=seed )
+        model.fit( X, Y )
+        # boosting stops early once a tree is perfect, the P4 program then has less ml_code tables
+        weights = model.estimator_weights_[ 0 : len(model.estimators_) ]
+        if len(model.estimators_) < nb_trees:
+            print("warning: boosting stopped after {0} of {1} trees, compile the P4 program with NB_TREES={0}".format(
+                len(model.estimators_), nb_trees ))
+    else:
+        raise ValueError("unknown kind of ensemble", kind)
+
+    trees = []
+    for e in model.estimators_:
+        t = tree_model.from_sklearn( e )
+        # trees of a forest are trained on the indices of the classes
+        t.classes = np.asarray( model.classes_, dtype=np.int64 )
+        trees.append( t )
+    return tree_model.Ensemble( trees, weights )
+
+# get the entries of ml_vote table: (class index voted by each tree, class index of the result)
+def vote_entries( ensemble ):
+    combinations = np.array( list( itertools.product( range( len(ensemble.classes) ), repeat=len(ensemble.trees) )))
+    results = ensemble.vote( combinations.T )
+    return list( zip( combinations.tolist(), results.tolist() ))
+
+
+# number of prefixes covering the integers in [lo, hi]
+def nb_prefixes( lo, hi ):
+    n = 0
+    while lo <= hi:
+        # the greatest aligned block starting at lo which is in [lo, hi]
+        size = lo & -lo if lo > 0 else 1 << 64
+        while size > hi - lo + 1:
+            size >>= 1
+        lo += size
+        n  += 1
+    return n
+
+# get the integer range [lo, hi] of each feature of each leaf
+def leaf_ranges( model ):
+    bits   = [FIELD_BITS.get( name, 32 ) for name in model.feature_names]
+    ranges = []
+    stack  = [(0, [(0, (1 << b) - 1) for b in bits])]
+    while len(stack) > 0:
+        (node, box) = stack.pop()
+        if model.children_left[ node ] == -1:
+            ranges.append( box )
+            continue
+        f = model.feature[ node ]
+        # sklearn compares features as float32, see snap_thresholds.py
+        t = int_bound( model.threshold[ node ] )
+        (lo, hi) = box[ f ]
+        left  = list( box )
+        right = list( box )
+        left[ f ]  = (lo, min( hi, t ))
+        right[ f ] = (max( lo, t + 1 ), hi)
+        stack.append( (model.children_right[ node ], right) )
+        stack.append( (model.children_left[ node ], left) )
+    return ranges
+
+# per-packet cost of a TreeModel or an Ensemble in the pipeline
+def pipeline_cost( model ):
+    trees = model.trees if isinstance( model, tree_model.Ensemble ) else [model]
+    ternary = 0
+    for t in trees:
+        for box in leaf_ranges( t ):
+            # an entry is expanded to the cross product of the prefixes of its ranges
+            ternary += int( np.prod( [nb_prefixes( lo, hi ) for (lo, hi) in box if hi >= lo] ))
+    return {
+        "trees"          : len(trees),
+        "tables"         : len(trees) + (1 if len(trees) > 1 else 0),
+        "range_entries"  : sum( t.get_n_leaves() for t in trees ),
+        "ternary_entries": ternary,
+        "vote_entries"   : len(model.classes) ** len(trees) if len(trees) > 1 else 0,
+    }
+
+def format_cost( cost ):
+    return "tables/packet={0} range_entries={1} ternary_entries={2} vote_entries={3}".format(
+        cost["tables"], cost["range_entries"], cost["ternary_entries"], cost["vote_entries"] )
+
+
+# data of a worker process, set once by _init_worker
+_data = None
+
+def _init_worker( data ):
+    global _data
+    _data = data
+
+# train a configuration, then return (kind, number of trees, accuracy, cost)
+def _fit( config ):
+    (X_train, Y_train, X_test, Y_test, budget, max_depth, seed) = _data
+    (kind, nb_trees) = config
+    model = fit( X_train, Y_train, kind, nb_trees, max( 2, budget // nb_trees ), max_depth, seed )
+    return (kind, nb_trees, model.score( X_test, Y_test ), pipeline_cost( model ))
+
+# train all configurations on a training split, `jobs` at a time
+def compare( X, Y, configs, budget = BUDGET, max_depth = None, jobs = 1, test_size = TEST_SIZE, seed = 0 ):
+    from sklearn.model_selection import train_test_split
+    (X_train, X_test, Y_train, Y_test) = train_test_split( X, Y, test_size=test_size, random_state=seed, stratify=Y )
+    data = (X_train, Y_train, X_test, Y_test, budget, max_depth, seed)
+    if jobs <= 1:
+        _init_worker( data )
+        return [_fit( c ) for c in configs]
+
+    with ProcessPoolExecutor( max_workers=jobs, initializer=_init_worker, initargs=(data,) ) as executor:
+        return list( executor.map( _fit, configs ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', default="./pcaps/features.csv", help='path to csv. dataset or .store directory')
+    parser.add_argument('-j', '--jobs', default=1, type=int, help='number of worker processes')
+    parser.add_argument('--kinds', default=",".join( KINDS ), help='comma-separated kinds of ensemble: forest, boost')
+    parser.add_argument('--trees', default=",".join( str(i) for i in range( 1, MAX_TREES + 1 )), help='comma-separated numbers of trees')
+    parser.add_argument('--budget', default=BUDGET, type=int, help='maximum number of range entries of all trees')
+    parser.add_argument('--max-depth', type=int, help='maximal depth of the trees')
+    parser.add_argument('--test-size', default=TEST_SIZE, type=float, help='fraction of rows held out to score the configurations')
+    parser.add_argument('--report', help='path to output csv file containing the accuracy and the cost of all configurations')
+    args = parser.parse_args()
+
+    (X, Y) = feature_store.load_xy( args.i )
+    configs = [(kind, int(n)) for kind in args.kinds.split(",") for n in args.trees.split(",")]
+    results = compare( X, Y, configs, args.budget, args.max_depth, args.jobs, args.test_size )
+    for (kind, nb_trees, accuracy, cost) in results:
+        print("{0:6} trees={1} accuracy={2:.4f} {3}".format( kind, nb_trees, accuracy, format_cost( cost )))
+
+    if args.report:
+        print("write report to", args.report)
+        with open( args.report, 'w', newline='' ) as f:
+            writer = csv.writer( f )
+            writer.writerow( ["kind", "trees", "accuracy", "tables", "range_entries", "ternary_entries", "vote_entries"] )
+            for (kind, nb_trees, accuracy, cost) in results:
+                writer.writerow( [kind, nb_trees, accuracy, cost["tables"], cost["range_entries"], cost["ternary_entries"], cost["vote_entries"]] )
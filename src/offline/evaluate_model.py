@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# Evaluate the decision tree by stratified k-fold cross validation.
+#
+# Each fold is trained on the other folds then tested on itself, folds are evaluated in parallel.
+# For each fold, it reports:
+#  - the precision, recall and F1 score of each class
+#  - the confusion matrix: rows are the true classes, columns are the predicted ones
+#  - the number of entries of `MyIngress.ml_code` table, i.e., the number of leaves (see model_search.py)
+#
+# The features and the fold of each row are cached in `cache_dir` by the hash of the dataset,
+#  thus a rerun, e.g., with other hyperparameters, neither parses the dataset nor splits it again.
+#  Worker processes memory-map the cached arrays instead of receiving a copy of them.
+#
+# e.g., ./evaluate_model.py -i ./pcaps/features.csv -k 5 -j 5 --max-depth 10 --report ./pcaps/eval.json
+#
+
+import argparse, hashlib, json, os, shutil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn import tree
+from sklearn.metrics import confusion_matrix, precision_recall_fscore_support
+from sklearn.model_selection import StratifiedKFold
+import feature_store, model_search, tree_model
+
+# version of the cached folds, to be increased when their format changes
+VERSION = 1
+
+NB_FOLDS = 5
+
+
+# hash the content of a csv file or of all files of a store
+def hash_dataset( path ):
+    h = hashlib.sha256()
+    if feature_store.is_store( path ):
+        files = sorted( os.listdir( path ))
+    else:
+        files = [None]
+    for name in files:
+        file_name = path if name is None else os.path.join( path, name )
+        if name is not None:
+            h.update( name.encode() )
+        with open( file_name, 'rb' ) as f:
+            for block in iter( lambda: f.read( 1024*1024 ), b"" ):
+                h.update( block )
+    return h.hexdigest()
+
+def get_fold_dir( path, cache_dir, k, seed ):
+    key = hashlib.sha256( "{0}-{1}-{2}-{3}".format( hash_dataset( path ), VERSION, k, seed ).encode() ).hexdigest()
+    return os.path.join( cache_dir, key )
+
+# get the directory of the cached X, Y and fold of each row, create it if it is not existing
+def get_folds( path, cache_dir, k = NB_FOLDS, seed = 0 ):
+    fold_dir = get_fold_dir( path, cache_dir, k, seed )
+    if os.path.exists( fold_dir ):
+        print("cached folds", fold_dir)
+        return fold_dir
+
+    (X, Y) = feature_store.load_xy( path )
+    folds = np.empty( len(Y), dtype=np.int32 )
+    splitter = StratifiedKFold( n_splits=k, shuffle=True, random_state=seed )
+    for (i, (train, test)) in enumerate( splitter.split( X, Y )):
+        folds[ test ] = i
+
+    # write to a temporary directory first to avoid leaving partial folds
+    tmp_dir = fold_dir + ".{0}.tmp".format( os.getpid() )
+    os.makedirs( tmp_dir )
+    np.save( os.path.join( tmp_dir, "X.npy" ), np.asarray( X, dtype=np.int64 ))
+    np.save( os.path.join( tmp_dir, "Y.npy" ), np.asarray( Y, dtype=np.int64 ))
+    np.save( os.path.join( tmp_dir, "folds.npy" ), folds )
+    with open( os.path.join( tmp_dir, "names.json" ), "w" ) as f:
+        json.dump( feature_store.load_feature_names( path ), f )
+    try:
+        os.replace( tmp_dir, fold_dir )
+    except OSError:
+        # another run has cached the same folds
+        shutil.rmtree( tmp_dir )
+    return fold_dir
+
+def load_folds( fold_dir ):
+    X     = np.load( os.path.join( fold_dir, "X.npy" ), mmap_mode="r" )
+    Y     = np.load( os.path.join( fold_dir, "Y.npy" ), mmap_mode="r" )
+    folds = np.load( os.path.join( fold_dir, "folds.npy" ), mmap_mode="r" )
+    return (X, Y, folds)
+
+
+# data of a worker process, set once by _init_worker
+_data = None
+
+def _init_worker( fold_dir, params, seed ):
+    global _data
+    (X, Y, folds) = load_folds( fold_dir )
+    _data = (X, Y, folds, np.unique( Y ), params, seed)
+
+# train on all folds but `fold`, then test on `fold`
+def _evaluate_fold( fold ):
+    (X, Y, folds, classes, params, seed) = _data
+    is_test = (folds == fold)
+    dt = tree.DecisionTreeClassifier( random_state=seed, **params )
+    dt.fit( X[ ~is_test ], Y[ ~is_test ] )
+    predicted = dt.predict( X[ is_test ] )
+
+    (precision, recall, f1, support) = precision_recall_fscore_support( Y[ is_test ], predicted, labels=classes, zero_division=0 )
+    return {
+        "fold"     : int( fold ),
+        "accuracy" : float( np.mean( predicted == Y[ is_test ] )),
+        "entries"  : model_search.count_entries( dt ),
+        "classes"  : classes.tolist(),
+        "precision": precision.tolist(),
+        "recall"   : recall.tolist(),
+        "f1"       : f1.tolist(),
+        "support"  : support.tolist(),
+        "confusion": confusion_matrix( Y[ is_test ], predicted, labels=classes ).tolist(),
+    }
+
+# evaluate all folds, `jobs` at a time
+def evaluate( fold_dir, params, jobs = 1, seed = 0 ):
+    (X, Y, folds) = load_folds( fold_dir )
+    k = int( folds.max() ) + 1
+    if jobs <= 1:
+        _init_worker( fold_dir, params, seed )
+        return [_evaluate_fold( i ) for i in range( k )]
+
+    with ProcessPoolExecutor( max_workers=jobs, initializer=_init_worker, initargs=(fold_dir, params, seed) ) as executor:
+        return list( executor.map( _evaluate_fold, range( k )))
+
+# mean of the metrics of all folds, and sum of their confusion matrices
+def summarize( results ):
+    summary = {"fold": "mean", "classes": results[0]["classes"]}
+    for metric in ("accuracy", "entries", "precision", "recall", "f1"):
+        summary[ metric ] = np.mean( [r[ metric ] for r in results], axis=0 ).tolist()
+    summary["support"]   = np.sum( [r["support"] for r in results], axis=0 ).tolist()
+    summary["confusion"] = np.sum( [r["confusion"] for r in results], axis=0 ).tolist()
+    return summary
+
+def print_result( result, class_names ):
+    print("fold {0}: accuracy={1:.4f} entries={2}".format( result["fold"], result["accuracy"], result["entries"] ))
+    names = [class_names.get( c, str(c) ) for c in result["classes"]]
+    width = max( 8, max( len(n) for n in names ))
+    print("  {0:>{w}} {1:>9} {2:>9} {3:>9} {4:>9}".format( "class", "precision", "recall", "f1", "support", w=width ))
+    for (i, name) in enumerate( names ):
+        print("  {0:>{w}} {1:9.4f} {2:9.4f} {3:9.4f} {4:9}".format( name, result["precision"][i], result["recall"][i],
+            result["f1"][i], result["support"][i], w=width ))
+    print("  confusion (rows: true class, columns: predicted class):")
+    print("  {0:>{w}} ".format( "", w=width ) + " ".join( "{0:>9}".format( n[0:9] ) for n in names ))
+    for (name, row) in zip( names, result["confusion"] ):
+        print("  {0:>{w}} ".format( name, w=width ) + " ".join( "{0:9}".format( v ) for v in row ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', default="./pcaps/features.csv", help='path to csv. dataset or .store directory')
+    parser.add_argument('-k', default=NB_FOLDS, type=int, help='number of folds')
+    parser.add_argument('-j', '--jobs', default=1, type=int, help='number of worker processes')
+    parser.add_argument('-m', help='path to the map.json file giving the names of the classes, default: map.json in the directory of the input')
+    parser.add_argument('--cache', default="./pcaps/.folds", help='directory of the cached folds')
+    parser.add_argument('--seed', default=0, type=int, help='seed of the split and of the trees')
+    parser.add_argument('--max-depth', type=int, help='maximal depth of the tree')
+    parser.add_argument('--max-leaf-nodes', type=int, help='maximal number of leaves of the tree')
+    parser.add_argument('--min-samples-leaf', default=1, type=int, help='minimal number of rows of a leaf')
+    parser.add_argument('--report', help='path to output json file containing the metrics of all folds')
+    args = parser.parse_args()
+
+    # names of the classes
+    mapfile = args.m
+    if mapfile is None:
+        mapfile = os.path.join( os.path.dirname( os.path.abspath( args.i )), "map.json" )
+    class_names = {}
+    if os.path.exists( mapfile ):
+        class_names = {index: name for (name, index) in tree_model.load_class_map( mapfile ).items()}
+
+    os.makedirs( args.cache, exist_ok=True )
+    fold_dir = get_folds( args.i, args.cache, args.k, args.seed )
+    params = {"max_depth": args.max_depth, "max_leaf_nodes": args.max_leaf_nodes, "min_samples_leaf": args.min_samples_leaf}
+    results = evaluate( fold_dir, params, args.jobs, args.seed )
+
+    for r in results:
+        print_result( r, class_names )
+    summary = summarize( results )
+    print_result( summary, class_names )
+
+    if args.report:
+        print("write report to", args.report)
+        with open( args.report, "w" ) as f:
+            json.dump( {"params": params, "folds": results, "mean": summary}, f, indent=3 )
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# Classify feature vectors by the entries of the generated tables (see generate_table_entries.py),
+#  i.e., as the switch does, to check the entries against the model they are generated from.
+#
+# The entries of pcaps/s1-commands.txt are parsed, e.g.,
+#  table_add MyIngress.ml_code set_result 1->94207 0->47 0->65531 => 1 1
+# then each range table is indexed:
+#  - the bounds of the ranges of a field cut its values into cells, i.e., sorted breakpoints,
+#    thus a value is mapped to its cell by a binary search
+#  - a lookup array gives the entry matched in each combination of cells of the fields,
+#    or, if it would be too big, the entries matching each cell of a field are bitsets which are intersected
+#  As in BMv2, when several entries match, the one having the smallest priority value wins.
+#
+# As the P4 program (see ../bmv2/basic.p4), a packet matching no entry keeps 0 (unknown) as result,
+#  the votes of the trees of an ensemble are combined by `MyIngress.ml_vote` table.
+#
+# It reports the rows whose class differs from the one predicted by the model, e.g.,
+#  ./evaluate_table.py -c ./pcaps/s1-commands.txt -i ./pcaps/dt.npz -v ./pcaps/features.csv
+# with the same `--budget` as generate_table_entries.py if the entries are generated with it.
+#
+
+import argparse, itertools, sys, time
+import numpy as np
+import feature_store, predict_file, tree_model
+
+# tables of the P4 program, the first tree then the other ones of an ensemble
+CODE_TABLES = ["MyIngress.ml_code"] + ["MyIngress.ml_code_{0}".format( i ) for i in range( 1, 4 )]
+VOTE_TABLE  = "MyIngress.ml_vote"
+
+# maximal number of cells of a lookup array (int32), otherwise bitsets are used
+MAX_CELLS = 1 << 24
+
+# result of a packet matching no entry
+NO_RESULT = 0
+
+# number of rows whose entries are matched at once with bitsets
+BATCH_SIZE = 1 << 16
+
+INT64_MAX = np.iinfo( np.int64 ).max
+
+# position of the first set bit of a byte, from the most significant one (as np.packbits)
+FIRST_BIT = np.array( [0] + [7 - int( np.log2( b )) for b in range( 1, 256 )], dtype=np.int64 )
+
+
+# parse the entries of a file of runtime_CLI commands
+#  return {table name: [(keys, action parameters, priority)]}
+#   keys are (lo, hi) for a range field, an integer for an exact field
+def parse_commands( path ):
+    tables = {}
+    with open( path ) as f:
+        for (line_no, line) in enumerate( f, 1 ):
+            tokens = line.split()
+            if len(tokens) == 0 or tokens[0] != "table_add":
+                continue
+            if not "=>" in tokens:
+                raise Exception("missing => in line", line_no, line)
+            sep    = tokens.index( "=>" )
+            table  = tokens[1]
+            keys   = []
+            for key in tokens[ 3 : sep ]:
+                if "->" in key:
+                    (lo, hi) = key.split( "->" )
+                    keys.append( (int( lo, 0 ), min( int( hi, 0 ), INT64_MAX - 1 )) )
+                elif "&&&" in key or "/" in key:
+                    raise Exception("unsupported match kind in line", line_no, key)
+                else:
+                    keys.append( int( key, 0 ))
+            params = [int( p, 0 ) for p in tokens[ sep + 1 : ]]
+            # a table having range fields needs a priority, i.e., the last parameter
+            priority = None
+            if any( isinstance( k, tuple ) for k in keys ):
+                priority = params.pop()
+            tables.setdefault( table, [] ).append( (keys, params, priority) )
+    return tables
+
+
+# index of the entries of a range table
+class RangeTable:
+    def __init__(self, entries, max_cells = MAX_CELLS):
+        # the winning entries first
+        entries = sorted( entries, key=lambda e: e[2] )
+        self.values = np.array( [params[0] for (keys, params, priority) in entries], dtype=np.int64 )
+        lo = np.array( [[k[0] for k in keys] for (keys, params, priority) in entries], dtype=np.int64 ).reshape( len(entries), -1 )
+        hi = np.array( [[k[1] for k in keys] for (keys, params, priority) in entries], dtype=np.int64 ).reshape( len(entries), -1 )
+
+        # cell c of a field contains the values in [edges[c-1], edges[c]),
+        #  cell 0 and the last one contain the values out of all ranges
+        self.edges = [np.unique( np.concatenate( (lo[:, f], hi[:, f] + 1) )) for f in range( lo.shape[1] )]
+        first = np.column_stack( [self._cell( f, lo[:, f] ) for f in range( lo.shape[1] )] )
+        last  = np.column_stack( [self._cell( f, hi[:, f] + 1 ) for f in range( lo.shape[1] )] )
+        shape = tuple( len(e) + 1 for e in self.edges )
+
+        if np.prod( shape, dtype=np.float64 ) <= max_cells:
+            # entry of each combination of cells, the winning entries are written last
+            self.lookup = np.full( shape, -1, dtype=np.int32 )
+            for i in range( len(entries) - 1, -1, -1 ):
+                self.lookup[ tuple( slice( a, b ) for (a, b) in zip( first[ i ], last[ i ] )) ] = i
+            self.bitsets = None
+        else:
+            # entries matching each cell of each field, bit i is the i-th entry
+            self.lookup  = None
+            self.bitsets = []
+            for f in range( len(shape) ):
+                cells = np.arange( shape[ f ] )
+                covers = (cells[:, None] >= first[:, f][None, :]) & (cells[:, None] < last[:, f][None, :])
+                self.bitsets.append( np.packbits( covers, axis=1 ))
+
+    def _cell( self, f, values ):
+        return np.searchsorted( self.edges[ f ], values, side="right" )
+
+    # get the entry matched by each row of X, -1 if none
+    def match(self, X):
+        X = np.asarray( X, dtype=np.int64 )
+        cells = [self._cell( f, X[:, f] ) for f in range( len(self.edges) )]
+        if self.lookup is not None:
+            return self.lookup[ tuple( cells ) ]
+
+        entries = np.empty( len(X), dtype=np.int64 )
+        for start in range( 0, len(X), BATCH_SIZE ):
+            end  = min( start + BATCH_SIZE, len(X) )
+            bits = self.bitsets[0][ cells[0][ start : end ]]
+            for f in range( 1, len(cells) ):
+                bits &= self.bitsets[ f ][ cells[ f ][ start : end ]]
+            # the first entry is the first set bit of the first non-zero byte
+            byte = np.argmax( bits != 0, axis=1 )
+            value = bits[ np.arange( end - start ), byte ]
+            entries[ start : end ] = np.where( value != 0, byte * 8 + FIRST_BIT[ value ], -1 )
+        return entries
+
+    # get the action parameter of the entry matched by each row of X, `default` if none
+    def lookup_values(self, X, default = NO_RESULT):
+        entries = self.match( X )
+        return np.where( entries >= 0, self.values[ np.maximum( entries, 0 ) ], default )
+
+
+# the tables of the P4 program which give the class of a packet
+class Pipeline:
+    def __init__(self, tables, max_cells = MAX_CELLS):
+        if not CODE_TABLES[0] in tables:
+            raise Exception("no entry of table", CODE_TABLES[0])
+        self.code = [RangeTable( tables[ name ], max_cells ) for name in CODE_TABLES if name in tables]
+        # class of each combination of votes
+        vote = {tuple( keys ): params[0] for (keys, params, priority) in tables.get( VOTE_TABLE, [] )}
+        self.nb_vote_entries = len(vote)
+        # the votes are indexed in the values set by the tables, then their combination in a lookup array
+        #  a combination matching no entry keeps the vote of the first tree
+        self.vote_values = np.unique( np.concatenate( [t.values for t in self.code] + [np.array( [NO_RESULT] + [v for k in vote for v in k] )] ))
+        self.vote_lookup = None
+        if len(vote) > 0:
+            combinations = itertools.product( self.vote_values.tolist(), repeat=len(self.code) )
+            self.vote_lookup = np.array( [vote.get( c, c[0] ) for c in combinations], dtype=np.int64 )
+
+    def get_n_entries(self):
+        return sum( len(t.values) for t in self.code ) + self.nb_vote_entries
+
+    # rows matching no entry of the first table
+    def misses(self, X):
+        return self.code[0].match( X ) < 0
+
+    def predict(self, X):
+        votes = [t.lookup_values( X ) for t in self.code]
+        if self.vote_lookup is None:
+            return votes[0]
+        code = np.zeros( len(votes[0]), dtype=np.int64 )
+        for v in votes:
+            code = code * len(self.vote_values) + np.searchsorted( self.vote_values, v )
+        return self.vote_lookup[ code ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-c', default="./pcaps/s1-commands.txt", help='path to the entries of the tables')
+    parser.add_argument('-i', default=tree_model.MODEL_FILE, help='path to the model the entries are generated from')
+    parser.add_argument('-v', default="./pcaps/features.csv", help='path to csv file or .store directory to classify')
+    parser.add_argument('--batch-size', default=predict_file.BATCH_SIZE, type=int, help='number of rows read and classified at once')
+    parser.add_argument('--budget', type=int, help='the same budget as generate_table_entries.py, the trees are pruned as it')
+    parser.add_argument('--show', default=10, type=int, help='number of rows to print whose class differs from the model')
+    args = parser.parse_args()
+
+    pipeline = Pipeline( parse_commands( args.c ))
+    # the trees of the entries, see generate_table_entries.py
+    (dt, nb_removed) = tree_model.table_model( tree_model.load( args.i ), args.budget )
+    print("{0} entries in {1} range tables".format( pipeline.get_n_entries(), len(pipeline.code) ))
+
+    # rows: classification of the file, columns: class of the tables
+    confusion = predict_file.Confusion( dt.classes )
+    nb_rows = nb_misses = nb_differences = 0
+    duration = 0.0
+    for results in feature_store.iter_batches( args.v, args.batch_size ):
+        names = results.dtype.names
+        X = np.column_stack( [results[ name ] for name in names[0:-1]] )
+        Y = results[ names[-1] ]
+
+        start = time.perf_counter()
+        P = pipeline.predict( X )
+        duration += time.perf_counter() - start
+
+        confusion.add( Y, P )
+        nb_misses += int( np.count_nonzero( pipeline.misses( X )))
+        differences = np.flatnonzero( P != dt.predict( X ))
+        for i in differences[ 0 : max( 0, args.show - nb_differences ) ].tolist():
+            print("row {0}: {1} => table: {2}, model: {3}".format( nb_rows + i, X[ i ].tolist(), dt.class_name( P[ i ] ), dt.class_name( dt.predict( X[ i : i+1 ] )[0] )))
+        nb_differences += len(differences)
+        nb_rows += len(X)
+
+    print("{0} rows classified by the tables, {1:.0f} rows/s".format( nb_rows, nb_rows / max( duration, 1e-9 )))
+    print("{0} rows match no entry, {1} rows differ from the model".format( nb_misses, nb_differences ))
+    predict_file.print_report( confusion, duration, dt )
+    print("Score", confusion.accuracy())
+    if nb_differences > 0:
+        sys.exit( 1 )
@@ -8,76 +8,586 @@
 #  - IP payload length
 #  - difference of IP payload length
 #
+# With `--features window`, running statistics over the last packets are added (see window_stats.py).
+#
+# With `--flows`, the pcap file may contain packets of several flows which are identified by their 5-tuple
+#  (as `digest_t` in basic.p4). The features are then computed per flow, in a single pass.
+#  With `--rules`, the packets of a mixed capture are labeled by rules instead of `-c` (see labeling.py).
+#
+# With `--jobs N` or a time range (`--from`, `--to`), the pcap file is indexed (see pcap_index.py)
+#  then it is split into byte ranges which are parsed by N processes. The state (last timestamp
+#  and length) is stitched at range boundaries, thus the output is identical to a serial run.
+#
+# With `--live`, packets are captured from a network interface (see live_capture.py) instead of being read
+#  from a pcap file. Rows are written every `-b` rows or every `--flush` seconds, until Ctrl-C.
+#
+# The output is either a csv file or, if its path ends with ".store", a columnar feature store (see feature_store.py).
+#
+# Three extraction modes are available:
+#  - "memory": load the whole pcap file by using rdpcap, then compute the features
+#              (pcapng and compressed files are read as in "stream" mode)
+#  - "stream": read one packet at a time and write the features by batches,
+#              memory usage does not depend on the size of the pcap file
+#  - "batch" : read timestamps and lengths of all packets into arrays,
+#              then compute the features of all packets at once by using numpy
+#
+# In "stream" and "batch" modes, pcap records are parsed natively (see pcap_reader.py) without dissecting packets.
+# pcapng and gzip/zstd compressed files (e.g., *.pcap.gz, *.pcapng.zst) are decompressed in streaming fashion.
+# scapy is used only when the file cannot be read natively, e.g., an unusual link type.
+#
 
 from scapy.all import *
-import argparse, csv, os
+import argparse, csv, os, ipaddress, tempfile, time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+import numpy as np
+import pcap_reader, pcap_index, feature_store, window_stats, labeling, live_capture
 
-def extract_features_from_pcap( inputfile, outputfile, classification ):
-    results = []
-    last_ts = 0
-    last_len = 0
+# version of the extractor, need to be increased when the extracted values change
+#  as it is used to invalidate the features cached by process_pcaps.py
+VERSION = 3
 
-    #read the pcap file and extract the features for each packet
-    all_packets = rdpcap(inputfile)
+FEATURE_NAMES = ["iat", "len", "diffLen"]
+CSV_HEADER    = FEATURE_NAMES + ["class"]
 
-    # for each packet in the pcap file
-    for packet in all_packets:
+# sets of features which can be extracted
+FEATURE_SETS = {
+    "basic" : FEATURE_NAMES,
+    "window": FEATURE_NAMES + window_stats.WINDOW_FEATURES,
+}
+
+# number of rows to be buffered before writing them to the output file in "stream" and "batch" modes
+BATCH_SIZE = 10000
+
+MODES = ["memory", "stream", "batch"]
+
+# in indexed extraction, a byte range of the pcap file contains at most this number of bytes
+RANGE_SIZE = 256*1024*1024
+
+# in per-flow extraction, a flow is evicted from the flow-state table when it has been idle for this duration
+IDLE_TIMEOUT = 60 # seconds
+# and the flow-state table contains at most this number of flows, the least recently seen one is evicted first
+MAX_FLOWS = 1000000
+
+# in second, maximum delay to write the rows of live captured packets
+FLUSH_INTERVAL = 1
+
+# a row of features in "batch" mode
+FEATURE_DTYPE = np.dtype([(name, np.int64) for name in CSV_HEADER])
+
+# get the type of a row of features
+#  window: number of packets of the window statistics, 0 to extract only the basic features
+def get_dtype( window = 0 ):
+    if window <= 0:
+        return FEATURE_DTYPE
+    return np.dtype([(name, np.int64) for name in FEATURE_SETS["window"] + ["class"]])
+
+# get (timestamp in nanosecond, IP length) of the packets dissected by scapy
+def scapy_records( packets ):
+    for packet in packets:
         try:
             ts     = packet.time # e.g., 1712073023.619379
             ip_len = packet.len  # e.g., 76
+        except AttributeError:
+            print("Error while parsing packet", packet)
+            continue
 
-            ts = int( ts * 1000000 * 1000) # in nanosecond
+        yield (int( ts * 1000000 * 1000), ip_len) # in nanosecond
 
-            # for the first time
-            if last_ts == 0:
-                last_ts = ts
-                last_len = ip_len
-                continue
+# get (timestamp in nanosecond, IP length) of the packets read natively from a pcap file
+def native_records( pcap ):
+    for (ts, ip_len) in pcap.records():
+        yield from zip( ts.tolist(), ip_len.tolist() )
 
-            # get IAT - Inter Arrival Time
-            iat = ts - last_ts
-            if iat < 0:
-                print("Ignore unordered packet ", packet )
-                continue
 
-            diff_len = ip_len - last_len
-            diff_len += 0xFFFF #avoid negative value
+# compute the features of the (timestamp, IP length) records which are given by an iterator
+#  then yield one row (iat, len, diffLen, class) per packet
+# Only the timestamp and the length of the previous packet are kept.
+def compute_features( records, classification ):
+    last_ts = 0
+    last_len = 0
 
+    # for each packet in the pcap file
+    for (ts, ip_len) in records:
+        # for the first time
+        if last_ts == 0:
+            last_ts = ts
             last_len = ip_len
+            continue
 
-            last_ts = ts
+        # get IAT - Inter Arrival Time
+        iat = ts - last_ts
+        if iat < 0:
+            print("Ignore unordered packet at", ts )
+            continue
 
-            metric = {"iat" : iat, "len": ip_len, "diffLen": diff_len, "class": classification}
-            results.append( metric )
-        except AttributeError:
+        diff_len = ip_len - last_len
+        diff_len += 0xFFFF #avoid negative value
+
+        last_len = ip_len
+
+        last_ts = ts
+
+        yield (iat, ip_len, diff_len, classification)
+
+
+# pack a 5-tuple into an integer which is used as key of the flow-state table
+def flow_key( src, dst, sport, dport, proto ):
+    return (src << 72) | (dst << 40) | (sport << 24) | (dport << 8) | proto
+
+# get labels of packets given by arrays of their fields
+#  classification is either a class index or a labeling.RuleIndex
+def get_labels( classification, ts, src, dst, sport, dport, proto ):
+    if isinstance( classification, labeling.RuleIndex ):
+        return classification.label( ts, src, dst, sport, dport, proto )
+    return np.full( len(ts), classification, dtype=np.int64 )
+
+# get (timestamp in nanosecond, IP length, flow key, class) of the packets dissected by scapy
+def scapy_flow_records( packets, classification ):
+    for packet in packets:
+        ip = packet.getlayer( IP )
+        if ip is None:
             print("Error while parsing packet", packet)
+            continue
+
+        sport = dport = 0
+        if isinstance( ip.payload, (TCP, UDP) ):
+            sport = ip.payload.sport
+            dport = ip.payload.dport
+
+        src = int(ipaddress.IPv4Address( ip.src ))
+        dst = int(ipaddress.IPv4Address( ip.dst ))
+        ts  = int( packet.time * 1000000 * 1000) # in nanosecond
+        (label,) = get_labels( classification, [ts], [src], [dst], [sport], [dport], [ip.proto] ).tolist()
+        yield (ts, ip.len, flow_key( src, dst, sport, dport, ip.proto ), label)
+
+# get (timestamp in nanosecond, IP length, flow key, class) of the packets read natively from a pcap file
+def native_flow_records( pcap, classification ):
+    for (ts, ip_len, src, dst, sport, dport, proto) in pcap.flow_records():
+        labels = get_labels( classification, ts, src, dst, sport, dport, proto )
+        # the first part of keys, i.e., (src << 32) | dst, needs 64 unsigned bits
+        ips   = (src.astype( np.uint64 ) << np.uint64(32)) | dst.astype( np.uint64 )
+        ports = (sport << 24) | (dport << 8) | proto
+        for (t, l, i, p, c) in zip( ts.tolist(), ip_len.tolist(), ips.tolist(), ports.tolist(), labels.tolist() ):
+            yield (t, l, (i << 40) | p, c)
+
+
+# compute the features of the (timestamp, IP length, flow key, class) records per flow
+#  then yield one row (iat, len, diffLen, class) per packet
+# Only the timestamp and the length of the previous packet of each flow are kept.
+# The first packet of a flow, or of a flow which has been evicted, gives no row.
+# A packet which is not labeled (see labeling.NO_LABEL) gives no row, but updates the state of its flow.
+# If window > 0, the window statistics of each flow are added to its rows.
+def compute_flow_features( records, idle_timeout = IDLE_TIMEOUT, max_flows = MAX_FLOWS, window = 0 ):
+    # flow key => [last_ts, last_len, window statistics], the least recently seen flow is the first one
+    flows = OrderedDict()
+    timeout = int( idle_timeout * 1000000000 )
+    now = 0
+
+    for (ts, ip_len, key, classification) in records:
+        if ts > now:
+            now = ts
+            # evict idle flows
+            while len(flows) > 0:
+                oldest = next( iter( flows ))
+                if now - flows[ oldest ][0] <= timeout:
+                    break
+                del flows[ oldest ]
+
+        state = flows.get( key )
+        # for the first time
+        if state is None:
+            if len(flows) >= max_flows:
+                flows.popitem( last=False )
+            flows[ key ] = [ts, ip_len, window_stats.WindowStats( window ) if window > 0 else None]
+            continue
+
+        # get IAT - Inter Arrival Time
+        iat = ts - state[0]
+        if iat < 0:
+            print("Ignore unordered packet at", ts )
+            continue
+
+        diff_len = ip_len - state[1]
+        diff_len += 0xFFFF #avoid negative value
+
+        state[0] = ts
+        state[1] = ip_len
+        flows.move_to_end( key )
+
+        if window > 0:
+            stats = state[2].update( iat, ip_len )
+            if classification != labeling.NO_LABEL:
+                yield (iat, ip_len, diff_len) + stats + (classification,)
+        elif classification != labeling.NO_LABEL:
+            yield (iat, ip_len, diff_len, classification)
+
+
+# compute the features of all packets at once, given their timestamps and IP lengths as arrays
+#  then return a structured array of FEATURE_DTYPE
+# The result is identical to the one of compute_features.
+def compute_features_batch( ts, ip_len, classification ):
+    ts     = np.asarray( ts,     dtype=np.int64 )
+    ip_len = np.asarray( ip_len, dtype=np.int64 )
+
+    # the first packet having a non-zero timestamp is the reference of the next one
+    non_zero = np.flatnonzero( ts )
+    if len(non_zero) == 0:
+        return np.empty( 0, dtype=FEATURE_DTYPE )
+    ts     = ts[ non_zero[0]: ]
+    ip_len = ip_len[ non_zero[0]: ]
+
+    # an unordered packet is ignored, i.e., it is not used as reference of the next packet,
+    #  thus the reference timestamp is always the max timestamp of the previous packets
+    accepted = np.ones( len(ts), dtype=bool )
+    accepted[1:] = ts[1:] >= np.maximum.accumulate( ts )[:-1]
+    nb_unordered = len(ts) - np.count_nonzero( accepted )
+    if nb_unordered > 0:
+        print("Ignore", nb_unordered, "unordered packets")
+        ts     = ts[ accepted ]
+        ip_len = ip_len[ accepted ]
+
+    results = np.empty( len(ts) - 1, dtype=FEATURE_DTYPE )
+    results["iat"]     = np.diff( ts )
+    results["len"]     = ip_len[1:]
+    results["diffLen"] = np.diff( ip_len ) + 0xFFFF #avoid negative value
+    results["class"]   = classification
+    return results
 
-    if len(results) == 0:
+# read (timestamps, IP lengths) of all packets in a pcap file into arrays
+def read_arrays( inputfile ):
+    pcap = pcap_reader.open_pcap( inputfile )
+    if pcap is None:
+        with PcapReader( inputfile ) as packets:
+            records = np.array( list( scapy_records( packets )), dtype=np.int64 ).reshape(-1, 2)
+        return (records[:, 0], records[:, 1])
+
+    with pcap:
+        chunks = list( pcap.records() )
+    if len(chunks) == 0:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    return (np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks]))
+
+# extract the features of a pcap file into a structured array of FEATURE_DTYPE
+def extract_features_array( inputfile, classification ):
+    (ts, ip_len) = read_arrays( inputfile )
+    return compute_features_batch( ts, ip_len, classification )
+
+
+# append a structured array of features to a csv file or a feature store, batch_size rows at a time
+# The output is identical to the one of write_rows.
+def write_array( results, outputfile, batch_size = BATCH_SIZE ):
+    feature_store.write( outputfile, results, batch_size )
+
+
+# append rows to a csv file or a feature store, batch_size rows at a time
+# The output file is not touched when there is no row.
+#  dtype: type of the rows, it gives also the csv header
+def write_rows( rows, outputfile, batch_size = BATCH_SIZE, dtype = FEATURE_DTYPE ):
+    if feature_store.is_store( outputfile ):
+        batch = []
+        for row in rows:
+            batch.append( row )
+            if len(batch) == batch_size:
+                feature_store.append( outputfile, np.array( batch, dtype=dtype ))
+                batch = []
+        if len(batch) > 0:
+            feature_store.append( outputfile, np.array( batch, dtype=dtype ))
         return
 
+    f = None
+    writer = None
+    batch = []
+    try:
+        for row in rows:
+            batch.append( row )
+            if len(batch) < batch_size:
+                continue
+
+            if writer is None:
+                (f, writer) = _open_writer( outputfile, dtype.names )
+            writer.writerows( batch )
+            batch = []
+
+        if len(batch) > 0:
+            if writer is None:
+                (f, writer) = _open_writer( outputfile, dtype.names )
+            writer.writerows( batch )
+    finally:
+        if f is not None:
+            f.close()
+
+def _open_writer( outputfile, header ):
     # need to write CSV header only if the file is not existing
     need_header = not os.path.exists( outputfile )
 
     # append to output file
-    with open( outputfile, 'a', encoding='UTF8', newline='') as f:
-        writer = csv.DictWriter(f, results[0].keys() )
+    f = open( outputfile, 'a', encoding='UTF8', newline='')
+    writer = csv.writer(f)
+
+    # write the header
+    if need_header :
+        writer.writerow( header )
+    return (f, writer)
 
-        # write the header
-        if need_header :
-            writer.writeheader()
 
-        # write multiple rows
-        writer.writerows( results )
+# add window statistics to rows if window > 0
+def _add_window_stats( rows, window ):
+    if window <= 0:
+        return rows
+    return window_stats.add_window_stats( rows, window_stats.WindowStats( window ))
+
+# window: number of packets of the window statistics, 0 to extract only the basic features
+def extract_features_from_pcap( inputfile, outputfile, classification, mode = "memory", batch_size = BATCH_SIZE, window = 0 ):
+    dtype = get_dtype( window )
+    # rdpcap cannot read compressed pcapng files, and would decompress the whole file into memory
+    if mode == "memory" and pcap_reader.is_stream( inputfile ):
+        mode = "stream"
+    if mode == "stream":
+        pcap = pcap_reader.open_pcap( inputfile )
+        if pcap is not None:
+            with pcap:
+                rows = compute_features( native_records( pcap ), classification )
+                write_rows( _add_window_stats( rows, window ), outputfile, batch_size, dtype )
+            return
+
+        # fallback: PcapReader parses the packets one by one while iterating
+        with PcapReader( inputfile ) as packets:
+            rows = compute_features( scapy_records( packets ), classification )
+            write_rows( _add_window_stats( rows, window ), outputfile, batch_size, dtype )
+        return
+
+    if mode == "batch":
+        results = extract_features_array( inputfile, classification )
+        if window > 0:
+            # the statistics are computed at once for the whole array (see window_stats.py)
+            results = window_stats.add_window_stats_array( results, window_stats.WindowStats( window ), dtype )
+        write_array( results, outputfile, batch_size )
+        return
+
+    if mode != "memory":
+        raise Exception("unknown extraction mode", mode)
+
+    #read the pcap file and extract the features for each packet
+    all_packets = rdpcap(inputfile)
+
+    results = list( _add_window_stats( compute_features( scapy_records( all_packets ), classification ), window ))
+
+    # write all rows at once
+    write_rows( results, outputfile, max(len(results), 1), dtype )
+
+
+# parse a byte range [start, end) of a pcap file, keep only the packets having timestamp in [t1, t2]
+#  then save into npy files the timestamps and lengths of the packets which are not unordered
+#  wrt the previous packets in this range
+def _extract_range( task ):
+    (inputfile, start, end, t1, t2, prefix) = task
+    with pcap_reader.PcapFile( inputfile ) as pcap:
+        chunks = list( pcap.records( start, end ))
+
+    ts     = np.concatenate( [c[0] for c in chunks] ) if len(chunks) > 0 else np.empty( 0, dtype=np.int64 )
+    ip_len = np.concatenate( [c[1] for c in chunks] ) if len(chunks) > 0 else np.empty( 0, dtype=np.int64 )
+    if t1 is not None or t2 is not None:
+        keep = np.ones( len(ts), dtype=bool )
+        if t1 is not None:
+            keep &= (ts >= t1)
+        if t2 is not None:
+            keep &= (ts <= t2)
+        ts     = ts[ keep ]
+        ip_len = ip_len[ keep ]
+
+    # a packet is accepted if its timestamp is not smaller than the ones of the previous packets
+    accepted = np.ones( len(ts), dtype=bool )
+    accepted[1:] = ts[1:] >= np.maximum.accumulate( ts )[:-1]
+
+    np.save( prefix + ".ts.npy",  ts[ accepted ] )
+    np.save( prefix + ".len.npy", ip_len[ accepted ] )
+    return prefix
+
+# write the features of the accepted packets of the ranges, in order
+#  The accepted timestamps of a range are sorted. Given the max timestamp (last_ts) and the length (last_len)
+#  of the last accepted packet in the previous ranges, the first packet of a range which is accepted
+#  overall is the first one having timestamp >= last_ts. The following packets are accepted
+#  overall if and only if they are accepted in their range.
+#  If stats is given, the window statistics are added to the rows.
+def _stitch_ranges( prefixes, outputfile, classification, batch_size, stats = None ):
+    dtype    = get_dtype( stats.n if stats is not None else 0 )
+    last_ts  = 0
+    last_len = 0
+    for prefix in prefixes:
+        ts     = np.load( prefix + ".ts.npy",  mmap_mode="r" )
+        ip_len = np.load( prefix + ".len.npy", mmap_mode="r" )
+
+        if last_ts == 0:
+            # the first packet having a non-zero timestamp is the reference of the next one
+            q = np.searchsorted( ts, 1 )
+            if q == len(ts):
+                continue
+        else:
+            q = np.searchsorted( ts, last_ts )
+            if q == len(ts):
+                continue
+            # the packet q follows the last accepted packet of the previous ranges
+            row = np.empty( 1, dtype=FEATURE_DTYPE )
+            row["iat"]     = ts[q] - last_ts
+            row["len"]     = ip_len[q]
+            row["diffLen"] = ip_len[q] - last_len + 0xFFFF
+            row["class"]   = classification
+            if stats is not None:
+                row = window_stats.add_window_stats_array( row, stats, dtype )
+            write_array( row, outputfile, batch_size )
+
+        for i in range(q, len(ts) - 1, batch_size):
+            t = np.asarray( ts[ i: i+batch_size+1 ], dtype=np.int64 )
+            l = np.asarray( ip_len[ i: i+batch_size+1 ], dtype=np.int64 )
+            results = np.empty( len(t) - 1, dtype=FEATURE_DTYPE )
+            results["iat"]     = np.diff( t )
+            results["len"]     = l[1:]
+            results["diffLen"] = np.diff( l ) + 0xFFFF #avoid negative value
+            results["class"]   = classification
+            if stats is not None:
+                results = window_stats.add_window_stats_array( results, stats, dtype )
+            write_array( results, outputfile, batch_size )
+
+        last_ts  = int( ts[-1] )
+        last_len = int( ip_len[-1] )
+        # release the memory maps before removing their files
+        del ts, ip_len
+
+# extract the features of the packets having timestamp in [t1, t2] (in nanosecond, None for no limit)
+#  the pcap file is split into byte ranges, by using its index, which are parsed by `jobs` processes
+def extract_features_indexed( inputfile, outputfile, classification, jobs = 1, t1 = None, t2 = None, batch_size = BATCH_SIZE, window = 0 ):
+    pcap = pcap_reader.open_pcap( inputfile )
+    # compressed or pcapng files cannot be memory-mapped
+    if not isinstance( pcap, pcap_reader.PcapFile ):
+        if pcap is not None:
+            pcap.close()
+        raise Exception("cannot index the pcap file", inputfile)
+
+    with pcap:
+        index = pcap_index.get_index( pcap, inputfile )
+
+    (start, end) = pcap_index.time_range( index, t1, t2 )
+    index = {"offset": index["offset"][ (index["offset"] >= start) & (index["offset"] < end) ],
+                "ts": None, "step": index["step"], "size": end}
+    nb_ranges = max( jobs, -(-(end - start) // RANGE_SIZE) )
+    ranges = pcap_index.split( index, nb_ranges )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tasks = [(inputfile, s, e, t1, t2, os.path.join( tmp_dir, str(i) )) for i, (s, e) in enumerate(ranges)]
+        if jobs <= 1:
+            prefixes = list( map( _extract_range, tasks ))
+        else:
+            with ProcessPoolExecutor( max_workers=jobs ) as executor:
+                prefixes = list( executor.map( _extract_range, tasks ))
+
+        stats = window_stats.WindowStats( window ) if window > 0 else None
+        _stitch_ranges( prefixes, outputfile, classification, batch_size, stats )
+
+
+# extract the features per flow, the pcap file is read in streaming fashion
+#  classification is either a class index or a labeling.RuleIndex to label each packet by rules
+def extract_flow_features_from_pcap( inputfile, outputfile, classification,
+        idle_timeout = IDLE_TIMEOUT, max_flows = MAX_FLOWS, batch_size = BATCH_SIZE, window = 0 ):
+    dtype = get_dtype( window )
+    pcap = pcap_reader.open_pcap( inputfile )
+    if pcap is not None:
+        with pcap:
+            rows = compute_flow_features( native_flow_records( pcap, classification ), idle_timeout, max_flows, window )
+            write_rows( rows, outputfile, batch_size, dtype )
+        return
+
+    with PcapReader( inputfile ) as packets:
+        rows = compute_flow_features( scapy_flow_records( packets, classification ), idle_timeout, max_flows, window )
+        write_rows( rows, outputfile, batch_size, dtype )
+
+
+# extract the features of the packets captured from a network interface, per flow if `flows` is True
+#  rows are written every batch_size rows or every flush_interval seconds
+#  count, duration: stop after this number of packets or seconds, None to capture until interrupted
+def extract_features_live( interface, outputfile, classification, batch_size = BATCH_SIZE, flush_interval = FLUSH_INTERVAL,
+        flows = False, idle_timeout = IDLE_TIMEOUT, window = 0, count = None, duration = None, promisc = False ):
+    dtype = get_dtype( window )
+    batch = []
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal batch, last_flush
+        if len(batch) > 0:
+            feature_store.write( outputfile, np.array( batch, dtype=dtype ))
+            batch = []
+        last_flush = time.monotonic()
+
+    # called before waiting for packets, thus even if no packet arrives
+    def on_chunk():
+        if time.monotonic() - last_flush >= flush_interval:
+            flush()
+
+    with live_capture.LiveCapture( interface, promisc, count, duration, on_chunk=on_chunk ) as capture:
+        if flows:
+            rows = compute_flow_features( native_flow_records( capture, classification ), idle_timeout, MAX_FLOWS, window )
+        else:
+            rows = _add_window_stats( compute_features( native_records( capture ), classification ), window )
+        try:
+            for row in rows:
+                batch.append( row )
+                if len(batch) >= batch_size:
+                    flush()
+        finally:
+            flush()
+            (received, drops) = capture.stats()
+            if drops > 0:
+                print("The kernel dropped", drops, "packets")
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
     # Add argument
-    parser.add_argument('-i', required=True, help='path to pcap file')
-    parser.add_argument('-o', required=True, help='path to .csv output file')
-    parser.add_argument('-c', required=True, help='classification')
+    parser.add_argument('-i', required=True, help='path to pcap file (.pcap, .pcapng, optionally .gz or .zst compressed), or name of a network interface with --live')
+    parser.add_argument('-o', required=True, help='path to .csv output file or .store directory')
+    parser.add_argument('-c', help='classification')
+    parser.add_argument('-r', '--rules', help='path to a json file of rules to label the packets of a mixed capture, implies --flows')
+    parser.add_argument('-m', default="memory", choices=MODES, help='extraction mode')
+    parser.add_argument('-b', default=BATCH_SIZE, type=int, help='number of rows per write in "stream" and "batch" modes')
+    parser.add_argument('-f', '--flows', action='store_true', help='compute features per flow (5-tuple), the pcap file is read in streaming fashion')
+    parser.add_argument('-t', default=IDLE_TIMEOUT, type=float, help='idle timeout (in second) of a flow when using --flows')
+    parser.add_argument('--features', default="basic", choices=FEATURE_SETS.keys(), help='set of features to extract')
+    parser.add_argument('-w', '--window', default=window_stats.WINDOW_SIZE, type=int, help='number of packets of the window statistics when using "--features window"')
+    parser.add_argument('-j', '--jobs', default=1, type=int, help='number of processes to parse the pcap file by using its index')
+    parser.add_argument('-l', '--live', action='store_true', help='capture packets from the network interface given by -i, until Ctrl-C')
+    parser.add_argument('--flush', default=FLUSH_INTERVAL, type=float, help='write rows at least every this number of seconds with --live')
+    parser.add_argument('-d', '--duration', type=float, help='stop capturing after this number of seconds with --live')
+    parser.add_argument('--from', dest='t1', help='extract only packets from this timestamp (in second) by using the index')
+    parser.add_argument('--to',   dest='t2', help='extract only packets until this timestamp (in second) by using the index')
     args = parser.parse_args()
 
-    extract_features_from_pcap( args.i,  args.o, int(args.c) )
+    if args.rules is not None:
+        args.flows = True
+        classification = labeling.load_rules( args.rules )
+    elif args.c is not None:
+        classification = int(args.c)
+    else:
+        parser.error("either -c or --rules is required")
+
+    if (args.flows or args.live) and (args.jobs > 1 or args.t1 is not None or args.t2 is not None):
+        parser.error("--flows and --live cannot be used with --jobs, --from or --to")
 
+    # convert to nanosecond without losing precision
+    t1 = int( Decimal( args.t1 ) * 1000000000 ) if args.t1 is not None else None
+    t2 = int( Decimal( args.t2 ) * 1000000000 ) if args.t2 is not None else None
+
+    window = args.window if args.features == "window" else 0
+
+    if args.live:
+        try:
+            extract_features_live( args.i, args.o, classification, args.b, args.flush, args.flows, args.t, window, duration=args.duration )
+        except KeyboardInterrupt:
+            pass
+    elif args.jobs > 1 or t1 is not None or t2 is not None:
+        extract_features_indexed( args.i,  args.o, classification, args.jobs, t1, t2, args.b, window )
+    elif args.flows:
+        extract_flow_features_from_pcap( args.i,  args.o, classification, args.t, MAX_FLOWS, args.b, window )
+    else:
+        extract_features_from_pcap( args.i,  args.o, classification, args.m, args.b, window )
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+# Read and write features either in a csv file or in a columnar store.
+#
+# A columnar store is a directory, e.g., pcaps/features.store, containing:
+#  - meta.json: name of the columns, their data type and the number of rows
+#  - one raw binary file per column, e.g., iat.bin, len.bin, ...
+#
+# The columns are memory-mapped when reading, thus no parsing is needed.
+# Rows are appended by appending to each column file then updating meta.json.
+#
+# This script can also convert a csv file to a store and vice versa, e.g.,
+#  ./feature_store.py -i pcaps/features.store -o pcaps/features.csv
+#
+
+import argparse, csv, json, os, shutil
+import numpy as np
+
+STORE_EXT = ".store"
+META_FILE = "meta.json"
+VERSION   = 1
+DTYPE     = np.dtype("<i8")
+
+# number of rows to be written at once into a csv file
+BATCH_SIZE = 10000
+
+
+# is the path a columnar store (otherwise a csv file)?
+def is_store( path ):
+    return path.endswith( STORE_EXT ) or os.path.isdir( path )
+
+def remove( path ):
+    if os.path.isdir( path ):
+        shutil.rmtree( path )
+    elif os.path.exists( path ):
+        os.remove( path )
+
+
+def _read_meta( path ):
+    with open( os.path.join( path, META_FILE )) as f:
+        meta = json.load( f )
+    if meta["version"] != VERSION:
+        raise Exception("unsupported version of feature store", meta["version"])
+    return meta
+
+def _write_meta( path, meta ):
+    # replace meta.json atomically, readers never see a partial file
+    tmp_file = os.path.join( path, META_FILE + ".tmp" )
+    with open( tmp_file, "w" ) as f:
+        json.dump( meta, f, indent=3 )
+    os.replace( tmp_file, os.path.join( path, META_FILE ))
+
+def _column_file( path, name ):
+    return os.path.join( path, name + ".bin" )
+
+
+# append a structured array to a columnar store, create the store if it is not existing
+def append( path, results ):
+    columns = list( results.dtype.names )
+    if os.path.exists( os.path.join( path, META_FILE )):
+        meta = _read_meta( path )
+        if meta["columns"] != columns:
+            raise Exception("columns do not match", meta["columns"], columns)
+    else:
+        os.makedirs( path, exist_ok=True )
+        meta = {"version": VERSION, "columns": columns, "dtype": DTYPE.str, "rows": 0}
+
+    if len(results) == 0:
+        return
+
+    size = meta["rows"] * DTYPE.itemsize
+    for name in columns:
+        with open( _column_file( path, name ), "ab" ) as f:
+            # drop the rows which were written by an interrupted append
+            f.truncate( size )
+            f.write( np.ascontiguousarray( results[name], dtype=DTYPE ).tobytes() )
+
+    meta["rows"] += len(results)
+    _write_meta( path, meta )
+
+
+# append a structured array to a csv file, batch_size rows at a time
+#  the header is written only if the file is not existing
+def append_csv( path, results, batch_size = BATCH_SIZE ):
+    if len(results) == 0:
+        return
+
+    columns = list( results.dtype.names )
+    # need to write CSV header only if the file is not existing
+    need_header = not os.path.exists( path )
+    with open( path, 'a', encoding='UTF8', newline='') as f:
+        if need_header:
+            csv.writer( f ).writerow( columns )
+
+        rows = np.column_stack([ results[name] for name in columns ])
+        for i in range(0, len(rows), batch_size):
+            # csv.writer terminates lines by "\r\n"
+            np.savetxt( f, rows[i: i+batch_size], fmt="%d", delimiter=",", newline="\r\n" )
+
+# append a structured array either to a store or to a csv file
+def write( path, results, batch_size = BATCH_SIZE ):
+    if is_store( path ):
+        append( path, results )
+    else:
+        append_csv( path, results, batch_size )
+
+
+# get the columns of a store as memory-mapped arrays, indexed by their names
+def load_columns( path ):
+    meta = _read_meta( path )
+    dtype = np.dtype( meta["dtype"] )
+    rows  = meta["rows"]
+    columns = {}
+    for name in meta["columns"]:
+        if rows == 0:
+            columns[ name ] = np.empty( 0, dtype=dtype )
+        else:
+            columns[ name ] = np.memmap( _column_file( path, name ), dtype=dtype, mode="r", shape=(rows,) )
+    return columns
+
+# load a store or a csv file into a structured array
+def load( path ):
+    if is_store( path ):
+        columns = load_columns( path )
+        names   = list( columns.keys() )
+        rows    = len( columns[ names[0] ] )
+    else:
+        import pandas as pd
+        df      = pd.read_csv( path )
+        names   = list( df.columns )
+        columns = {name: df[name].values for name in names}
+        rows    = len( df )
+
+    results = np.empty( rows, dtype=[(name, DTYPE) for name in names] )
+    for name in names:
+        results[ name ] = columns[ name ]
+    return results
+
+# read a store or a csv file by batches of structured arrays, memory usage does not depend on the number of rows
+def iter_batches( path, batch_size = BATCH_SIZE ):
+    if is_store( path ):
+        columns = load_columns( path )
+        names   = list( columns.keys() )
+        rows    = len( columns[ names[0] ] )
+        for start in range( 0, rows, batch_size ):
+            results = np.empty( min(batch_size, rows - start), dtype=[(name, DTYPE) for name in names] )
+            for name in names:
+                results[ name ] = columns[ name ][ start : start + batch_size ]
+            yield results
+        return
+
+    import pandas as pd
+    for df in pd.read_csv( path, chunksize=batch_size ):
+        results = np.empty( len(df), dtype=[(name, DTYPE) for name in df.columns] )
+        for name in df.columns:
+            results[ name ] = df[ name ].values
+        yield results
+
+# get names of the features, i.e., all columns except the last one, of a store or a csv file
+def load_feature_names( path ):
+    if is_store( path ):
+        names = _read_meta( path )["columns"]
+    else:
+        with open( path, newline='' ) as f:
+            names = next( csv.reader( f ))
+    return names[0:-1]
+
+# get features (X) and classification (Y) from a store or a csv file
+#  - the first n columns contain features (X)
+#  - the last column contain classification (Y)
+def load_xy( path ):
+    if is_store( path ):
+        columns = list( load_columns( path ).values() )
+        X = np.column_stack( columns[0:-1] )
+        Y = np.asarray( columns[-1] )
+        return (X, Y)
+
+    import pandas as pd
+    data = pd.read_csv( path ).values
+    return (data[:, 0:-1], data[:, -1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', required=True, help='path to the input csv file or store')
+    parser.add_argument('-o', required=True, help='path to the output csv file or store (' + STORE_EXT + ')')
+    args = parser.parse_args()
+
+    # overwrite the output
+    remove( args.o )
+    write( args.o, load( args.i ))
+    print("write output to", args.o)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Generate synthetic pcap files, one per class, to benchmark the offline tools.
+#
+# Each file is named `classname.synth.pcap` (see pcaps/README.md) and contains
+#  n packets of f interleaved flows. For each class:
+#  - IAT follows an exponential distribution
+#  - IP total length follows a normal distribution, clipped to [40, 1500]
+# The parameters of each class can be given in a json file, e.g.,
+#  {"class1": {"iat": 1000, "len": 120, "len_std": 40}, ...}
+#  where `iat` is the mean IAT in microsecond.
+#
+# Only the Ethernet, IPv4 and UDP headers of packets are captured (as with a small snaplen),
+#  the IP total length contains the original length.
+#
+
+import argparse, json, os, struct
+import numpy as np
+
+# number of packets to be generated at once
+CHUNK_SIZE = 1000000
+
+START_TIME = 1700000000 # in second
+
+# Ethernet + IPv4 + UDP headers
+CAPLEN = 14 + 20 + 8
+
+# pcap record header + captured bytes
+RECORD_DTYPE = np.dtype([
+    ("sec",      "<u4"),
+    ("usec",     "<u4"),
+    ("caplen",   "<u4"),
+    ("wirelen",  "<u4"),
+    ("eth_dst",  "u1", 6),
+    ("eth_src",  "u1", 6),
+    ("eth_type", ">u2"),
+    ("ip_vhl",   "u1"),
+    ("ip_tos",   "u1"),
+    ("ip_len",   ">u2"),
+    ("ip_id",    ">u2"),
+    ("ip_frag",  ">u2"),
+    ("ip_ttl",   "u1"),
+    ("ip_proto", "u1"),
+    ("ip_sum",   ">u2"),
+    ("ip_src",   ">u4"),
+    ("ip_dst",   ">u4"),
+    ("sport",    ">u2"),
+    ("dport",    ">u2"),
+    ("udp_len",  ">u2"),
+    ("udp_sum",  ">u2"),
+])
+
+# default parameters of the i-th class
+def default_profile( i ):
+    return {
+        "iat"    : 10 ** (2 + i % 4),       # in microsecond
+        "len"    : 60 + (i * 277) % 1400,
+        "len_std": 20 + (i * 13) % 200,
+    }
+
+# write n packets of a class into a pcap file
+def generate_pcap( outputfile, nb_packets, nb_flows, profile, rng ):
+    with open( outputfile, "wb" ) as f:
+        # global header: magic, version 2.4, zone, sigfigs, snaplen, Ethernet
+        f.write( struct.pack( "<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, CAPLEN, 1 ))
+
+        # 5-tuple of each flow
+        flow_src   = 0x0A000000 + rng.integers( 1, 1 << 16, nb_flows )  # 10.0.x.x
+        flow_dst   = 0xC0A80000 + rng.integers( 1, 1 << 16, nb_flows )  # 192.168.x.x
+        flow_sport = rng.integers( 1024, 65536, nb_flows )
+        flow_dport = rng.integers( 1, 1024, nb_flows )
+
+        now = START_TIME * 1000000 # in microsecond
+        for i in range(0, nb_packets, CHUNK_SIZE):
+            n = min( CHUNK_SIZE, nb_packets - i )
+            ts = now + np.cumsum( rng.exponential( profile["iat"], n ).astype( np.int64 ))
+            now = int( ts[-1] )
+            ip_len = np.clip( rng.normal( profile["len"], profile["len_std"], n ), 40, 1500 ).astype( np.int64 )
+            flow = rng.integers( 0, nb_flows, n )
+
+            records = np.zeros( n, dtype=RECORD_DTYPE )
+            records["sec"]      = ts // 1000000
+            records["usec"]     = ts % 1000000
+            records["caplen"]   = CAPLEN
+            records["wirelen"]  = 14 + ip_len
+            records["eth_type"] = 0x0800
+            records["ip_vhl"]   = 0x45
+            records["ip_len"]   = ip_len
+            records["ip_ttl"]   = 64
+            records["ip_proto"] = 17
+            records["ip_src"]   = flow_src[ flow ]
+            records["ip_dst"]   = flow_dst[ flow ]
+            records["sport"]    = flow_sport[ flow ]
+            records["dport"]    = flow_dport[ flow ]
+            records["udp_len"]  = ip_len - 20
+            f.write( records.tobytes() )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-o', required=True, help='path to the output folder')
+    parser.add_argument('-n', default=1000, type=int, help='number of packets per class')
+    parser.add_argument('-f', default=1, type=int, help='number of flows per class')
+    parser.add_argument('-c', default=3, type=int, help='number of classes')
+    parser.add_argument('-p', help='path to a json file containing parameters of each class')
+    parser.add_argument('-s', default=0, type=int, help='seed of the random generator')
+    args = parser.parse_args()
+
+    if args.p:
+        with open( args.p ) as f:
+            profiles = json.load( f )
+    else:
+        profiles = {"class{0}".format(i + 1): default_profile( i ) for i in range( args.c )}
+
+    os.makedirs( args.o, exist_ok=True )
+    rng = np.random.default_rng( args.s )
+    for class_name in profiles:
+        outputfile = os.path.join( args.o, "{0}.synth.pcap".format( class_name ))
+        print("write {0} packets to {1}".format( args.n, outputfile ))
+        generate_pcap( outputfile, args.n, args.f, profiles[ class_name ], rng )
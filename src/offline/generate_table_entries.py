@@ -3,35 +3,43 @@
 # Expand a DecisionTreeClassifier to a text file which contains entries to configure `MyIngress.ml_code` table.
 #  The structure of an entry is described here: https://github.com/p4lang/behavioral-model/blob/main/docs/runtime_CLI.md#table_add
 #
+# An ensemble of trees (see ensemble.py) is expanded to one table per tree, i.e., `MyIngress.ml_code`
+#  then `MyIngress.ml_code_<i>`, and to `MyIngress.ml_vote` table which gives the class of each combination of votes.
+#  The P4 program must be compiled with the same number of trees, e.g., make run NB_TREES=3
+#
+# With `--budget`, the trees are pruned to have at most this number of range entries in all their tables.
+#
+# The entries cover the whole match field of each feature (see tree_model.DOMAIN), as the tree classifies any value.
+#
+# The branches which no feature vector of the domain can reach, e.g., after snapping the thresholds
+#  (see snap_thresholds.py), are removed before, as their entries would never match and their ranges are not valid keys.
+#
+# The written entries are then checked to classify the whole domain of the features exactly as the trees
+#  (see verify_table.py).
+#
 # See an example in pcaps/s1-commands.txt
 
 import numpy as np
-import pandas as pd
-import argparse
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.metrics import accuracy_score
-from sklearn.tree import export_graphviz
-import pydotplus
-
-
-
-parser = argparse.ArgumentParser()
-
-# Add argument
-parser.add_argument('-i', default="./pcaps/dt.model", help='path to the input model')
-parser.add_argument('-o', default="./pcaps/s1-commands.txt", help='path to the output file')
-
-args = parser.parse_args()
-inputfile  = args.i
-outputfile = args.o
+import argparse, sys
+import ensemble, evaluate_table, tree_model, verify_table
+from tree_model import DOMAIN, int_bound
 
 
 FEATURE_NAMES = ["iat", "len", "diffLen"]
 
 
+# table being written and the action setting the vote of its tree
+TABLE  = "MyIngress.ml_code"
+ACTION = "set_result"
+
 priority=0
+nb_skipped=0
 def write_entry(f, domain, classification):
-    global priority
+    global priority, nb_skipped
+    # a range out of the domain, i.e., lo > hi, is not a valid key and never matches
+    if any( val["min"] >= val["max"] for val in domain.values() ):
+        nb_skipped += 1
+        return
     priority += 1
     clause = []
     # for each feature in order
@@ -48,6 +56,9 @@ def write_entry(f, domain, classification):
         #  need to translate to [lo, hi]
         lo = int(lo) + 1
         hi = int(hi) # convert to integer
+        # the last range covers the whole match field, e.g., the values of a 64-bit iat above the int64 maximum
+        if hi == DOMAIN[ fe ]["max"]:
+            hi = (1 << DOMAIN[ fe ]["bits"]) - 1
        
         # https://github.com/p4lang/behavioral-model/blob/c74c53661778cc564b7f8e1c1197241319516809/tools/runtime_CLI.py#L638
         # runtime_CLI separate lo, hi by "->"     
@@ -56,27 +67,13 @@ def write_entry(f, domain, classification):
     # add this entry table (which represents a path from the root to a leaf of the DecisionTree
     # https://github.com/p4lang/behavioral-model?tab=readme-ov-file#using-the-cli-to-populate-tables
     #syntax: table_add <table name> <action name> <match fields> => <action parameters> [priority]
-    f.write("table_add MyIngress.ml_code set_result {} => {} {}\n".format( " ".join(clause), classification, priority ))
+    f.write("table_add {} {} {} => {} {}\n".format( TABLE, ACTION, " ".join(clause), classification, priority ))
 
 # minimize the boolean expression which is collected along a path
 def minimize( path ):
-    # range of possible values of each feature 
-    DOMAIN = {
-        "iat" : {
-            "min": 0, 
-            "max": 100*1000*1000000 #100 seconds should be enough
-        },
-        "len" : {
-            "min": 0, 
-            "max": 0xFFFF #max size of an IP packet
-        },
-        "diffLen" : {
-            "min": 0, 
-            "max": 2*0xFFFF #2 times of packet size
-        }
-    }
-
-    domain = DOMAIN
+    # a new copy of the bounds for each path as they are modified below
+    #  as the condition of an entry is (min, max], i.e., min < v <= max, the minimal value is excluded
+    domain = {feature: {"min": val["min"] - 1, "max": val["max"]} for (feature, val) in DOMAIN.items()}
     for (feature, sign, threshold) in path:
         if feature not in DOMAIN:
             raise Exception("need to set in DOMAIN min and max of", feature)
@@ -96,10 +93,8 @@ def minimize( path ):
 
 # Visite the tree using Depth-first search
 def visite(dt, node_id, features, file, path = [] ):
-    classes = dt.classes_
-    tree  = dt.tree_
-    left  = tree.children_left
-    right = tree.children_right
+    left  = dt.children_left
+    right = dt.children_right
 
     # do we reach a leaf node?
     is_leaf = (left[ node_id ] == right[ node_id ])
@@ -108,17 +103,16 @@ def visite(dt, node_id, features, file, path = [] ):
         # print path from root to this leaf node
         new_path = []
         for (n_id, sign) in path:
-            threshold = tree.threshold[n_id]
+            # sklearn compares features as float32, get the integer bound which gives the same result
+            #  e.g., 85.5 => 85
+            threshold = int_bound( dt.threshold[n_id] )
             feature   = features[n_id]
             new_path.append( (feature, sign, threshold) )
 
         clause = minimize( new_path )
 
-        # see https://scikit-learn.org/stable/auto_examples/tree/plot_unveil_tree_structure.html#what-is-the-values-array-used-here
-        a = list(tree.value[node_id][0])
-        # get the class that has the max number of samples
-        class_index = a.index(max(a))
-        classification = classes[ class_index ]
+        # class that has the max number of samples at this leaf
+        classification = dt.classes[ dt.leaf_class[ node_id ]]
 
         # wirte the node information into text file
         write_entry(f, clause, classification)
@@ -136,14 +130,60 @@ def visite(dt, node_id, features, file, path = [] ):
 
 
 
-# structure of model: DecisionTreeClassifier
-# https://scikit-learn.org/stable/auto_examples/tree/plot_unveil_tree_structure.html#sphx-glr-auto-examples-tree-plot-unveil-tree-structure-py
-dt = pd.read_pickle( inputfile )
-
-# output the tree in a text file, write it
-features  = [FEATURE_NAMES[i] for i in dt.tree_.feature]
-
-print("write output to", outputfile)
-with open(outputfile,"w") as f:
-    # visite the tree from the root which has index = 0
-    visite(dt, 0, features, f)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', default=tree_model.MODEL_FILE, help='path to the input model')
+    parser.add_argument('-o', default="./pcaps/s1-commands.txt", help='path to the output file')
+    parser.add_argument('--budget', type=int, help='maximum number of range entries of all trees, the trees are pruned to fit')
+    parser.add_argument('--no-verify', action='store_true', help='do not check the entries against the model (see verify_table.py)')
+
+    args = parser.parse_args()
+    inputfile  = args.i
+    outputfile = args.o
+
+    # structure of model: see tree_model.py
+    model = tree_model.load( inputfile )
+    # models trained on other feature sets keep names of their features
+    FEATURE_NAMES = model.feature_names
+
+    nb_leaves = model.get_n_leaves()
+    (model, nb_removed) = tree_model.table_model( model, args.budget )
+    if nb_removed > 0:
+        print("remove {0} leaves which no vector of the domain reaches".format( nb_removed ))
+    if model.get_n_leaves() < nb_leaves - nb_removed:
+        print("prune the trees to {0} entries".format( model.get_n_leaves() ))
+    trees = model.trees if isinstance( model, tree_model.Ensemble ) else [model]
+
+    print("write output to", outputfile)
+    with open(outputfile,"w") as f:
+        for (i, dt) in enumerate( trees ):
+            # the first tree sets directly the result if it is alone, otherwise its vote is matched by ml_vote table
+            if i > 0:
+                TABLE  = "MyIngress.ml_code_{0}".format( i )
+                ACTION = "set_vote_{0}".format( i )
+                priority = 0
+
+            # output the tree in a text file, write it
+            features  = [FEATURE_NAMES[i] for i in dt.feature]
+
+            # visite the tree from the root which has index = 0
+            #  with a new path as the default one is modified by the visit
+            visite(dt, 0, features, f, [])
+
+        if nb_skipped > 0:
+            print("skip {0} leaves out of the domain".format( nb_skipped ))
+
+        if len(trees) > 1:
+            # the final class of each combination of the votes
+            for (votes, result) in ensemble.vote_entries( model ):
+                f.write("table_add MyIngress.ml_vote set_result {} => {}\n".format(
+                    " ".join( str( model.classes[ v ] ) for v in votes ), model.classes[ result ] ))
+
+    print("pipeline cost:", ensemble.format_cost( ensemble.pipeline_cost( model )))
+    print("compile the P4 program with NB_TREES={0}, e.g., make run NB_TREES={0}".format( len(trees) ))
+
+    # check that the written entries classify the domain as the (pruned) trees
+    if not args.no_verify and not verify_table.verify( model, evaluate_table.parse_commands( outputfile )):
+        sys.exit("the entries are not equivalent to the model")
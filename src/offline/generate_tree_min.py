@@ -11,19 +11,15 @@
 # See an example in pcaps/tree_min.txt
 
 import numpy as np
-import pandas as pd
 import argparse
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.metrics import accuracy_score
-from sklearn.tree import export_graphviz
-import pydotplus
+import tree_model
 
 
 
 parser = argparse.ArgumentParser()
 
 # Add argument
-parser.add_argument('-i', default="./pcaps/dt.model", help='path to the input model')
+parser.add_argument('-i', default=tree_model.MODEL_FILE, help='path to the input model')
 parser.add_argument('-o', default="./pcaps/tree_min.txt", help='path to the output file')
 
 args = parser.parse_args()
@@ -45,6 +41,31 @@ def minimize( path ):
         "diffLen" : {
             "min": 0, 
             "max": 2*0xFFFF #2 times of packet size
+        },
+        # window statistics, see window_stats.py
+        "count" : {
+            "min": 0, 
+            "max": 0xFFFFFFFF
+        },
+        "ewmaIat" : {
+            "min": 0, 
+            "max": 100*1000*1000000
+        },
+        "ewmaLen" : {
+            "min": 0, 
+            "max": 0xFFFF
+        },
+        "minLen" : {
+            "min": 0, 
+            "max": 0xFFFF
+        },
+        "maxLen" : {
+            "min": 0, 
+            "max": 0xFFFF
+        },
+        "varLen" : {
+            "min": 0, 
+            "max": 0xFFFF*0xFFFF
         }
     }
 
@@ -90,10 +111,8 @@ def minimize( path ):
 
 # Visite the tree using Depth-first search
 def visite(dt, node_id, features, file, path = [] ):
-    classes = dt.classes_
-    tree  = dt.tree_
-    left  = tree.children_left
-    right = tree.children_right
+    left  = dt.children_left
+    right = dt.children_right
 
     # do we reach a leaf node?
     is_leaf = (left[ node_id ] == right[ node_id ])
@@ -102,16 +121,14 @@ def visite(dt, node_id, features, file, path = [] ):
         # print path from root to this leaf node
         new_path = []
         for (n_id, sign) in path:
-            threshold = tree.threshold[n_id]
+            threshold = dt.threshold[n_id]
             feature   = features[n_id]
             new_path.append( (feature, sign, threshold) )
 
         clause = minimize( new_path )
 
-        # see https://scikit-learn.org/stable/auto_examples/tree/plot_unveil_tree_structure.html#what-is-the-values-array-used-here
-        a = list(tree.value[node_id][0])
-        class_index = a.index(max(a))
-        classification = classes[ class_index ]
+        # class that has the max number of samples at this leaf
+        classification = dt.classes[ dt.leaf_class[ node_id ]]
 
         # wirte the node information into text file
         file.write("\t IF {0} THEN {1};\n".format( " and ".join(clause), str(classification) ))
@@ -131,13 +148,14 @@ def visite(dt, node_id, features, file, path = [] ):
 
 FEATURE_NAMES = ["iat", "len", "diffLen"]
 
-# structure of model: DecisionTreeClassifier
-# https://scikit-learn.org/stable/auto_examples/tree/plot_unveil_tree_structure.html#sphx-glr-auto-examples-tree-plot-unveil-tree-structure-py
-dt = pd.read_pickle( inputfile )
+# structure of model: see tree_model.py
+dt = tree_model.load( inputfile )
+# models trained on other feature sets keep names of their features
+FEATURE_NAMES = dt.feature_names
 
 # output the tree in a text file, write it
-threshold = dt.tree_.threshold
-features  = [FEATURE_NAMES[i] for i in dt.tree_.feature]
+threshold = dt.threshold
+features  = [FEATURE_NAMES[i] for i in dt.feature]
 
 data = {}
 
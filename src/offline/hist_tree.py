@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+# Train a decision tree out of core, i.e., on a feature store (or a csv file) which does not fit in memory.
+#
+# The rows are never loaded at once, they are read by batches:
+#  1. a pass samples the rows (see sampling.py) to get the candidate thresholds of each feature:
+#     at most `bins` integer thresholds at the quantiles of the sample. As the switch compares integers,
+#     a threshold T means `v <= T`, and T is chosen exactly representable by sklearn (see snap_thresholds.py),
+#     thus the tree and its table entries classify every packet the same way.
+#  2. a pass replaces each feature value by the index of its bin, i.e., one byte, in a temporary directory.
+#  3. the tree is grown level by level. A pass over the binned rows moves each row from its node
+#     to the child of this node, then adds it to the histogram (bin of each feature x class) of its new node.
+#     The best split (Gini, as sklearn) of a node is found from the cumulative sums of its histogram.
+# Memory usage depends on the number of bins and nodes of a level, not on the number of rows.
+# The rows are split into ranges whose histograms are computed in parallel, then added.
+#
+# The tree is returned as a tree_model.TreeModel. With `max_leaf_nodes`, the splits of each level
+#  are taken by decreasing gain until the number of leaves is reached.
+#
+
+import argparse, os, tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import feature_store, sampling, tree_model
+from tree_model import int_bound
+
+# maximal number of candidate thresholds per feature, a bin index is stored in one byte
+MAX_BINS = 255
+
+# number of rows read at once
+BATCH_SIZE = 1 << 18
+
+# number of rows sampled per class to get the candidate thresholds
+SAMPLE_SIZE = 100000
+
+# maximal number of nodes whose histograms are computed in a same pass
+MAX_NODES = 1024
+
+# files of the temporary directory
+BINS_FILE  = "bins.bin"
+CLASS_FILE = "class.bin"
+NODE_FILE  = "node.bin"
+
+
+# get the candidate thresholds of a feature from its sampled values
+def get_edges( values, bins = MAX_BINS ):
+    distinct = np.unique( values )
+    if len(distinct) > bins:
+        values = np.unique( np.quantile( values, np.arange( 1, bins + 1 ) / (bins + 1), method="lower" ))
+    else:
+        # use all values when there are few of them, e.g., packet lengths,
+        #  except the greatest one which cannot separate rows
+        values = distinct[ 0 : -1 ]
+    # a row goes to the left child if v <= T, T must be exact in float32
+    edges = [int_bound( float( np.float32( v ))) for v in values.tolist()]
+    return np.unique( np.array( edges, dtype=np.int64 ))
+
+# first pass: sample the rows, then get the candidate thresholds of each feature, all classes and the number of rows
+def get_bins( path, bins = MAX_BINS, batch_size = BATCH_SIZE, seed = 0 ):
+    reservoir = sampling.Reservoir( SAMPLE_SIZE, seed )
+    for results in feature_store.iter_batches( path, batch_size ):
+        reservoir.add( results )
+    sample = reservoir.results()
+    names  = list( sample.dtype.names )
+    edges  = [get_edges( sample[ name ], bins ) for name in names[0:-1]]
+    classes = np.array( sorted( reservoir.seen.keys() ), dtype=np.int64 )
+    return (edges, classes, sum( reservoir.seen.values() ))
+
+
+# binned rows in a temporary directory: bin indices (rows x features), class indices and current node of each row
+def _open( work_dir, nb_rows, nb_features, mode = "r+" ):
+    bins  = np.memmap( os.path.join( work_dir, BINS_FILE ),  dtype=np.uint8, mode=mode, shape=(nb_rows, nb_features) )
+    cls   = np.memmap( os.path.join( work_dir, CLASS_FILE ), dtype=np.uint8, mode=mode, shape=(nb_rows,) )
+    nodes = np.memmap( os.path.join( work_dir, NODE_FILE ),  dtype=np.int32, mode=mode, shape=(nb_rows,) )
+    return (bins, cls, nodes)
+
+# bin the rows from row `start` to row `end`
+def _bin_rows( path, work_dir, nb_rows, start, end, batch_size, edges, classes ):
+    (bins, cls, nodes) = _open( work_dir, nb_rows, len(edges) )
+    if feature_store.is_store( path ):
+        columns = list( feature_store.load_columns( path ).values() )
+        batches = ((i, [c[ i : min( i + batch_size, end ) ] for c in columns]) for i in range( start, end, batch_size ))
+    else:
+        # a csv file is read sequentially
+        batches = _csv_batches( path, batch_size )
+    for (i, columns) in batches:
+        j = i + len(columns[0])
+        for (f, e) in enumerate( edges ):
+            # bin b contains the values in ]edges[b-1], edges[b]]
+            bins[ i : j, f ] = np.searchsorted( e, columns[ f ], side="left" )
+        cls[ i : j ] = np.searchsorted( classes, columns[-1] )
+    bins.flush()
+    cls.flush()
+
+def _csv_batches( path, batch_size ):
+    i = 0
+    for results in feature_store.iter_batches( path, batch_size ):
+        yield (i, [results[ name ] for name in results.dtype.names])
+        i += len(results)
+
+def _bin_rows_task( args ):
+    return _bin_rows( *args )
+
+
+# histograms of the nodes of a pass: (node, feature, bin, class)
+#  split: (feature, bin, left child, right child) of each node, feature = -1 if the node was not split,
+#   the rows of the split nodes are moved to their children, only once per level (`advance`)
+#  slots: position of each node in the histograms, -1 for the nodes which are not in this pass
+def _histograms( work_dir, nb_rows, nb_features, start, end, batch_size, split, advance, slots, nb_classes ):
+    (bins, cls, nodes) = _open( work_dir, nb_rows, nb_features )
+    (split_feature, split_bin, left, right) = split
+    nb_slots = int( slots.max() ) + 1
+    nb_bins  = MAX_BINS + 1
+    shape    = (nb_slots, nb_features, nb_bins, nb_classes)
+    hist     = np.zeros( int( np.prod( shape )), dtype=np.int64 )
+    for i in range( start, end, batch_size ):
+        j = min( i + batch_size, end )
+        B    = np.asarray( bins[ i : j ] )
+        node = np.array( nodes[ i : j ] )
+        if advance:
+            f    = split_feature[ node ]
+            rows = np.flatnonzero( f >= 0 )
+            n    = node[ rows ]
+            go_left = B[ rows, f[ rows ]] <= split_bin[ n ]
+            node[ rows ] = np.where( go_left, left[ n ], right[ n ] )
+            nodes[ i : j ] = node
+
+        slot = slots[ node ]
+        rows = np.flatnonzero( slot >= 0 )
+        if len(rows) == 0:
+            continue
+        c    = cls[ i : j ][ rows ].astype( np.int64 )
+        base = slot[ rows ] * nb_features
+        keys = [((base + f) * nb_bins + B[ rows, f ]) * nb_classes + c for f in range( nb_features )]
+        hist += np.bincount( np.concatenate( keys ), minlength=len(hist) )
+    nodes.flush()
+    return hist.reshape( shape )
+
+def _histograms_task( args ):
+    return _histograms( *args )
+
+
+# the tree being grown
+class _Tree:
+    def __init__(self):
+        self.feature   = []
+        # integer thresholds: a row goes to the left child if v <= threshold
+        self.threshold = []
+        self.left      = []
+        self.right     = []
+        # number of rows of each class reaching each node
+        self.counts    = []
+        self.depth     = []
+
+    def add_node(self, counts, depth):
+        self.feature.append( -2 )
+        self.threshold.append( -2 )
+        self.left.append( -1 )
+        self.right.append( -1 )
+        self.counts.append( counts )
+        self.depth.append( depth )
+        return len(self.feature) - 1
+
+    def arrays(self):
+        return (np.array( self.feature, dtype=np.int32 ), np.array( self.threshold, dtype=np.int64 ),
+            np.array( self.left, dtype=np.int32 ), np.array( self.right, dtype=np.int32 ))
+
+
+# find the best split of each node from its histogram
+#  return (gain, feature, bin) of each node, gain <= 0 if no split is possible
+def best_splits( hist, min_samples_leaf = 1 ):
+    hist  = hist.astype( np.float64 )
+    left  = np.cumsum( hist, axis=2 )
+    total = left[:, :, -1:, :]
+    right = total - left
+    nl = left.sum( axis=3 )
+    nr = right.sum( axis=3 )
+    n  = total.sum( axis=3 )
+
+    # decrease of the weighted Gini impurity: n*gini - nl*gini_left - nr*gini_right
+    with np.errstate( divide="ignore", invalid="ignore" ):
+        score  = (left ** 2).sum( axis=3 ) / nl + (right ** 2).sum( axis=3 ) / nr
+        parent = (total ** 2).sum( axis=3 ) / n
+    gain = score - parent
+    gain[ (nl < max( 1, min_samples_leaf )) | (nr < max( 1, min_samples_leaf )) ] = -np.inf
+
+    flat = gain.reshape( len(gain), -1 )
+    best = np.argmax( flat, axis=1 )
+    (feature, b) = np.unravel_index( best, gain.shape[1:] )
+    return (flat[ np.arange( len(flat) ), best ], feature, b)
+
+
+# train a tree on a store or a csv file
+#  the binned rows are written in a temporary directory in `work_dir`, by default the one of the system
+def fit( path, max_depth = None, max_leaf_nodes = None, min_samples_leaf = 1, bins = MAX_BINS,
+        jobs = 1, batch_size = BATCH_SIZE, seed = 0, work_dir = None ):
+    if bins > MAX_BINS:
+        raise ValueError("too many bins", bins, MAX_BINS)
+    (edges, classes, nb_rows) = get_bins( path, bins, batch_size, seed )
+    if nb_rows == 0:
+        raise ValueError("no rows", path)
+    if len(classes) > 256:
+        raise ValueError("too many classes", len(classes))
+    names = feature_store.load_feature_names( path )
+    nb_features = len(edges)
+
+    step   = max( batch_size, -(-nb_rows // (jobs * 4)) )
+    ranges = [(i, min( i + step, nb_rows )) for i in range( 0, nb_rows, step )]
+
+    tree = _Tree()
+    tree.add_node( None, 0 )
+    frontier  = [0]
+    nb_leaves = 1
+    # split of each node at the previous level
+    split = (np.full( 1, -1, dtype=np.int32 ), np.zeros( 1, dtype=np.int32 ), np.zeros( 1, dtype=np.int32 ), np.zeros( 1, dtype=np.int32 ))
+
+    executor = ProcessPoolExecutor( max_workers=jobs ) if jobs > 1 and len(ranges) > 1 else None
+    def run( function, tasks ):
+        if executor is None:
+            return [function( t ) for t in tasks]
+        return list( executor.map( function, tasks ))
+
+    with tempfile.TemporaryDirectory( dir=work_dir ) as tmp_dir:
+        _open( tmp_dir, nb_rows, nb_features, mode="w+" )
+        if feature_store.is_store( path ):
+            run( _bin_rows_task, [(path, tmp_dir, nb_rows, start, end, batch_size, edges, classes) for (start, end) in ranges] )
+        else:
+            _bin_rows( path, tmp_dir, nb_rows, 0, nb_rows, batch_size, edges, classes )
+
+        try:
+            while len(frontier) > 0:
+                next_frontier = []
+                splits = []
+                for g in range( 0, len(frontier), MAX_NODES ):
+                    group = frontier[ g : g + MAX_NODES ]
+                    slots = np.full( len(tree.feature), -1, dtype=np.int64 )
+                    slots[ group ] = np.arange( len(group) )
+                    tasks = [(tmp_dir, nb_rows, nb_features, start, end, batch_size, split, g == 0, slots, len(classes))
+                        for (start, end) in ranges]
+                    hist = sum( run( _histograms_task, tasks ))
+
+                    (gain, feature, b) = best_splits( hist, min_samples_leaf )
+                    for (i, node) in enumerate( group ):
+                        counts = hist[ i, 0 ].sum( axis=0 )
+                        tree.counts[ node ] = counts
+                        if gain[ i ] > 1e-9:
+                            left  = hist[ i, feature[ i ], 0 : b[ i ] + 1 ].sum( axis=0 )
+                            splits.append( (gain[ i ], node, int( feature[ i ] ), int( b[ i ] ), left, counts - left) )
+
+                # with a limited number of leaves, the best splits first
+                splits.sort( key=lambda s: -s[0] )
+                split_feature = np.full( len(tree.feature) + 2 * len(splits), -1, dtype=np.int32 )
+                split_bin     = np.zeros( len(split_feature), dtype=np.int32 )
+                split_left    = np.zeros( len(split_feature), dtype=np.int32 )
+                split_right   = np.zeros( len(split_feature), dtype=np.int32 )
+                for (gain, node, f, b, left, right) in splits:
+                    if max_leaf_nodes is not None and nb_leaves >= max_leaf_nodes:
+                        break
+                    nb_leaves += 1
+                    depth = tree.depth[ node ] + 1
+                    tree.feature[ node ]   = f
+                    tree.threshold[ node ] = int( edges[ f ][ b ] )
+                    tree.left[ node ]  = tree.add_node( left,  depth )
+                    tree.right[ node ] = tree.add_node( right, depth )
+                    (split_feature[ node ], split_bin[ node ]) = (f, b)
+                    (split_left[ node ], split_right[ node ]) = (tree.left[ node ], tree.right[ node ])
+                    # a node is grown further only if it might be split
+                    for (child, counts) in ((tree.left[ node ], left), (tree.right[ node ], right)):
+                        if (max_depth is None or depth < max_depth) and counts.sum() >= 2 * max( 1, min_samples_leaf ) \
+                                and np.count_nonzero( counts ) > 1:
+                            next_frontier.append( child )
+                split = (split_feature, split_bin, split_left, split_right)
+                frontier = sorted( next_frontier )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    (feature, threshold, left, right) = tree.arrays()
+    # an integer threshold T is exact in float32, i.e., `float32(v) <= float32(T)` if and only if `v <= T`
+    threshold = np.where( feature >= 0, threshold.astype( np.float32 ).astype( np.float64 ), -2.0 )
+    leaf_class = np.array( [np.argmax( c ) for c in tree.counts], dtype=np.int32 )
+    n_samples  = np.array( [c.sum() for c in tree.counts], dtype=np.int64 )
+    return tree_model.TreeModel( feature, threshold, left, right, leaf_class, classes, names, n_samples=n_samples )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', default="./pcaps/features.store", help='path to the input .store directory or csv file')
+    parser.add_argument('-o', default=tree_model.MODEL_FILE, help='path to the output model file')
+    parser.add_argument('-j', '--jobs', default=1, type=int, help='number of worker processes')
+    parser.add_argument('--bins', default=MAX_BINS, type=int, help='maximal number of candidate thresholds per feature')
+    parser.add_argument('--max-depth', type=int, help='maximal depth of the tree')
+    parser.add_argument('--max-leaf-nodes', type=int, help='maximal number of leaves of the tree')
+    parser.add_argument('--min-samples-leaf', default=1, type=int, help='minimal number of rows of a leaf')
+    parser.add_argument('--work-dir', help='directory of the temporary binned rows, default: the one of the system')
+    args = parser.parse_args()
+
+    dt = fit( args.i, args.max_depth, args.max_leaf_nodes, args.min_samples_leaf, args.bins, args.jobs, work_dir=args.work_dir )
+    print("{0} leaves".format( dt.get_n_leaves() ))
+    print("write model to", args.o)
+    tree_model.save( dt, args.o )
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+# Label the packets of mixed captures by rules, instead of one class per pcap file.
+#
+# Rules are given in a json file, e.g.,
+#  [
+#     {"class": "skype",   "src": "10.0.0.0/8", "dport": [3478, 3481], "proto": 17},
+#     {"class": "youtube", "dst": ["142.250.0.0/15", "172.217.0.0/16"], "dport": 443},
+#     {"class": "botnet",  "src": "192.168.1.66", "from": 1700000000, "to": 1700003600}
+#  ]
+# where each field is optional:
+#  - src, dst   : an IPv4 prefix or a list of prefixes
+#  - sport, dport, proto: a value or a range [lo, hi]
+#  - from, to   : timestamps (in second) of a time window
+# A packet is labeled by the first rule matching all its fields, packets matching no rule are not labeled.
+# Class indices start from 1 in the order of their first appearance in the rules.
+#
+# Rules are compiled once into an index:
+#  - the prefixes of a trie are nested intervals, thus the trie is flattened into the elementary
+#    intervals delimited by the bounds of all prefixes. It is the same for port ranges and time windows.
+#  - each elementary interval keeps a bitset of the rules covering it, bit i is set for the i-th rule
+# Labeling a packet then needs one binary search per field, then an AND of their bitsets
+#  whose first set bit gives the matching rule. There is no scan of the rules.
+# Packets are labeled by batches by using numpy.
+#
+
+import argparse, ipaddress, json
+from decimal import Decimal
+import numpy as np
+
+# label of the packets which match no rule
+NO_LABEL = -1
+
+# number of packets labeled at once, to bound the size of their bitsets
+LABEL_BATCH = 16384
+
+# fields of the packets and their range of values
+FIELDS = {
+    "src"  : (0, 0xFFFFFFFF),
+    "dst"  : (0, 0xFFFFFFFF),
+    "sport": (0, 0xFFFF),
+    "dport": (0, 0xFFFF),
+    "proto": (0, 0xFF),
+    "ts"   : (0, 0x7FFFFFFFFFFFFFFF),
+}
+
+
+# get list of ranges [lo, hi] of a field of a rule
+def _get_ranges( rule, field ):
+    if field in ("src", "dst"):
+        prefixes = rule.get( field )
+        if prefixes is None:
+            return [FIELDS[ field ]]
+        if isinstance( prefixes, str ):
+            prefixes = [prefixes]
+        ranges = []
+        for prefix in prefixes:
+            net = ipaddress.IPv4Network( prefix, strict=False )
+            ranges.append( (int(net.network_address), int(net.broadcast_address)) )
+        return ranges
+
+    if field == "ts":
+        # convert to nanosecond without losing precision
+        (lo, hi) = FIELDS[ field ]
+        if rule.get("from") is not None:
+            lo = int( Decimal( str(rule["from"]) ) * 1000000000 )
+        if rule.get("to") is not None:
+            hi = int( Decimal( str(rule["to"]) ) * 1000000000 )
+        return [(lo, hi)]
+
+    val = rule.get( field )
+    if val is None:
+        return [FIELDS[ field ]]
+    if isinstance( val, list ):
+        return [(int(val[0]), int(val[1]))]
+    return [(int(val), int(val))]
+
+
+# index of the values of a field: elementary intervals and the bitsets of the rules covering them
+class _FieldIndex:
+    def __init__(self, ranges, nb_words):
+        # start of each elementary interval
+        bounds = {lo for rule_ranges in ranges for (lo, hi) in rule_ranges}
+        bounds.update( hi + 1 for rule_ranges in ranges for (lo, hi) in rule_ranges )
+        self.starts = np.array( sorted( bounds ), dtype=np.uint64 )
+
+        self.bits = np.zeros( (len(self.starts), nb_words), dtype=np.uint64 )
+        for (i, rule_ranges) in enumerate( ranges ):
+            bit = np.uint64( 1 << (i % 64) )
+            for (lo, hi) in rule_ranges:
+                a = np.searchsorted( self.starts, np.uint64(lo) )
+                b = np.searchsorted( self.starts, np.uint64(hi + 1) )
+                self.bits[ a : b, i // 64 ] |= bit
+
+    # get the bitsets of the values
+    def lookup(self, values):
+        i = np.searchsorted( self.starts, values.astype( np.uint64 ), side="right" ) - 1
+        return self.bits[ i ]
+
+
+class RuleIndex:
+    def __init__(self, rules):
+        # class name => index
+        self.classes = {}
+        rule_classes = []
+        for rule in rules:
+            if rule["class"] not in self.classes:
+                self.classes[ rule["class"] ] = len(self.classes) + 1
+            rule_classes.append( self.classes[ rule["class"] ] )
+        # class of each rule, then NO_LABEL for "no rule"
+        self.rule_classes = np.array( rule_classes + [NO_LABEL], dtype=np.int64 )
+        self.nb_rules = len(rules)
+
+        nb_words = max( 1, (len(rules) + 63) // 64 )
+        self.fields = {}
+        for field in FIELDS:
+            ranges = [_get_ranges( rule, field ) for rule in rules]
+            # no need to look up a field which is not used by any rule
+            if any( r != [FIELDS[ field ]] for r in ranges ):
+                self.fields[ field ] = _FieldIndex( ranges, nb_words )
+        # bitset of all rules
+        self.all_bits = np.zeros( nb_words, dtype=np.uint64 )
+        for i in range( len(rules) ):
+            self.all_bits[ i // 64 ] |= np.uint64( 1 << (i % 64) )
+
+    # get labels, i.e., class indices or NO_LABEL, of packets given by arrays of their fields
+    def label(self, ts, src, dst, sport, dport, proto):
+        values = {"ts": ts, "src": src, "dst": dst, "sport": sport, "dport": dport, "proto": proto}
+        values = {field: np.asarray( values[ field ] ) for field in self.fields}
+        labels = np.empty( len(ts), dtype=np.int64 )
+        for start in range( 0, len(ts), LABEL_BATCH ):
+            end = min( start + LABEL_BATCH, len(ts) )
+            labels[ start : end ] = self._label( values, start, end )
+        return labels
+
+    def _label(self, values, start, end):
+        bits = np.broadcast_to( self.all_bits, (end - start, len(self.all_bits)) )
+        for field in values:
+            bits = bits & self.fields[ field ].lookup( values[ field ][ start : end ] )
+
+        # index of the first non-zero word, then of its lowest set bit
+        nonzero = bits != 0
+        word = np.argmax( nonzero, axis=1 )
+        low  = bits[ np.arange( len(bits) ), word ]
+        low  = low & (~low + np.uint64(1))
+        # a power of 2 is exact in float64
+        bit  = np.frexp( low.astype( np.float64 ))[1] - 1
+        rule = np.where( nonzero.any( axis=1 ), word * 64 + bit, self.nb_rules )
+        return self.rule_classes[ rule ]
+
+
+def load_rules( rulefile ):
+    with open( rulefile ) as f:
+        return RuleIndex( json.load( f ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-r', required=True, help='path to the json file of rules')
+    parser.add_argument('--src',   required=True, help='source IPv4 address')
+    parser.add_argument('--dst',   required=True, help='destination IPv4 address')
+    parser.add_argument('--sport', default=0, type=int, help='source port')
+    parser.add_argument('--dport', default=0, type=int, help='destination port')
+    parser.add_argument('--proto', default=6, type=int, help='IP protocol')
+    parser.add_argument('--ts',    default="0", help='timestamp (in second)')
+    args = parser.parse_args()
+
+    # label a single packet, e.g., to check the rules
+    index = load_rules( args.r )
+    label = index.label( np.array([ int( Decimal( args.ts ) * 1000000000 ) ]),
+        np.array([ int(ipaddress.IPv4Address( args.src )) ]), np.array([ int(ipaddress.IPv4Address( args.dst )) ]),
+        np.array([ args.sport ]), np.array([ args.dport ]), np.array([ args.proto ]) )[0]
+    names = {v: k for (k, v) in index.classes.items()}
+    print( names.get( label, "no label" ))
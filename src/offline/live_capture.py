@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# Capture packets from a network interface, e.g., a veth or lo, without writing a pcap file.
+#
+# On Linux, packets are read from a ring buffer shared with the kernel (PACKET_RX_RING, TPACKET_V3):
+#  the kernel fills blocks of packets, which are then parsed by chunks as the records of a pcap file
+#  (see pcap_reader.py), and given back to the kernel. No system call is needed per packet.
+# If the ring cannot be set up, packets are received one by one from a raw socket.
+#
+# A block is given to user space when it is full or after RETIRE_TIMEOUT, thus chunks of packets are
+#  yielded regularly even if the traffic is low. An empty chunk is yielded when no packet arrives
+#  during POLL_TIMEOUT, which lets the caller flush its results periodically.
+#
+# This script prints the number of IPv4 packets captured per second, e.g.,
+#  sudo ./live_capture.py -i veth0
+#
+
+import argparse, mmap, select, socket, struct, time
+import numpy as np
+import pcap_reader
+
+SOL_PACKET      = 263
+PACKET_RX_RING  = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION  = 10
+TPACKET_V3      = 2
+PACKET_ADD_MEMBERSHIP = 1
+PACKET_MR_PROMISC = 1
+PACKET_OUTGOING = 4
+ETH_P_ALL       = 0x0003
+SO_TIMESTAMPNS  = 35
+
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER   = 1
+
+# ring buffer: BLOCK_NR blocks of BLOCK_SIZE bytes
+BLOCK_SIZE = 1 << 20
+BLOCK_NR   = 32
+FRAME_SIZE = 2048
+# in millisecond
+RETIRE_TIMEOUT = 100
+# in second
+POLL_TIMEOUT   = 0.1
+
+# offset of the fields in a block descriptor (struct tpacket_block_desc)
+BLOCK_STATUS_OFFSET = 8
+# the packet header (struct tpacket3_hdr) is followed by a struct sockaddr_ll
+SLL_OFFSET  = 48
+SLL_PKTTYPE = 10
+
+# ARPHRD_* => link type
+# See /usr/include/linux/if_arp.h
+HW_LINKTYPES = {
+    1    : pcap_reader.LINKTYPE_ETHERNET, # ARPHRD_ETHER
+    772  : pcap_reader.LINKTYPE_ETHERNET, # ARPHRD_LOOPBACK
+    65534: pcap_reader.LINKTYPE_RAW,      # ARPHRD_NONE, e.g., tun
+}
+
+
+def get_linktype( interface ):
+    with open( "/sys/class/net/{0}/type".format( interface )) as f:
+        hw_type = int( f.read() )
+    if hw_type not in HW_LINKTYPES:
+        raise ValueError("unsupported type of interface", interface, hw_type)
+    return HW_LINKTYPES[ hw_type ]
+
+
+class LiveCapture(pcap_reader._Reader):
+    # count, duration: stop after this number of packets or seconds, None for no limit
+    # on_chunk: function called before waiting for each chunk, e.g., to flush results periodically
+    def __init__(self, interface, promisc = False, count = None, duration = None, use_ring = True, on_chunk = None):
+        self.interface = interface
+        self.count     = count
+        self.duration  = duration
+        self.on_chunk  = on_chunk
+        self.linktype  = get_linktype( interface )
+        # on loopback, outgoing packets are also seen as incoming ones
+        self.is_loopback = (interface == "lo")
+        self.ring = None
+
+        self.sock = socket.socket( socket.AF_PACKET, socket.SOCK_RAW, socket.htons( ETH_P_ALL ))
+        try:
+            if promisc:
+                ifindex = socket.if_nametoindex( interface )
+                mreq = struct.pack( "iHH8s", ifindex, PACKET_MR_PROMISC, 0, b"" )
+                self.sock.setsockopt( SOL_PACKET, PACKET_ADD_MEMBERSHIP, mreq )
+
+            if use_ring:
+                try:
+                    self._setup_ring()
+                except OSError as e:
+                    print("Cannot set up the ring buffer, receive packets one by one:", e)
+                    self.ring = None
+            if self.ring is None:
+                self.sock.setsockopt( socket.SOL_SOCKET, SO_TIMESTAMPNS, 1 )
+
+            self.sock.bind( (interface, ETH_P_ALL) )
+        except BaseException:
+            self.close()
+            raise
+
+    def _setup_ring(self):
+        self.sock.setsockopt( SOL_PACKET, PACKET_VERSION, TPACKET_V3 )
+        # struct tpacket_req3
+        req = struct.pack( "IIIIIII", BLOCK_SIZE, BLOCK_NR, FRAME_SIZE, BLOCK_SIZE * BLOCK_NR // FRAME_SIZE,
+            RETIRE_TIMEOUT, 0, 0 )
+        self.sock.setsockopt( SOL_PACKET, PACKET_RX_RING, req )
+        self.ring = mmap.mmap( self.sock.fileno(), BLOCK_SIZE * BLOCK_NR, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE )
+        self.buf  = np.frombuffer( self.ring, dtype=np.uint8 )
+
+    def close(self):
+        # the array must be released before the memory map
+        self.buf = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    # get (number of received packets, number of dropped packets) since the last call
+    def stats(self):
+        (packets, drops) = struct.unpack( "II", self.sock.getsockopt( SOL_PACKET, PACKET_STATISTICS, 12 )[0:8] )
+        return (packets, drops)
+
+    # yield chunks of packets: (buffer, offsets of data, caplens, timestamps, link type)
+    def _chunks(self):
+        end = time.monotonic() + self.duration if self.duration is not None else None
+        nb_packets = 0
+        poll = select.poll()
+        poll.register( self.sock, select.POLLIN | select.POLLERR )
+
+        chunks = self._ring_chunks( poll ) if self.ring is not None else self._socket_chunks( poll )
+        while True:
+            if self.on_chunk is not None:
+                self.on_chunk()
+            (buf, data, caplen, ts) = next( chunks )
+            if self.count is not None and nb_packets + len(data) >= self.count:
+                n = self.count - nb_packets
+                yield (buf, data[0:n], caplen[0:n], ts[0:n], self.linktype)
+                return
+            nb_packets += len(data)
+            yield (buf, data, caplen, ts, self.linktype)
+
+            if end is not None and time.monotonic() >= end:
+                return
+
+    def _empty_chunk(self):
+        empty = np.empty( 0, dtype=np.int64 )
+        return (np.empty( 0, dtype=np.uint8 ), empty, empty, empty)
+
+    def _ring_chunks(self, poll):
+        block = 0
+        while True:
+            base = block * BLOCK_SIZE
+            (status, nb_packets, first) = struct.unpack_from( "III", self.ring, base + BLOCK_STATUS_OFFSET )
+            if (status & TP_STATUS_USER) == 0:
+                # wait for the kernel to retire this block
+                if len(poll.poll( POLL_TIMEOUT * 1000 )) == 0:
+                    yield self._empty_chunk()
+                continue
+
+            # walk the packets of this block
+            data   = []
+            caplen = []
+            ts     = []
+            offset = base + first
+            for _ in range( nb_packets ):
+                (next_offset, sec, nsec, snaplen, wirelen, pkt_status, mac) = struct.unpack_from( "IIIIIIH", self.ring, offset )
+                if not (self.is_loopback and self.ring[ offset + SLL_OFFSET + SLL_PKTTYPE ] == PACKET_OUTGOING):
+                    data.append( offset + mac )
+                    caplen.append( snaplen )
+                    ts.append( sec * 1000000000 + nsec )
+                offset += next_offset
+
+            yield (self.buf, np.array( data, dtype=np.int64 ), np.array( caplen, dtype=np.int64 ), np.array( ts, dtype=np.int64 ))
+
+            # give the block back to the kernel once the chunk has been parsed
+            struct.pack_into( "I", self.ring, base + BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL )
+            block = (block + 1) % BLOCK_NR
+
+    def _socket_chunks(self, poll):
+        cmsg_size = socket.CMSG_SPACE( 16 )
+        while True:
+            deadline = time.monotonic() + POLL_TIMEOUT
+            packets = []
+            ts      = []
+            # gather the packets received during POLL_TIMEOUT
+            while len(packets) < pcap_reader.CHUNK_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 or len(poll.poll( timeout * 1000 )) == 0:
+                    break
+                (packet, ancdata, flags, addr) = self.sock.recvmsg( 65535, cmsg_size )
+                if self.is_loopback and addr[2] == PACKET_OUTGOING:
+                    continue
+                t = time.time_ns()
+                for (level, kind, value) in ancdata:
+                    if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+                        (sec, nsec) = struct.unpack( "qq", value[0:16] )
+                        t = sec * 1000000000 + nsec
+                packets.append( packet )
+                ts.append( t )
+
+            if len(packets) == 0:
+                yield self._empty_chunk()
+                continue
+
+            # concatenate the packets into a buffer as if they were records of a pcap file
+            caplen = np.array( [len(p) for p in packets], dtype=np.int64 )
+            data   = np.concatenate( ([0], np.cumsum( caplen )[:-1] ))
+            buf    = np.frombuffer( b"".join( packets ), dtype=np.uint8 )
+            yield (buf, data, caplen, np.array( ts, dtype=np.int64 ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', required=True, help='name of the network interface')
+    parser.add_argument('-d', type=float, help='stop after this number of seconds')
+    parser.add_argument('--promisc', action='store_true', help='set the interface in promiscuous mode')
+    parser.add_argument('--no-ring', action='store_true', help='receive packets one by one instead of using a ring buffer')
+    args = parser.parse_args()
+
+    with LiveCapture( args.i, args.promisc, duration=args.d, use_ring=not args.no_ring ) as capture:
+        start = time.monotonic()
+        nb_packets = 0
+        try:
+            for (ts, ip_len) in capture.records():
+                nb_packets += len(ts)
+                now = time.monotonic()
+                if now - start >= 1:
+                    (received, drops) = capture.stats()
+                    print("{0} IPv4 packets/s, {1} dropped".format( round( nb_packets / (now - start) ), drops ))
+                    start = now
+                    nb_packets = 0
+        except KeyboardInterrupt:
+            pass
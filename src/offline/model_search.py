@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Search hyperparameters of the decision tree under the budget of the switch.
+#
+# Each candidate setting of (max_depth, max_leaf_nodes, min_samples_leaf) is trained on a training split,
+#  then it is scored by:
+#  - its accuracy on the held-out split
+#  - its number of entries in `MyIngress.ml_code` table, i.e., its number of leaves which a vector of
+#    the domain reaches, as generate_table_entries.py writes one entry per such leaf
+# Candidates are trained in parallel, each worker process gets the training data only once.
+#
+# The Pareto front contains the candidates which are not dominated by another one,
+#  i.e., no other candidate has both more accuracy and less entries.
+# The chosen model is the most accurate candidate fitting the budget, thus its number of entries
+#  is exactly the one which is reported.
+#
+
+import csv, itertools
+from concurrent.futures import ProcessPoolExecutor
+import tree_model
+from sklearn import tree
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+# size of `MyIngress.ml_code` table, see NB_ENTRIES in basic.p4
+BUDGET = 8192
+
+# default candidate values, None for no limit
+MAX_DEPTH        = [None, 6, 8, 10, 12, 16]
+MAX_LEAF_NODES   = [None, 64, 256, 1024, 4096]
+MIN_SAMPLES_LEAF = [1, 5, 20]
+
+# fraction of the rows which are held out to score the candidates
+TEST_SIZE = 0.3
+
+
+# data of a worker process, set once by _init_worker
+_data = None
+
+def _init_worker( data ):
+    global _data
+    _data = data
+
+# train a candidate, then return (params, accuracy, number of entries, model)
+def _fit( params ):
+    (X_train, Y_train, X_test, Y_test, feature_names, seed) = _data
+    dt = tree.DecisionTreeClassifier( random_state=seed, **params )
+    dt.fit( X_train, Y_train )
+    accuracy = accuracy_score( Y_test, dt.predict( X_test ))
+    return (params, accuracy, count_entries( dt, feature_names ), dt)
+
+# number of entries of the table generated by generate_table_entries.py
+#  the leaves out of the domain are removed before writing the entries
+def count_entries( dt, feature_names = None ):
+    model = tree_model.from_sklearn( dt )
+    if feature_names is not None:
+        model.feature_names = list( feature_names )
+    (model, nb_removed) = tree_model.table_model( model )
+    return int( model.get_n_leaves() )
+
+# get all combinations of the candidate values
+def get_candidates( max_depth = MAX_DEPTH, max_leaf_nodes = MAX_LEAF_NODES, min_samples_leaf = MIN_SAMPLES_LEAF ):
+    return [{"max_depth": d, "max_leaf_nodes": l, "min_samples_leaf": m}
+        for (d, l, m) in itertools.product( max_depth, max_leaf_nodes, min_samples_leaf )]
+
+# get the results which are not dominated, ordered by number of entries
+def pareto_front( results ):
+    front = []
+    # for a same number of entries, the most accurate first
+    for r in sorted( results, key=lambda r: (r[2], -r[1]) ):
+        if len(front) == 0 or r[1] > front[-1][1]:
+            front.append( r )
+    return front
+
+# train the candidates on a training split, `jobs` at a time
+#  return the list of (params, accuracy, number of entries, model)
+def evaluate( X, Y, candidates, jobs = 1, test_size = TEST_SIZE, seed = 0, feature_names = None ):
+    # keep the proportion of each class in both splits
+    (X_train, X_test, Y_train, Y_test) = train_test_split( X, Y, test_size=test_size, random_state=seed, stratify=Y )
+    data = (X_train, Y_train, X_test, Y_test, feature_names, seed)
+
+    if jobs <= 1:
+        _init_worker( data )
+        return [_fit( params ) for params in candidates]
+
+    with ProcessPoolExecutor( max_workers=jobs, initializer=_init_worker, initargs=(data,) ) as executor:
+        return list( executor.map( _fit, candidates ))
+
+# get the most accurate result fitting the budget, the one having less entries if several
+def choose( results, budget = BUDGET ):
+    fitting = [r for r in results if r[2] <= budget]
+    if len(fitting) == 0:
+        return None
+    return max( fitting, key=lambda r: (r[1], -r[2]) )
+
+def format_result( result ):
+    (params, accuracy, entries, dt) = result
+    return "entries={0:<6} accuracy={1:.4f} max_depth={2} max_leaf_nodes={3} min_samples_leaf={4}".format(
+        entries, accuracy, params["max_depth"], params["max_leaf_nodes"], params["min_samples_leaf"] )
+
+# write all results into a csv file, the "pareto" column tells whether a result is in the Pareto front
+def write_report( results, front, outputfile ):
+    with open( outputfile, 'w', newline='' ) as f:
+        writer = csv.writer( f )
+        writer.writerow( ["max_depth", "max_leaf_nodes", "min_samples_leaf", "accuracy", "entries", "pareto"] )
+        for r in sorted( results, key=lambda r: (r[2], -r[1]) ):
+            (params, accuracy, entries, dt) = r
+            writer.writerow( [params["max_depth"], params["max_leaf_nodes"], params["min_samples_leaf"],
+                accuracy, entries, int( any( r is p for p in front ))] )
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Build an index of a pcap file: byte offset and timestamp of every Nth record.
+#
+# The index is saved beside the pcap file, e.g., skype.v1.pcap.idx.npz, and is used to:
+#  - split a large pcap file into byte ranges which are parsed in parallel
+#  - find the byte range containing the packets between 2 timestamps without scanning the file
+#
+# The index is rebuilt when the size or the modification time of the pcap file, or the step N changes.
+#
+
+import argparse, os
+import numpy as np
+import pcap_reader
+
+# index a record every INDEX_STEP records
+INDEX_STEP = 10000
+
+INDEX_EXT = ".idx.npz"
+
+
+def get_index_file( inputfile ):
+    return inputfile + INDEX_EXT
+
+# walk the pcap file to get offset and timestamp of every step-th record
+#  return a dict of "offset", "ts" arrays, "step", "size" and "mtime" (in nanosecond) of the pcap file
+def build_index( pcap, step = INDEX_STEP ):
+    offsets = []
+    # number of records from the last indexed one
+    skip = 0
+    for chunk in pcap.offsets():
+        offsets.append( chunk[ (step - skip) % step :: step ] )
+        skip = (skip + len(chunk)) % step
+
+    offsets = np.concatenate( offsets ) if len(offsets) > 0 else np.empty( 0, dtype=np.int64 )
+    # timestamp is the first field of a record header
+    (ts, ip_len, is_ip) = pcap.fields( offsets )
+    return {"offset": offsets, "ts": ts, "step": step, "size": pcap.size, "mtime": pcap.mtime}
+
+def save_index( index, indexfile ):
+    # write to a temporary file first to avoid leaving a truncated index
+    tmp_file = indexfile + ".tmp"
+    with open( tmp_file, 'wb' ) as f:
+        np.savez( f, **index )
+    os.replace( tmp_file, indexfile )
+
+def load_index( indexfile ):
+    with np.load( indexfile ) as data:
+        # an index written by a former version has no mtime, it is rebuilt
+        return {"offset": data["offset"], "ts": data["ts"], "step": int(data["step"]), "size": int(data["size"]),
+            "mtime": int(data["mtime"]) if "mtime" in data else None}
+
+# get the index of an opened pcap file, build and save it if needed
+def get_index( pcap, inputfile, step = INDEX_STEP ):
+    indexfile = get_index_file( inputfile )
+    if os.path.exists( indexfile ):
+        index = load_index( indexfile )
+        if index["size"] == pcap.size and index["mtime"] == pcap.mtime and index["step"] == step:
+            return index
+
+    index = build_index( pcap, step )
+    try:
+        save_index( index, indexfile )
+    except OSError as e:
+        # the pcap folder might be read-only
+        print("Cannot save index", indexfile, e)
+    return index
+
+
+# split the pcap file into at most n byte ranges [start, end) of similar sizes
+#  each range starts at an indexed record
+def split( index, n ):
+    offsets = index["offset"]
+    size    = index["size"]
+    if len(offsets) == 0:
+        return []
+
+    targets = offsets[0] + (size - offsets[0]) * np.arange( n ) // n
+    starts  = np.unique( offsets[ np.searchsorted( offsets, targets, side="right" ) - 1 ] )
+    ends    = np.append( starts[1:], size )
+    return list( zip( starts.tolist(), ends.tolist() ))
+
+# get the byte range [start, end) which contains the records having timestamp in [t1, t2]
+#  t1 or t2 might be None to indicate no lower or upper bound
+# The records in this range still need to be filtered by their timestamps.
+# Records are expected to be in time order, except few unordered ones.
+def time_range( index, t1, t2 ):
+    offsets = index["offset"]
+    ts      = index["ts"]
+    size    = index["size"]
+    if len(offsets) == 0:
+        return (size, size)
+
+    start = offsets[0]
+    if t1 is not None:
+        # start from the last indexed record after which no timestamp is smaller than t1
+        i = np.searchsorted( np.maximum.accumulate( ts ), t1, side="left" )
+        start = offsets[ max(i - 1, 0) ]
+
+    end = size
+    if t2 is not None:
+        # stop at the first indexed record after which all timestamps are greater than t2
+        suffix_min = np.minimum.accumulate( ts[::-1] )[::-1]
+        i = np.searchsorted( suffix_min, t2, side="right" )
+        if i < len(offsets):
+            end = offsets[ i ]
+
+    return (int(start), int(max(start, end)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', required=True, help='path to pcap file')
+    parser.add_argument('-n', default=INDEX_STEP, type=int, help='index a record every n records')
+    args = parser.parse_args()
+
+    # compressed or pcapng files cannot be memory-mapped
+    pcap = pcap_reader.PcapFile( args.i )
+
+    with pcap:
+        index = build_index( pcap, args.n )
+    save_index( index, get_index_file( args.i ))
+    print("write {0} entries to {1}".format( len(index["offset"]), get_index_file( args.i )))
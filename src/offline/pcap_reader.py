@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+
+# Read pcap records without dissecting packets by scapy.
+#
+# Supported inputs:
+#  - pcap files, which are memory-mapped (see PcapFile)
+#  - pcapng files and gzip/zstd compressed pcap or pcapng files, e.g., *.pcap.gz, *.pcapng.zst,
+#    which are read and decompressed in streaming fashion (see PcapStream)
+#
+# Only the fields needed to compute the features are extracted:
+#  - timestamp of the record, in nanosecond
+#  - total length of the IPv4 packet, at a fixed offset after the link-layer header
+#
+# Record headers are walked by using `struct` and the fields are then gathered by chunks by using numpy.
+# Records which are not IPv4 packets are ignored.
+#
+# See https://wiki.wireshark.org/Development/LibpcapFileFormat
+#  and https://www.ietf.org/archive/id/draft-ietf-opsawg-pcapng-01.html
+#
+
+import gzip, mmap, os, struct
+import numpy as np
+
+GLOBAL_HEADER_SIZE = 24
+RECORD_HEADER_SIZE = 16
+
+# magic number => (resolution of the fraction part of timestamp in nanosecond)
+MAGIC_NUMBERS = {
+    0xa1b2c3d4: 1000, # microsecond resolution
+    0xa1b23c4d: 1,    # nanosecond resolution
+}
+
+# link types having a fixed link-layer header
+# See https://www.tcpdump.org/linktypes.html
+LINKTYPE_NULL     = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW_OLD  = 12
+LINKTYPE_RAW      = 101
+LINKTYPE_LOOP     = 108
+LINKTYPE_SLL      = 113
+LINKTYPE_IPV4     = 228
+LINKTYPE_SLL2     = 276
+
+SUPPORTED_LINKTYPES = [LINKTYPE_NULL, LINKTYPE_ETHERNET, LINKTYPE_RAW_OLD, LINKTYPE_RAW,
+    LINKTYPE_LOOP, LINKTYPE_SLL, LINKTYPE_IPV4, LINKTYPE_SLL2]
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = [0x8100, 0x88a8]
+AF_INET = 2
+
+PCAPNG_MAGIC      = 0x0A0D0D0A # block type of Section Header Block
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+PCAPNG_IDB = 1 # Interface Description Block
+PCAPNG_SPB = 3 # Simple Packet Block
+PCAPNG_EPB = 6 # Enhanced Packet Block
+PCAPNG_OPT_TSRESOL = 9
+
+# extensions of the files which can be read
+PCAP_EXTS = [".pcap", ".pcapng", ".pcap.gz", ".pcapng.gz", ".pcap.zst", ".pcapng.zst"]
+
+# number of records to be gathered at once
+CHUNK_SIZE = 65536
+# number of bytes to be read at once from a stream
+READ_SIZE = 4*1024*1024
+
+
+# get n-bytes unsigned integers at the given byte offsets of a buffer
+def _gather( buf, offsets, n, endian ):
+    data = buf[ offsets[:, None] + np.arange(n) ]
+    return data.view( endian + "u" + str(n) ).ravel().astype( np.int64 )
+
+# get offset of the IP header inside the packet data
+#  return also a mask to tell which packets contain an IPv4 header
+def _ip_offset( buf, data, caplen, linktype ):
+    n = len(data)
+    if linktype in [LINKTYPE_RAW_OLD, LINKTYPE_RAW, LINKTYPE_IPV4]:
+        return (np.zeros( n, dtype=np.int64 ), caplen > 0)
+
+    if linktype in [LINKTYPE_NULL, LINKTYPE_LOOP]:
+        # protocol family is in the byte order of the capturing machine
+        ok = caplen >= 4
+        family = _gather( buf, np.where( ok, data, 0 ), 4, ">" )
+        ok &= (family == AF_INET) | (family == (AF_INET << 24))
+        return (np.full( n, 4, dtype=np.int64 ), ok)
+
+    if linktype == LINKTYPE_SLL:
+        ok = caplen >= 16
+        proto = _gather( buf, np.where( ok, data + 14, 0 ), 2, ">" )
+        return (np.full( n, 16, dtype=np.int64 ), ok & (proto == ETHERTYPE_IPV4))
+
+    if linktype == LINKTYPE_SLL2:
+        ok = caplen >= 20
+        proto = _gather( buf, np.where( ok, data, 0 ), 2, ">" )
+        return (np.full( n, 20, dtype=np.int64 ), ok & (proto == ETHERTYPE_IPV4))
+
+    if linktype != LINKTYPE_ETHERNET:
+        return (np.zeros( n, dtype=np.int64 ), np.zeros( n, dtype=bool ))
+
+    # Ethernet, with at most 2 VLAN tags
+    ip_offset = np.full( n, 14, dtype=np.int64 )
+    ok = caplen >= 14
+    ethertype = _gather( buf, np.where( ok, data + 12, 0 ), 2, ">" )
+    for _ in range(2):
+        is_vlan = ok & np.isin( ethertype, ETHERTYPE_VLAN )
+        ok &= ~is_vlan | (caplen >= ip_offset + 4)
+        ip_offset += np.where( is_vlan, 4, 0 )
+        ethertype = np.where( is_vlan,
+            _gather( buf, np.where( ok, data + ip_offset - 2, 0 ), 2, ">" ), ethertype )
+
+    return (ip_offset, ok & (ethertype == ETHERTYPE_IPV4))
+
+# get the IPv4 total lengths of the packets starting at the given offsets of a buffer
+#  return also a mask to tell which packets are IPv4, the offsets of IP headers
+#  and the number of captured bytes from them
+def _packet_fields( buf, data, caplen, linktype ):
+    (ip_offset, is_ip) = _ip_offset( buf, data, caplen, linktype )
+
+    # need at least the first 4 bytes of IP header to get its total length
+    is_ip &= (caplen >= ip_offset + 4)
+    ip = data + np.where( is_ip, ip_offset, 0 )
+    # avoid reading outside of the buffer
+    ip = np.minimum( ip, len(buf) - 4 )
+
+    is_ip &= ((buf[ ip ] >> 4) == 4) # IPv4
+    ip_len = _gather( buf, ip + 2, 2, ">" )
+
+    return (ip_len, is_ip, ip, caplen - ip_offset)
+
+# get the 5-tuple (as the one of `digest_t` in basic.p4) of the IPv4 packets
+#  ports are 0 if the packet is neither TCP nor UDP, or if they are not captured
+#  all fields are 0 if the IPv4 header is not entirely captured
+def _flow_fields( buf, ip, ip_caplen ):
+    ok = ip_caplen >= 20
+    ip = np.where( ok, ip, 0 )
+    src   = np.where( ok, _gather( buf, ip + 12, 4, ">" ), 0 )
+    dst   = np.where( ok, _gather( buf, ip + 16, 4, ">" ), 0 )
+    proto = np.where( ok, buf[ ip + 9 ], 0 ).astype( np.int64 )
+    ihl   = (buf[ ip ] & 0xF).astype( np.int64 ) * 4
+
+    has_port = ok & np.isin( proto, [IPPROTO_TCP, IPPROTO_UDP] ) & (ip_caplen >= ihl + 4)
+    l4 = np.where( has_port, ip + ihl, 0 )
+    sport = np.where( has_port, _gather( buf, l4,     2, ">" ), 0 )
+    dport = np.where( has_port, _gather( buf, l4 + 2, 2, ">" ), 0 )
+    return (src, dst, sport, dport, proto)
+
+
+# yield records (timestamps, IPv4 total lengths) or flow records of IPv4 packets
+#  from the chunks given by `reader._chunks`
+class _Reader:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # parse a chunk of packets: (buffer, offsets of data, caplens, timestamps, link types)
+    #  link types are either a single value or one value per packet
+    def _parse(self, buf, data, caplen, linktype):
+        if np.ndim( linktype ) == 0:
+            return _packet_fields( buf, data, caplen, linktype )
+
+        # packets captured on interfaces having different link types
+        ip_len    = np.zeros( len(data), dtype=np.int64 )
+        is_ip     = np.zeros( len(data), dtype=bool )
+        ip        = np.zeros( len(data), dtype=np.int64 )
+        ip_caplen = np.zeros( len(data), dtype=np.int64 )
+        for lt in np.unique( linktype ):
+            m = (linktype == lt)
+            (ip_len[m], is_ip[m], ip[m], ip_caplen[m]) = _packet_fields( buf, data[m], caplen[m], lt )
+        return (ip_len, is_ip, ip, ip_caplen)
+
+    # yield (timestamps, IPv4 total lengths) of the IPv4 packets, by chunks
+    def records(self, *args, **kwargs):
+        for (buf, data, caplen, ts, linktype) in self._chunks( *args, **kwargs ):
+            (ip_len, is_ip, ip, ip_caplen) = self._parse( buf, data, caplen, linktype )
+            yield (ts[is_ip], ip_len[is_ip])
+
+    # yield (timestamps, IPv4 total lengths, src IPs, dst IPs, src ports, dst ports, protocols)
+    #  of the IPv4 packets, by chunks
+    def flow_records(self, *args, **kwargs):
+        for (buf, data, caplen, ts, linktype) in self._chunks( *args, **kwargs ):
+            (ip_len, is_ip, ip, ip_caplen) = self._parse( buf, data, caplen, linktype )
+            (src, dst, sport, dport, proto) = _flow_fields( buf, ip[is_ip], ip_caplen[is_ip] )
+            yield (ts[is_ip], ip_len[is_ip], src, dst, sport, dport, proto)
+
+
+class PcapFile(_Reader):
+    def __init__(self, inputfile):
+        self.file = open( inputfile, 'rb' )
+        self.mm   = None
+        self.buf  = None
+        try:
+            stat = os.fstat( self.file.fileno() )
+            self.size  = stat.st_size
+            # modification time, to detect a file rewritten with the same size
+            self.mtime = stat.st_mtime_ns
+            if self.size < GLOBAL_HEADER_SIZE:
+                raise ValueError("not a pcap file", inputfile)
+
+            self.mm = mmap.mmap( self.file.fileno(), 0, access=mmap.ACCESS_READ )
+
+            # the magic number tells us the byte order of the headers
+            for endian in ["<", ">"]:
+                (magic,) = struct.unpack_from( endian + "I", self.mm, 0 )
+                if magic in MAGIC_NUMBERS:
+                    break
+            else:
+                raise ValueError("not a pcap file", inputfile)
+
+            self.endian     = endian
+            self.resolution = MAGIC_NUMBERS[ magic ]
+            # the upper bits of link type might contain FCS information
+            (self.linktype,) = struct.unpack_from( endian + "I", self.mm, 20 )
+            self.linktype &= 0xFFFF
+            if self.linktype not in SUPPORTED_LINKTYPES:
+                raise ValueError("unsupported link type", self.linktype)
+
+            self.buf = np.frombuffer( self.mm, dtype=np.uint8 )
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        # numpy views must be released before closing the mmap
+        self.buf = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.file.close()
+
+    # walk the record headers from the byte offset `start` until `end`
+    #  then yield byte offsets of the records, by chunks
+    def offsets(self, start = GLOBAL_HEADER_SIZE, end = None, chunk_size = CHUNK_SIZE):
+        if end is None or end > self.size:
+            end = self.size
+        unpack = struct.Struct( self.endian + "I" ).unpack_from
+        mm = self.mm
+        offset = start
+        result = []
+        while offset + RECORD_HEADER_SIZE <= end:
+            (caplen,) = unpack( mm, offset + 8 )
+            # ignore the last record if it is truncated
+            if offset + RECORD_HEADER_SIZE + caplen > self.size:
+                break
+            result.append( offset )
+            offset += RECORD_HEADER_SIZE + caplen
+            if len(result) == chunk_size:
+                yield np.array( result, dtype=np.int64 )
+                result = []
+
+        if len(result) > 0:
+            yield np.array( result, dtype=np.int64 )
+
+    # get the timestamps (in nanosecond), caplens of the records at the given offsets
+    def _headers(self, offsets):
+        endian  = self.endian
+        sec     = _gather( self.buf, offsets,      4, endian )
+        frac    = _gather( self.buf, offsets + 4,  4, endian )
+        caplen  = _gather( self.buf, offsets + 8,  4, endian )
+        return (sec * 1000000000 + frac * self.resolution, caplen)
+
+    # get the timestamps (in nanosecond) and the IPv4 total lengths of the records at the given offsets
+    #  Return also a mask to tell which records are IPv4 packets
+    def fields(self, offsets):
+        (ts, caplen) = self._headers( offsets )
+        (ip_len, is_ip, ip, ip_caplen) = _packet_fields( self.buf, offsets + RECORD_HEADER_SIZE, caplen, self.linktype )
+        return (ts, ip_len, is_ip)
+
+    # yield chunks of records in the byte range [start, end)
+    def _chunks(self, start = GLOBAL_HEADER_SIZE, end = None, chunk_size = CHUNK_SIZE):
+        for offsets in self.offsets( start, end, chunk_size ):
+            (ts, caplen) = self._headers( offsets )
+            yield (self.buf, offsets + RECORD_HEADER_SIZE, caplen, ts, self.linktype)
+
+
+# read a pcap or pcapng file, which might be compressed, in streaming fashion
+#  only READ_SIZE bytes and a chunk of records are kept in memory
+class PcapStream(_Reader):
+    def __init__(self, inputfile):
+        self.file = _open_file( inputfile )
+        self.pending = b""
+        try:
+            magic = self._read( 4 )
+            if len(magic) < 4:
+                raise ValueError("not a pcap file", inputfile)
+
+            (magic_le,) = struct.unpack( "<I", magic )
+            (magic_be,) = struct.unpack( ">I", magic )
+            if magic_le == PCAPNG_MAGIC:
+                self.is_pcapng = True
+            elif magic_le in MAGIC_NUMBERS or magic_be in MAGIC_NUMBERS:
+                self.is_pcapng = False
+                self.endian = "<" if magic_le in MAGIC_NUMBERS else ">"
+                self.resolution = MAGIC_NUMBERS[ magic_le if magic_le in MAGIC_NUMBERS else magic_be ]
+                header = magic + self._read( GLOBAL_HEADER_SIZE - 4 )
+                if len(header) < GLOBAL_HEADER_SIZE:
+                    raise ValueError("not a pcap file", inputfile)
+                (self.linktype,) = struct.unpack_from( self.endian + "I", header, 20 )
+                self.linktype &= 0xFFFF
+                if self.linktype not in SUPPORTED_LINKTYPES:
+                    raise ValueError("unsupported link type", self.linktype)
+            else:
+                raise ValueError("not a pcap file", inputfile)
+            self.pending = magic if self.is_pcapng else b""
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        self.file.close()
+
+    def _read(self, n):
+        return self.file.read( n )
+
+    # yield blocks of bytes, each block contains the remaining bytes of the previous one
+    #  which have not been consumed
+    def _blocks(self):
+        while True:
+            data = self._read( READ_SIZE )
+            if len(data) == 0:
+                return
+            self.pending = self.pending + data
+            yield self.pending
+
+    def _chunks(self, chunk_size = CHUNK_SIZE):
+        if self.is_pcapng:
+            yield from self._pcapng_chunks( chunk_size )
+        else:
+            yield from self._pcap_chunks( chunk_size )
+
+    # build a chunk from the records which are in the buffer `block`
+    def _chunk(self, block, data, caplen, ts, linktype):
+        buf = np.frombuffer( block, dtype=np.uint8 )
+        return (buf, np.array( data, dtype=np.int64 ), np.array( caplen, dtype=np.int64 ),
+            np.array( ts, dtype=np.int64 ), linktype if np.ndim( linktype ) == 0 else np.array( linktype ))
+
+    def _pcap_chunks(self, chunk_size):
+        unpack = struct.Struct( self.endian + "IIII" ).unpack_from
+        resolution = self.resolution
+        for block in self._blocks():
+            offset = 0
+            data, caplens, tss = [], [], []
+            while offset + RECORD_HEADER_SIZE <= len(block):
+                (sec, frac, caplen, wirelen) = unpack( block, offset )
+                if offset + RECORD_HEADER_SIZE + caplen > len(block):
+                    break
+                data.append( offset + RECORD_HEADER_SIZE )
+                caplens.append( caplen )
+                tss.append( sec * 1000000000 + frac * resolution )
+                offset += RECORD_HEADER_SIZE + caplen
+                if len(data) == chunk_size:
+                    yield self._chunk( block, data, caplens, tss, self.linktype )
+                    data, caplens, tss = [], [], []
+
+            if len(data) > 0:
+                yield self._chunk( block, data, caplens, tss, self.linktype )
+            self.pending = block[ offset: ]
+
+    # parse options of an Interface Description Block to get its timestamp resolution
+    #  return (multiplier, divisor) to convert a timestamp to nanosecond
+    def _tsresol(self, block, offset, end, endian):
+        while offset + 4 <= end:
+            (code, length) = struct.unpack_from( endian + "HH", block, offset )
+            if code == 0: # end of options
+                break
+            if code == PCAPNG_OPT_TSRESOL and length >= 1:
+                v = block[ offset + 4 ]
+                if v & 0x80:
+                    return (1000000000, 2 ** (v & 0x7F))
+                if v <= 9:
+                    return (10 ** (9 - v), 1)
+                return (1, 10 ** (v - 9))
+            offset += 4 + ((length + 3) & ~3)
+        # default resolution is microsecond
+        return (1000, 1)
+
+    def _pcapng_chunks(self, chunk_size):
+        endian = "<"
+        # for each interface: (link type, multiplier, divisor)
+        interfaces = []
+        for block in self._blocks():
+            offset = 0
+            data, caplens, tss, linktypes = [], [], [], []
+            while offset + 12 <= len(block):
+                (block_type,) = struct.unpack_from( "<I", block, offset )
+                if block_type == PCAPNG_MAGIC:
+                    # a new section, its byte order is given by the byte-order magic
+                    (bom,) = struct.unpack_from( "<I", block, offset + 8 )
+                    endian = "<" if bom == PCAPNG_BYTE_ORDER else ">"
+                (block_type, length) = struct.unpack_from( endian + "II", block, offset )
+                if length < 12 or offset + length > len(block):
+                    break
+
+                if block_type == PCAPNG_MAGIC:
+                    interfaces = []
+                elif block_type == PCAPNG_IDB:
+                    (linktype, reserved, snaplen) = struct.unpack_from( endian + "HHI", block, offset + 8 )
+                    (mul, div) = self._tsresol( block, offset + 16, offset + length - 4, endian )
+                    interfaces.append( (linktype, mul, div) )
+                elif block_type == PCAPNG_EPB:
+                    (if_id, ts_high, ts_low, caplen) = struct.unpack_from( endian + "IIII", block, offset + 8 )
+                    (linktype, mul, div) = interfaces[ if_id ]
+                    data.append( offset + 28 )
+                    caplens.append( min( caplen, length - 32 ))
+                    tss.append( (((ts_high << 32) | ts_low) * mul) // div )
+                    linktypes.append( linktype )
+                elif block_type == PCAPNG_SPB:
+                    # no timestamp in a simple packet block
+                    pass
+
+                offset += length
+                if len(data) == chunk_size:
+                    yield self._chunk( block, data, caplens, tss, linktypes )
+                    data, caplens, tss, linktypes = [], [], [], []
+
+            if len(data) > 0:
+                yield self._chunk( block, data, caplens, tss, linktypes )
+            self.pending = block[ offset: ]
+
+
+# open a file, decompress it on the fly if needed
+def _open_file( inputfile ):
+    if inputfile.endswith(".gz"):
+        return gzip.open( inputfile, 'rb' )
+    if inputfile.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("zstandard module is required to read", inputfile)
+        return zstandard.ZstdDecompressor().stream_reader( open( inputfile, 'rb' ), closefd=True )
+    return open( inputfile, 'rb' )
+
+# is the file compressed or pcapng, i.e., it cannot be memory-mapped?
+def is_stream( inputfile ):
+    if inputfile.endswith(".gz") or inputfile.endswith(".zst"):
+        return True
+    with open( inputfile, 'rb' ) as f:
+        magic = f.read( 4 )
+    return len(magic) == 4 and struct.unpack( "<I", magic )[0] == PCAPNG_MAGIC
+
+# is the file a capture file which can be read, given its extension?
+def is_capture( inputfile ):
+    return any( inputfile.endswith( ext ) for ext in PCAP_EXTS )
+
+
+# open a capture file to read its records natively
+#  return None if the file cannot be read natively, e.g., unsupported link type
+def open_pcap( inputfile ):
+    try:
+        if is_stream( inputfile ):
+            return PcapStream( inputfile )
+        return PcapFile( inputfile )
+    except ValueError:
+        return None
@@ -1,22 +1,29 @@
 #!/usr/bin/env python3
 
-# Valid X again a DecisionTreeClassifier.
+# Valid X again a decision tree model (see tree_model.py).
 # and explain its decision paths
+#
+# The rule of each leaf, i.e., the bounds of the features of its path, is computed once,
+#  then the explanation of a row is the rule of the leaf it reaches.
+#
+# With `-d`, every misclassified row of a dataset is explained, e.g.,
+#  ./predict.py -d ./pcaps/validation.store -o ./pcaps/misclassified.csv
 
-import pandas as pd
 import argparse
-from sklearn.tree import DecisionTreeClassifier
-import json 
+import csv, json, sys
+import numpy as np
+import feature_store, tree_model
 
 parser = argparse.ArgumentParser()
 
 # Add argument
-parser.add_argument('-i', default="./pcaps/dt.model", help='path to the input model')
+parser.add_argument('-i', default=tree_model.MODEL_FILE, help='path to the input model')
 parser.add_argument('-v', default="[[93500,46],[93501,64]]", help='X to predict')
+parser.add_argument('-d', help='path to csv. dataset or .store directory whose misclassified rows are explained, instead of -v')
+parser.add_argument('-o', help='path to output csv file of the misclassified rows with -d, default: stdout')
 
 args = parser.parse_args()
 inputfile  = args.i
-X = json.loads( args.v )
 
 CLASS_LABLES = {
    0: "unknown",
@@ -25,47 +32,63 @@ CLASS_LABLES = {
    3: "webex"
 }
 
-# structure of model: DecisionTreeClassifier
-# https://scikit-learn.org/stable/auto_examples/tree/plot_unveil_tree_structure.html#sphx-glr-auto-examples-tree-plot-unveil-tree-structure-py
-dt = pd.read_pickle( inputfile )
-feature = dt.tree_.feature
-threshold = dt.tree_.threshold
+# structure of model: see tree_model.py
+dt = tree_model.load( inputfile )
 
-val = dt.predict( X )
-print("Prediction:", [CLASS_LABLES[i] for i in val])
+# models keep names of their classes (see map.json)
+for (c, name) in zip( dt.classes, dt.class_names ):
+    if name:
+        CLASS_LABLES[ int(c) ] = name
 
-# https://scikit-learn.org/stable/auto_examples/tree/plot_unveil_tree_structure.html#decision-path
+def label( c ):
+    return CLASS_LABLES.get( c, str(c) )
 
-#print(dt.decision_path(X))
-node_indicator = dt.decision_path(X)
-leaf_id = dt.apply(X)
+# text of the rule of a leaf
+def format_conditions( rule ):
+    return " and ".join( rule ) if len(rule) > 0 else "always"
 
-for sample_id in range(0, len(X)):
-    # obtain ids of the nodes `sample_id` goes through, i.e., row `sample_id`
-    node_index = node_indicator.indices[
-        node_indicator.indptr[sample_id] : node_indicator.indptr[sample_id + 1]
-    ]
-    
-    print("Rules used to predict sample {id}: {pred}".format(id=sample_id, pred=CLASS_LABLES[val[sample_id]]))
-    for node_id in node_index:
-        # continue to the next node if it is a leaf node
-        if leaf_id[sample_id] == node_id:
-            continue
-    
-        # check if value of the split feature for sample 0 is below threshold
-        if X[sample_id][feature[node_id]] <= threshold[node_id]:
-            threshold_sign = "<="
-        else:
-            threshold_sign = ">"
-    
-        print(
-            " - decision node {node} : (X[{sample}, {feature}] = {value}) "
-            "{inequality} {threshold})".format(
-                node=node_id,
-                sample=sample_id,
-                feature=feature[node_id],
-                value=X[sample_id][feature[node_id]],
-                inequality=threshold_sign,
-                threshold=threshold[node_id],
-            )
-    )
\ No newline at end of file
+# text of the rule of a leaf, or of the rules of the leaves of an ensemble
+def format_rule( rule ):
+    if isinstance( dt, tree_model.Ensemble ):
+        return " | ".join( "tree {0}: {1}".format( i, format_conditions( r )) for (i, r) in enumerate( rule ))
+    return format_conditions( rule )
+
+if args.d is None:
+    X = np.asarray( json.loads( args.v ))
+    val = dt.predict( X )
+    print("Prediction:", [label( i ) for i in val.tolist()])
+
+    rules = dt.explain( X )
+    for sample_id in range(0, len(X)):
+        print("Rules used to predict sample {id}: {pred}".format(id=sample_id, pred=label( val[sample_id] )))
+        for (i, rule) in enumerate( rules[ sample_id ] if isinstance( dt, tree_model.Ensemble ) else [rules[ sample_id ]] ):
+            if isinstance( dt, tree_model.Ensemble ):
+                print(" tree {0}:".format( i ))
+            for condition in rule:
+                print(" - {0}".format( condition ))
+else:
+    (X, Y) = feature_store.load_xy( args.d )
+    X = np.asarray( X )
+    Y = np.asarray( Y )
+    val = dt.predict( X )
+    rows = np.flatnonzero( val != Y )
+    print("{0} misclassified rows out of {1}".format( len(rows), len(Y) ), file=sys.stderr)
+
+    # format each distinct class and rule once
+    classes = np.union1d( Y[ rows ], val[ rows ] )
+    labels  = np.array( [label( c ) for c in classes.tolist()], dtype=object )
+    rules = dt.explain( X[ rows ] )
+    if isinstance( dt, tree_model.Ensemble ):
+        rules = [tuple( r ) for r in rules]
+    texts = {}
+    for rule in rules:
+        if rule not in texts:
+            texts[ rule ] = format_rule( rule )
+
+    f = open( args.o, 'w', newline='' ) if args.o else sys.stdout
+    writer = csv.writer( f )
+    writer.writerow( ["row", "class", "prediction", "rule"] )
+    writer.writerows( zip( rows.tolist(), labels[ np.searchsorted( classes, Y[ rows ] )], labels[ np.searchsorted( classes, val[ rows ] )],
+        map( texts.__getitem__, rules )))
+    if args.o:
+        f.close()
@@ -1,46 +1,119 @@
 #!/usr/bin/env python3
 
-# Valid a csv file againt a decision tree model
+# Valid a csv file (or a columnar feature store, see feature_store.py) againt a decision tree model
 # The csv file is structured identically as the one being used to train the model, e.g.,:
 #  - the first n columns contain features (X)
 #  - the last column contain classification (Y)
+#
+# The file is read by blocks of rows which are predicted at once, thus memory usage does not depend
+#  on the number of rows, e.g., of logs/predict.csv after a long run of the controller.
+# It reports the accuracy, the confusion matrix, the precision/recall/F1 of each class and the throughput, e.g.,
+#  ./predict_file.py -v ../bmv2/logs/predict.csv --batch-size 1000000 --report ./pcaps/predict.json
 
 import numpy as np
-import pandas as pd
-import argparse
-from sklearn.tree import DecisionTreeClassifier
-
-parser = argparse.ArgumentParser()
-
-# Add argument
-parser.add_argument('-i', default="./pcaps/dt.model", help='path to the input model')
-parser.add_argument('-v', default="../bmv2/logs/predict.csv", help='path to csv file to validate')
-
-args = parser.parse_args()
-inputfile  = args.i
-testfile   = args.v
-
-# structure of model: DecisionTreeClassifier
-# https://scikit-learn.org/stable/auto_examples/tree/plot_unveil_tree_structure.html#sphx-glr-auto-examples-tree-plot-unveil-tree-structure-py
-dt = pd.read_pickle( inputfile )
-
-# Training set X and Y
-csv  = pd.read_csv( testfile )
-data = csv.values.tolist()
-X = [i[0:-1] for i in data] #the columns before the last one are features
-Y = [i[-1]   for i in data] #last column is "classification"
-
-#print(X[0], Y[0])
-#print(X[-1], Y[-1])
-
-# prepare testing set
-X = np.array(X)
-Y = np.array(Y)
-
-# ignore the first line as it is unknown since no IAT
-if Y[0] == 0:
-    X = X[1:]
-    Y = Y[1:]
-# see https://scikit-learn.org/stable/modules/generated/sklearn.tree.DecisionTreeClassifier.html#sklearn.tree.DecisionTreeClassifier.score
-# print the mean accuracy on the given test data (X) and labels (Y).
-print("Score", dt.score(X,Y))
\ No newline at end of file
+import argparse, json, sys, time
+import feature_store, tree_model
+
+# number of rows predicted at once
+BATCH_SIZE = 1 << 18
+
+
+# confusion matrix which grows with the classes met in the rows
+class Confusion:
+    def __init__(self, classes):
+        self.classes = np.unique( np.asarray( classes, dtype=np.int64 ))
+        self.matrix  = np.zeros( (len(self.classes), len(self.classes)), dtype=np.int64 )
+
+    # count rows of classification Y predicted as P
+    def add(self, Y, P):
+        values = np.union1d( Y, P )
+        new    = np.setdiff1d( values, self.classes )
+        if len(new) > 0:
+            classes = np.union1d( self.classes, new )
+            matrix  = np.zeros( (len(classes), len(classes)), dtype=np.int64 )
+            index   = np.searchsorted( classes, self.classes )
+            matrix[ np.ix_( index, index ) ] = self.matrix
+            (self.classes, self.matrix) = (classes, matrix)
+        k = len(self.classes)
+        cells = np.searchsorted( self.classes, Y ) * k + np.searchsorted( self.classes, P )
+        self.matrix += np.bincount( cells, minlength=k*k ).reshape( k, k )
+
+    def nb_rows(self):
+        return int( self.matrix.sum() )
+
+    def accuracy(self):
+        return float( np.trace( self.matrix ) / max( 1, self.nb_rows() ))
+
+    # precision, recall, F1 score and support of each class
+    def metrics(self):
+        tp        = np.diag( self.matrix ).astype( np.float64 )
+        predicted = self.matrix.sum( axis=0 )
+        support   = self.matrix.sum( axis=1 )
+        precision = np.divide( tp, predicted, out=np.zeros_like( tp ), where=predicted > 0 )
+        recall    = np.divide( tp, support,   out=np.zeros_like( tp ), where=support > 0 )
+        f1        = np.divide( 2 * precision * recall, precision + recall, out=np.zeros_like( tp ), where=(precision + recall) > 0 )
+        return (precision, recall, f1, support)
+
+
+# predict the rows of a csv file or a store by blocks of `batch_size` rows
+#  return the Confusion of the classification column (rows) and the predictions (columns), and the duration
+def score( dt, path, batch_size = BATCH_SIZE ):
+    confusion = Confusion( dt.classes )
+    start = time.perf_counter()
+    first = True
+    for results in feature_store.iter_batches( path, batch_size ):
+        names = results.dtype.names
+        X = np.column_stack( [results[ name ] for name in names[0:-1]] )
+        Y = results[ names[-1] ]
+        # ignore the first line as it is unknown since no IAT
+        if first and len(Y) > 0 and Y[0] == 0:
+            X = X[1:]
+            Y = Y[1:]
+        first = False
+        confusion.add( Y, dt.predict( X ))
+    return (confusion, time.perf_counter() - start)
+
+def print_report( confusion, duration, dt ):
+    names = [dt.class_name( c ) for c in confusion.classes.tolist()]
+    width = max( [8] + [len(n) for n in names] )
+    (precision, recall, f1, support) = confusion.metrics()
+    print("rows: {0}, {1:.1f} s, {2:.0f} rows/s".format( confusion.nb_rows(), duration, confusion.nb_rows() / max( duration, 1e-9 )))
+    print("  {0:>{w}} {1:>9} {2:>9} {3:>9} {4:>12}".format( "class", "precision", "recall", "f1", "support", w=width ))
+    for (i, name) in enumerate( names ):
+        print("  {0:>{w}} {1:9.4f} {2:9.4f} {3:9.4f} {4:12}".format( name, precision[i], recall[i], f1[i], support[i], w=width ))
+    print("  confusion (rows: classification of the file, columns: prediction of the model):")
+    print("  {0:>{w}} ".format( "", w=width ) + " ".join( "{0:>12}".format( n[0:12] ) for n in names ))
+    for (name, row) in zip( names, confusion.matrix.tolist() ):
+        print("  {0:>{w}} ".format( name, w=width ) + " ".join( "{0:12}".format( v ) for v in row ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', default=tree_model.MODEL_FILE, help='path to the input model')
+    parser.add_argument('-v', default="../bmv2/logs/predict.csv", help='path to csv file or .store directory to validate')
+    parser.add_argument('--batch-size', default=BATCH_SIZE, type=int, help='number of rows read and predicted at once')
+    parser.add_argument('--report', help='path to output json file containing the metrics')
+
+    args = parser.parse_args()
+    inputfile  = args.i
+    testfile   = args.v
+
+    # structure of model: see tree_model.py
+    dt = tree_model.load( inputfile )
+
+    (confusion, duration) = score( dt, testfile, args.batch_size )
+    if confusion.nb_rows() == 0:
+        sys.exit("no row to validate in " + testfile)
+    print_report( confusion, duration, dt )
+    # print the mean accuracy on the given test data (X) and labels (Y).
+    print("Score", confusion.accuracy())
+
+    if args.report:
+        (precision, recall, f1, support) = confusion.metrics()
+        print("write report to", args.report)
+        with open( args.report, "w" ) as f:
+            json.dump( {"rows": confusion.nb_rows(), "seconds": duration, "accuracy": confusion.accuracy(),
+                "classes": confusion.classes.tolist(), "precision": precision.tolist(), "recall": recall.tolist(),
+                "f1": f1.tolist(), "support": support.tolist(), "confusion": confusion.matrix.tolist()}, f, indent=3 )
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+# Prediction service which keeps the model in memory, instead of loading it at each run of predict.py.
+#
+# It listens on localhost by HTTP, or on a Unix socket, e.g.,
+#  ./predict_server.py -i ./pcaps/dt.npz --port 8000
+#  ./predict_server.py -i ./pcaps/dt.npz --unix /tmp/predict.sock
+#
+# Requests:
+#  - POST /predict, a batch of feature vectors, e.g., [iat, len, diffLen], either:
+#     + in json: {"X": [[93500, 46, 0], [93501, 64, 18]], "explain": true}
+#       the response is {"classes": [1, 3], "names": ["skype", "webex"], "explanations": [[...], [...]]}
+#       where the explanation of a vector is the rule of its leaf, i.e., a list of conditions on the features,
+#       (a list of rules, one per tree, for an ensemble)
+#     + in binary (Content-Type: application/octet-stream): the vectors as little-endian int64,
+#       the response is the classes as little-endian int64
+#  - GET /model: the file, the names of the features and of the classes, and the number of leaves of the model
+#
+# The model is reloaded when its file changes, e.g., after running train_model.py, without restarting the service.
+#
+# Client is a helper to send requests from a Python script, e.g.,
+#  Client("localhost:8000").predict( X )
+#
+
+import argparse, http.client, http.server, json, os, socket, socketserver, threading
+import numpy as np
+import tree_model
+
+BINARY_TYPE = "application/octet-stream"
+JSON_TYPE   = "application/json"
+
+
+# the model which is reloaded when its file changes
+class ModelHolder:
+    def __init__(self, path):
+        self.path  = path
+        self.lock  = threading.Lock()
+        self.model = None
+        self.mtime = None
+        self.get()
+        if self.model is None:
+            raise Exception("cannot load model", path)
+
+    def get(self):
+        try:
+            mtime = os.stat( self.path ).st_mtime_ns
+        except OSError:
+            # keep the current model while the file is being replaced
+            return self.model
+        if mtime != self.mtime:
+            with self.lock:
+                if mtime != self.mtime:
+                    try:
+                        model = tree_model.load( self.path )
+                        # compute the rules of the leaves once, before serving the model
+                        model.leaf_rules()
+                        self.model = model
+                        self.mtime = mtime
+                        print("load model", self.path)
+                    except Exception as e:
+                        print("cannot load model, keep the current one:", e)
+        return self.model
+
+
+class PredictHandler(http.server.BaseHTTPRequestHandler):
+    # the ModelHolder, set by serve()
+    holder = None
+    quiet  = False
+
+    def address_string(self):
+        # a Unix socket has no client address
+        return self.client_address[0] if isinstance( self.client_address, tuple ) else "unix"
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message( format, *args )
+
+    def _send(self, code, body, content_type = JSON_TYPE):
+        if content_type == JSON_TYPE:
+            body = json.dumps( body ).encode()
+        self.send_response( code )
+        self.send_header( "Content-Type", content_type )
+        self.send_header( "Content-Length", str( len(body) ))
+        self.end_headers()
+        self.wfile.write( body )
+
+    def do_GET(self):
+        if self.path != "/model":
+            return self._send( 404, {"error": "unknown path"} )
+        model = self.holder.get()
+        self._send( 200, {"file": self.holder.path, "features": model.feature_names, "classes": model.classes.tolist(),
+            "class_names": model.class_names, "leaves": model.get_n_leaves()} )
+
+    def do_POST(self):
+        if self.path != "/predict":
+            return self._send( 404, {"error": "unknown path"} )
+        body  = self.rfile.read( int( self.headers.get( "Content-Length", 0 )))
+        model = self.holder.get()
+        nb_features = len(model.feature_names)
+        try:
+            if self.headers.get( "Content-Type" ) == BINARY_TYPE:
+                X = np.frombuffer( body, dtype="<i8" ).reshape( -1, nb_features )
+                return self._send( 200, model.predict( X ).astype( "<i8" ).tobytes(), BINARY_TYPE )
+
+            request = json.loads( body )
+            X = np.asarray( request["X"], dtype=np.int64 ).reshape( -1, nb_features )
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send( 400, {"error": "bad request: {0}".format( e )} )
+
+        classes  = model.predict( X )
+        response = {"classes": classes.tolist(), "names": [model.class_name( c ) for c in classes.tolist()]}
+        if request.get( "explain" ):
+            response["explanations"] = model.explain( X ).tolist()
+        self._send( 200, response )
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve( model_file, port = None, unix_socket = None, quiet = False ):
+    PredictHandler.holder = ModelHolder( model_file )
+    PredictHandler.quiet  = quiet
+    if unix_socket is not None:
+        if os.path.exists( unix_socket ):
+            os.remove( unix_socket )
+        server = UnixHTTPServer( unix_socket, PredictHandler )
+        print("listen on", unix_socket)
+    else:
+        server = http.server.ThreadingHTTPServer( ("127.0.0.1", port), PredictHandler )
+        print("listen on 127.0.0.1:{0}".format( port ))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if unix_socket is not None and os.path.exists( unix_socket ):
+            os.remove( unix_socket )
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__( "localhost" )
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        self.sock.connect( self.path )
+
+# send requests to the service, the connection is kept between requests
+#  address: "host:port" or the path of a Unix socket
+class Client:
+    def __init__(self, address):
+        if os.path.sep in address or not ":" in address:
+            self.conn = _UnixConnection( address )
+        else:
+            (host, port) = address.rsplit( ":", 1 )
+            self.conn = http.client.HTTPConnection( host, int(port) )
+
+    def _request(self, method, path, body = None, content_type = JSON_TYPE):
+        headers = {"Content-Type": content_type} if body is not None else {}
+        self.conn.request( method, path, body, headers )
+        response = self.conn.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise Exception("request failed", response.status, data.decode())
+        return data
+
+    # get the classes of the rows of X
+    def predict(self, X):
+        X = np.ascontiguousarray( X, dtype="<i8" )
+        return np.frombuffer( self._request( "POST", "/predict", X.tobytes(), BINARY_TYPE ), dtype="<i8" )
+
+    # get the classes, their names and the explanations of the rows of X
+    def explain(self, X):
+        body = json.dumps( {"X": np.asarray( X ).tolist(), "explain": True} )
+        return json.loads( self._request( "POST", "/predict", body ))
+
+    def info(self):
+        return json.loads( self._request( "GET", "/model" ))
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', default=tree_model.MODEL_FILE, help='path to the input model')
+    parser.add_argument('--port', default=8000, type=int, help='port on localhost')
+    parser.add_argument('--unix', help='path to a Unix socket to listen on, instead of a port')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not log the requests')
+    args = parser.parse_args()
+
+    try:
+        serve( args.i, args.port, args.unix, args.quiet )
+    except KeyboardInterrupt:
+        pass
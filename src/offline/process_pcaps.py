@@ -1,10 +1,28 @@
 #!/usr/bin/env python3
 
 # Extract features from the pcap files in this folder
+#  pcapng and compressed files are also processed (see pcap_reader.PCAP_EXTS)
+#
+# With `--jobs N`, each pcap file is extracted by a worker process into its own shard,
+#  then the shards are merged in the same order as a serial run,
+#  thus the output is identical to the one of a serial run.
+#
+# With `--cache`, the features of each pcap file are kept in a sidecar file in <folder>/.cache
+#  which is named by the hash of the pcap content, the extractor version and the extracted features.
+#  Only new or changed pcap files are then extracted, the others are read from their sidecars.
+#
+# With `--rules`, the pcap files are mixed captures whose packets are labeled by rules (see labeling.py)
+#  instead of by the file names. Their features are computed per flow.
+#
+# With `--sample K`, at most K rows of each class are kept by using reservoir sampling (see sampling.py),
+#  thus the size of the output is bounded whatever the size of the pcap files.
 #
 
-import sys, os, glob, json
+import sys, os, glob, json, argparse, shutil, tempfile, hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import extract_features as ef
+import feature_store, pcap_reader, window_stats, sampling, labeling
 
 # extract "skype" from "./skype.v1.pcap"
 def get_class_name( file_name ):
@@ -19,25 +37,211 @@ DIR     = os.path.join(__DIR__, "pcaps")
 
 OUTPUT_FILE = os.path.join(DIR, "features.csv")
 
-# clean the output file if it is existing
-if os.path.exists( OUTPUT_FILE ):
-    os.remove( OUTPUT_FILE )
 
-class_index = 0
-file_names = {}
+# assign a class index to each pcap file
+#  return a list of (file_name, class_index) and the map class_name => class_index
+def get_classes( files ):
+    class_index = 0
+    file_names = {}
+    result = []
+    for file_name in files:
+        class_name = get_class_name( file_name )
+
+        # remember index of this class_name
+        if not class_name in file_names:
+            class_index += 1
+            file_names[ class_name ] = class_index
+
+        # a class might have several pcap files which are not consecutive
+        result.append( (file_name, file_names[ class_name ]) )
+    return (result, file_names)
+
+
+# extract features of one pcap file
+#  classification is either a class index or a labeling.RuleIndex
+def extract_file( file_name, outputfile, classification, mode, window ):
+    if isinstance( classification, labeling.RuleIndex ):
+        print("processing {0}".format( file_name ))
+        ef.extract_flow_features_from_pcap( file_name, outputfile, classification, window=window )
+    else:
+        print("{0}. processing {1}".format( classification, file_name ))
+        ef.extract_features_from_pcap( file_name, outputfile, classification, mode, window=window )
+
+# extract features of one pcap file into its own shard file
+def extract_shard( task ):
+    (file_name, class_index, shard_file, mode, window) = task
+    extract_file( file_name, shard_file, class_index, mode, window )
+    return shard_file
 
-# for each pcap files
-for file_name in glob.glob('{0}/*.pcap'.format(DIR), recursive=True):
-    class_name = get_class_name( file_name )
+# concatenate the shards in order, keep the csv header only once
+def merge_shards( shard_files, outputfile ):
+    if feature_store.is_store( outputfile ):
+        for shard_file in shard_files:
+            if os.path.exists( shard_file ):
+                feature_store.append( outputfile, feature_store.load( shard_file ))
+        return
 
-    # remember index of this class_name
-    if not class_name in file_names:
-        class_index += 1
-        file_names[ class_name ] = class_index
+    out = None
+    try:
+        for shard_file in shard_files:
+            # no feature was extracted from this pcap file
+            if not os.path.exists( shard_file ):
+                continue
+            with open( shard_file, 'rb' ) as f:
+                header = f.readline()
+                if out is None:
+                    out = open( outputfile, 'wb' )
+                    out.write( header )
+                shutil.copyfileobj( f, out )
+    finally:
+        if out is not None:
+            out.close()
+
+
+# add the rows of the shards into a reservoir, in the same order as a serial run
+def sample_shards( shard_files, reservoir ):
+    for shard_file in shard_files:
+        if os.path.exists( shard_file ):
+            for results in feature_store.iter_batches( shard_file ):
+                reservoir.add( results )
+
+# write the sampled rows
+def write_sample( reservoir, outputfile ):
+    results = reservoir.results()
+    if results is not None:
+        feature_store.write( outputfile, results )
+
+
+# get path of the sidecar file which caches the features of a pcap file
+def get_sidecar( file_name, cache_dir, window = 0 ):
+    h = hashlib.sha256()
+    with open( file_name, 'rb' ) as f:
+        for block in iter( lambda: f.read( 1024*1024 ), b"" ):
+            h.update( block )
+    key = hashlib.sha256( "{0}-{1}-{2}".format( h.hexdigest(), ef.VERSION, window ).encode() ).hexdigest()
+    return os.path.join( cache_dir, key + ".npy" )
+
+# extract features of one pcap file into its sidecar file if it is not existing
+def extract_sidecar( task ):
+    (file_name, class_index, cache_dir, window) = task
+    sidecar = get_sidecar( file_name, cache_dir, window )
+    if os.path.exists( sidecar ):
+        print("{0}. cached {1}".format( class_index, file_name ))
+        return sidecar
 
     print("{0}. processing {1}".format( class_index, file_name ))
-    ef.extract_features_from_pcap( file_name, OUTPUT_FILE, class_index )
+    # the class is set when merging the sidecars as class indices might change between runs
+    results = ef.extract_features_array( file_name, 0 )
+    if window > 0:
+        results = window_stats.add_window_stats_array( results, window_stats.WindowStats( window ), ef.get_dtype( window ))
+
+    # write to a temporary file first to avoid leaving a truncated sidecar
+    tmp_file = sidecar + ".{0}.tmp".format( os.getpid() )
+    with open( tmp_file, 'wb' ) as f:
+        np.save( f, results )
+    os.replace( tmp_file, sidecar )
+    return sidecar
+
+def process_pcaps_cached( tasks, outputfile, jobs, cache_dir, window = 0, reservoir = None ):
+    os.makedirs( cache_dir, exist_ok=True )
+    sidecar_tasks = [(file_name, class_index, cache_dir, window) for (file_name, class_index) in tasks]
+
+    if jobs <= 1:
+        sidecars = [extract_sidecar( t ) for t in sidecar_tasks]
+    else:
+        with ProcessPoolExecutor( max_workers=jobs ) as executor:
+            sidecars = list( executor.map( extract_sidecar, sidecar_tasks ))
+
+    for ((file_name, class_index), sidecar) in zip( tasks, sidecars ):
+        if reservoir is None:
+            results = np.load( sidecar )
+            results["class"] = class_index
+            ef.write_array( results, outputfile )
+            continue
+
+        # read the sidecar by batches to keep the memory usage bounded
+        sidecar_results = np.load( sidecar, mmap_mode="r" )
+        for start in range( 0, len(sidecar_results), ef.BATCH_SIZE ):
+            results = np.array( sidecar_results[ start : start + ef.BATCH_SIZE ] )
+            results["class"] = class_index
+            reservoir.add( results )
+
+    if reservoir is not None:
+        write_sample( reservoir, outputfile )
+
+    # remove the sidecars of the pcap files which have been changed or removed
+    for file_name in os.listdir( cache_dir ):
+        path = os.path.join( cache_dir, file_name )
+        if file_name.endswith(".npy") and path not in sidecars:
+            os.remove( path )
+
+
+def process_pcaps( tasks, outputfile, mode, jobs, window = 0, reservoir = None ):
+    if jobs <= 1 and reservoir is None:
+        for (file_name, class_index) in tasks:
+            extract_file( file_name, outputfile, class_index, mode, window )
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # shards have the same format as the output, or are stores when they are sampled
+        ext = feature_store.STORE_EXT if feature_store.is_store( outputfile ) or reservoir is not None else ".csv"
+        shards = [(file_name, class_index, os.path.join(tmp_dir, "{0}{1}".format(i, ext)), mode, window)
+                    for i, (file_name, class_index) in enumerate(tasks)]
+
+        if jobs <= 1:
+            shard_files = [extract_shard( shard ) for shard in shards]
+        else:
+            with ProcessPoolExecutor( max_workers=jobs ) as executor:
+                # map keeps the order of the tasks
+                shard_files = list( executor.map( extract_shard, shards ))
+
+        if reservoir is None:
+            merge_shards( shard_files, outputfile )
+        else:
+            sample_shards( shard_files, reservoir )
+            write_sample( reservoir, outputfile )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-d', default=DIR, help='path to the folder containing pcap files')
+    parser.add_argument('-j', '--jobs', default=1, type=int, help='number of worker processes')
+    parser.add_argument('-m', default="memory", choices=ef.MODES, help='extraction mode')
+    parser.add_argument('-o', default=OUTPUT_FILE, help='path to the output .csv file or .store directory')
+    parser.add_argument('-c', '--cache', action='store_true', help='extract only new or changed pcap files, cache features in <folder>/.cache')
+    parser.add_argument('--features', default="basic", choices=ef.FEATURE_SETS.keys(), help='set of features to extract')
+    parser.add_argument('-w', '--window', default=window_stats.WINDOW_SIZE, type=int, help='number of packets of the window statistics when using "--features window"')
+    parser.add_argument('-r', '--rules', help='path to a json file of rules to label the packets of mixed captures, instead of using file names')
+    parser.add_argument('-s', '--sample', default=0, type=int, help='keep at most this number of rows per class, 0 to keep all rows')
+    parser.add_argument('--seed', default=0, type=int, help='seed of the random generator used by sampling')
+    args = parser.parse_args()
+    if args.rules is not None and args.cache:
+        parser.error("--cache cannot be used with --rules")
+    window = args.window if args.features == "window" else 0
+
+    # clean the output file if it is existing
+    feature_store.remove( args.o )
+
+    # for each pcap files
+    files = [f for f in glob.glob('{0}/*'.format(args.d), recursive=True) if pcap_reader.is_capture( f )]
+    if args.rules is not None:
+        # all packets are labeled by the same rules
+        rules = labeling.load_rules( args.rules )
+        tasks = [(file_name, rules) for file_name in sorted( files )]
+        file_names = rules.classes
+    else:
+        (tasks, file_names) = get_classes( files )
+
+    reservoir = sampling.Reservoir( args.sample, args.seed ) if args.sample > 0 else None
+
+    if args.cache:
+        # features are cached as arrays thus they are extracted in "batch" mode
+        process_pcaps_cached( tasks, args.o, args.jobs, os.path.join( args.d, ".cache" ), window, reservoir )
+    else:
+        process_pcaps( tasks, args.o, args.m, args.jobs, window, reservoir )
 
-# write map class-index
-with open(os.path.join(DIR, "map.json"), "w") as outfile:
-    json.dump( file_names, outfile, indent=3, sort_keys=False)
\ No newline at end of file
+    # write map class-index
+    with open(os.path.join(args.d, "map.json"), "w") as outfile:
+        json.dump( file_names, outfile, indent=3, sort_keys=False)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Stratified reservoir sampling: keep at most K rows of each class, uniformly chosen among all its rows.
+#
+# Rows are read in a single pass and the memory usage is bounded by K rows per class,
+#  whatever the number of extracted rows. As each class has at most K rows,
+#  a tree which is trained on the sample is not skewed by the majority class.
+#
+# The reservoir of each class is filled by using the "Algorithm R" of Vitter:
+#  the j-th row (from 0) replaces a random row of the reservoir with probability K/(j+1).
+# It is applied on batches of rows by using numpy.
+#
+# This script can also sample an existing csv file or store, e.g.,
+#  ./sampling.py -i pcaps/features.store -o pcaps/sample.csv -k 100000
+#
+
+import argparse
+import numpy as np
+import feature_store
+
+# default number of rows to keep per class
+SAMPLE_SIZE = 100000
+
+
+class Reservoir:
+    def __init__(self, k = SAMPLE_SIZE, seed = 0):
+        self.k    = k
+        self.rng  = np.random.default_rng( seed )
+        # class => rows of its reservoir
+        self.samples = {}
+        # class => number of rows seen so far
+        self.seen    = {}
+
+    # add a structured array having a "class" column
+    def add(self, results):
+        classes = results["class"]
+        for c in np.unique( classes ).tolist():
+            self._add_class( c, results[ classes == c ] )
+
+    def _add_class(self, c, rows):
+        if c not in self.samples:
+            self.samples[ c ] = np.empty( self.k, dtype=rows.dtype )
+            self.seen[ c ]    = 0
+        sample = self.samples[ c ]
+        n      = self.seen[ c ]
+        self.seen[ c ] = n + len(rows)
+
+        # fill the reservoir first
+        fill = max( 0, min( self.k - n, len(rows) ))
+        sample[ n : n + fill ] = rows[ 0 : fill ]
+        rows = rows[ fill : ]
+        if len(rows) == 0:
+            return
+
+        # index of each row among all rows of this class
+        j = np.arange( n + fill, n + fill + len(rows) )
+        slots = self.rng.integers( 0, j + 1 )
+        kept  = np.flatnonzero( slots < self.k )
+        # rows replace the slots in order, thus the last row of a slot wins
+        (slots, last) = np.unique( slots[ kept ][::-1], return_index=True )
+        sample[ slots ] = rows[ kept[::-1][ last ] ]
+
+    # get the sampled rows, ordered by class
+    def results(self):
+        samples = [self.samples[ c ][ 0 : min( self.k, self.seen[ c ] ) ] for c in sorted( self.samples )]
+        if len(samples) == 0:
+            return None
+        return np.concatenate( samples )
+
+
+# sample a csv file or a store, then write the sample into another one
+def sample_file( inputfile, outputfile, k = SAMPLE_SIZE, seed = 0 ):
+    reservoir = Reservoir( k, seed )
+    for results in feature_store.iter_batches( inputfile ):
+        reservoir.add( results )
+
+    results = reservoir.results()
+    if results is not None:
+        feature_store.write( outputfile, results )
+    return reservoir
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', required=True, help='path to the input csv file or store')
+    parser.add_argument('-o', required=True, help='path to the output csv file or store (' + feature_store.STORE_EXT + ')')
+    parser.add_argument('-k', default=SAMPLE_SIZE, type=int, help='maximum number of rows per class')
+    parser.add_argument('-s', '--seed', default=0, type=int, help='seed of the random generator')
+    args = parser.parse_args()
+
+    # overwrite the output
+    feature_store.remove( args.o )
+    reservoir = sample_file( args.i, args.o, args.k, args.seed )
+    for c in sorted( reservoir.seen ):
+        print("class {0}: keep {1} of {2} rows".format( c, min( args.k, reservoir.seen[ c ] ), reservoir.seen[ c ] ))
+    print("write output to", args.o)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Snap the split thresholds of a trained decision tree to integer boundaries.
+#
+# sklearn puts a threshold at the middle of 2 feature values, e.g., `len <= 85.5`, and compares
+#  the features as float32, e.g., an IAT of 33554433 ns is seen as 33554432.
+#  The switch compares integers, thus a threshold t is matched in the switch as `v <= int_bound(t)`
+#  where int_bound(t) is the greatest integer v such that float32(v) <= t.
+#
+# This pass replaces each threshold by an integer T which is exactly representable by sklearn,
+#  i.e., for all integers v, `float32(v) <= T` if and only if `v <= T`,
+#  thus the model and the table entries generated from it classify every packet the same way.
+#
+# With `align`, T is chosen such that the boundary T+1 is aligned to the greatest power of 2,
+#  as a range [lo, hi] having aligned bounds is expanded into less ternary/prefix entries.
+#  T is searched in the interval of values which keeps the partition of the training rows at this node.
+#  With `tolerance`, this interval is widened to let this fraction of the rows of the node
+#  go to the other side. The class distributions of the leaves are then updated.
+#
+# Thresholds are processed from the root, so the rows reaching a node are the ones of the snapped tree.
+#  A threshold moved beyond the bound of an ancestor leaves a branch that no row can reach,
+#  it is removed by tree_model.drop_unreachable_nodes once the tree is snapped.
+#
+# This script can also snap a saved model, e.g.,
+#  ./snap_thresholds.py -i pcaps/dt.npz -d pcaps/features.csv -o pcaps/dt.npz --align
+#
+
+import argparse
+import numpy as np
+import feature_store, tree_model
+from tree_model import int_bound
+
+# can the threshold `v <= t` be represented exactly by sklearn?
+def is_exact( t ):
+    return np.float32( t ) != np.float32( t + 1 )
+
+# get the integer threshold in [lo, hi] whose boundary is aligned to the greatest power of 2
+#  return None if no exact threshold is in [lo, hi]
+def aligned_threshold( lo, hi ):
+    for m in range(62, 0, -1):
+        step = 1 << m
+        # the smallest multiple of step which is greater than lo
+        t = ((lo + step) // step) * step - 1
+        if t > hi:
+            continue
+        if is_exact( t ):
+            return t
+    return None
+
+
+# snap the thresholds of a DecisionTreeClassifier (or a tree_model.TreeModel) in place,
+#  given its training rows X (and classes Y)
+#  return (number of changed thresholds, number of rows which are sent to another side)
+def snap( dt, X, Y = None, align = False, tolerance = 0.0 ):
+    tree = getattr( dt, "tree_", dt )
+    X    = np.asarray( X )
+    # sklearn compares features as float32
+    X32  = X.astype( np.float32 )
+    Xi   = X.astype( np.int64 )
+    nb_changed = 0
+    nb_moved   = 0
+
+    # (node, indices of the rows reaching this node)
+    stack = [(0, np.arange( len(X) ))]
+    while len(stack) > 0:
+        (node, rows) = stack.pop()
+        left  = tree.children_left[ node ]
+        right = tree.children_right[ node ]
+
+        # leaf node
+        if left == right:
+            if tolerance > 0 and Y is not None and len(rows) > 0:
+                _update_value( dt, node, np.asarray( Y )[ rows ] )
+            continue
+
+        feature   = tree.feature[ node ]
+        threshold = tree.threshold[ node ]
+        t = int_bound( threshold )
+        if align and len(rows) > 0:
+            is_left = X32[ rows, feature ] <= threshold
+            (lo, hi) = _window( Xi[ rows, feature ], is_left, t, tolerance )
+            aligned = aligned_threshold( lo, hi )
+            if aligned is not None:
+                t = aligned
+
+        new_threshold = np.float64( np.float32( t ))
+        if new_threshold != threshold:
+            nb_changed += 1
+        tree.threshold[ node ] = new_threshold
+
+        is_left = X32[ rows, feature ] <= new_threshold
+        if len(rows) > 0:
+            nb_moved += np.count_nonzero( is_left != (X32[ rows, feature ] <= threshold) )
+        stack.append( (left,  rows[  is_left ]) )
+        stack.append( (right, rows[ ~is_left ]) )
+
+    if isinstance( dt, tree_model.TreeModel ):
+        dt.clear_cache()
+    return (nb_changed, nb_moved)
+
+# get the interval [lo, hi] of integer thresholds which send at most `tolerance` of the rows to the other side
+#  at least one row is kept on each side
+def _window( values, is_left, t, tolerance ):
+    left_values  = np.sort( values[  is_left ] )[::-1]
+    right_values = np.sort( values[ ~is_left ] )
+    k = int( tolerance * len(values) )
+    lo = t
+    hi = t
+    if len(left_values) > 0:
+        lo = min( t, int( left_values[ min( k, len(left_values) - 1 ) ] ))
+    if len(right_values) > 0:
+        hi = max( t, int( right_values[ min( k, len(right_values) - 1 ) ] ) - 1 )
+    return (lo, hi)
+
+# set the class distribution of a leaf from the classes of the rows reaching it
+def _update_value( dt, node, classes ):
+    if isinstance( dt, tree_model.TreeModel ):
+        dt.leaf_class[ node ] = np.argmax( [np.count_nonzero( classes == c ) for c in dt.classes] )
+        return
+    counts = np.array( [np.count_nonzero( classes == c ) for c in dt.classes_], dtype=np.float64 )
+    value  = dt.tree_.value[ node, 0 ]
+    # recent versions of sklearn keep fractions instead of numbers of rows
+    if np.isclose( value.sum(), 1.0 ):
+        counts /= counts.sum()
+    dt.tree_.value[ node, 0 ] = counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', default=tree_model.MODEL_FILE, help='path to the input model')
+    parser.add_argument('-d', default="./pcaps/features.csv", help='path to the training csv file or .store directory')
+    parser.add_argument('-o', default=tree_model.MODEL_FILE, help='path to the output model')
+    parser.add_argument('--align', action='store_true', help='align the thresholds to powers of 2')
+    parser.add_argument('--tolerance', default=0.0, type=float, help='fraction of rows of a node which might go to the other side when aligning')
+    args = parser.parse_args()
+
+    dt = tree_model.load( args.i )
+    (X, Y) = feature_store.load_xy( args.d )
+
+    before = dt.predict( X )
+    (nb_changed, nb_moved) = snap( dt, X, Y, args.align, args.tolerance )
+    after = dt.predict( X )
+    print("{0} thresholds changed, {1} rows moved at their nodes, {2} predictions changed".format(
+        nb_changed, nb_moved, np.count_nonzero( before != after )))
+    (dt, nb_removed) = tree_model.drop_unreachable_nodes( dt )
+    print("{0} unreachable leaves removed".format( nb_removed ))
+
+    print("write model to", args.o)
+    tree_model.save( dt, args.o )
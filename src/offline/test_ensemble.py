@@ -0,0 +1,27 @@
+# The trees of an ensemble (see ensemble.py) are the ones fitted by sklearn, and boosting which stops early
+#  tells the number of trees the P4 program is compiled with.
+
+import numpy as np
+import ensemble
+
+
+def make_rows( n, seed = 0 ):
+    rng = np.random.default_rng( seed )
+    X = rng.integers( 0, 100, (n, 3) )
+    return (X, rng.integers( 1, 4, n ))
+
+def test_boost_stops_early( capsys ):
+    (X, Y) = make_rows( 500 )
+    # a single perfect tree
+    Y = np.where( X[:, 0] > 50, 1, 2 )
+    model = ensemble.fit( X, Y, "boost", 4, 8 )
+    assert len(model.trees) == len(model.weights) == 1
+    assert "NB_TREES=1" in capsys.readouterr().out
+    assert np.array_equal( model.predict( X ), Y )
+
+def test_forest_trees( capsys ):
+    (X, Y) = make_rows( 500 )
+    model = ensemble.fit( X, Y, "forest", 3, 16 )
+    assert len(model.trees) == 3
+    assert ensemble.pipeline_cost( model )["tables"] == 4
+    assert capsys.readouterr().out == ""
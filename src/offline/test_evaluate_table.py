@@ -0,0 +1,132 @@
+# The classification of the table entries (see evaluate_table.py) must be the one of a scan of the entries,
+#  and, for the entries generated from a model, the one of the model.
+
+import os, subprocess, sys
+import numpy as np
+import pytest
+import evaluate_table, feature_store, tree_model
+
+HERE = os.path.dirname( os.path.abspath( __file__ ))
+# the model of the repository, i.e., ./pcaps/dt.npz
+MODEL_FILE = os.path.join( HERE, tree_model.MODEL_FILE )
+
+
+def random_entries( n, nb_fields, rng ):
+    entries = []
+    for priority in rng.permutation( n ).tolist():
+        keys = []
+        for f in range( nb_fields ):
+            lo = int( rng.integers( 0, 1000 ))
+            keys.append( (lo, lo + int( rng.integers( 0, 400 ))) )
+        entries.append( (keys, [int( rng.integers( 1, 4 ))], priority + 1) )
+    return entries
+
+# index of the entry matching each row, the one of smallest priority value, -1 if none
+def scan( entries, X ):
+    order = sorted( range( len(entries) ), key=lambda i: entries[ i ][2] )
+    matches = []
+    for row in X.tolist():
+        match = -1
+        for i in order:
+            if all( lo <= v <= hi for (v, (lo, hi)) in zip( row, entries[ i ][0] )):
+                match = i
+                break
+        matches.append( match )
+    return matches
+
+@pytest.mark.parametrize( "max_cells", [evaluate_table.MAX_CELLS, 1] )
+def test_range_table_matches_scan( max_cells ):
+    rng = np.random.default_rng( 0 )
+    # 121^3 cells at most, thus a lookup array by default
+    entries = random_entries( 60, 3, rng )
+    table = evaluate_table.RangeTable( entries, max_cells )
+    assert (table.lookup is None) == (max_cells == 1)
+
+    X = rng.integers( 0, 1500, (3000, 3) )
+    expected = scan( entries, X )
+    # the entries of the table are sorted by priority
+    ranked = sorted( range( len(entries) ), key=lambda i: entries[ i ][2] )
+    assert [ranked[ e ] if e >= 0 else -1 for e in table.match( X ).tolist()] == expected
+    values = [entries[ e ][1][0] if e >= 0 else evaluate_table.NO_RESULT for e in expected]
+    assert table.lookup_values( X ).tolist() == values
+
+def test_parse_commands( tmp_path ):
+    commands = tmp_path / "commands.txt"
+    commands.write_text( "\n".join( [
+        "table_set_default MyIngress.ml_code set_result 0",
+        "table_add MyIngress.ml_code set_result 0->10 5->0x20 => 1 2",
+        "table_add MyIngress.ml_vote set_result 1 2 => 3",
+        ""] ))
+    tables = evaluate_table.parse_commands( str( commands ))
+    assert tables == {
+        "MyIngress.ml_code": [([(0, 10), (5, 32)], [1], 2)],
+        "MyIngress.ml_vote": [([1, 2], [3], None)],
+    }
+
+
+def generate( model_file, commands, options = [] ):
+    subprocess.run( [sys.executable, os.path.join( HERE, "generate_table_entries.py" ), "-i", model_file, "-o", commands, "--no-verify"] + options,
+        cwd=HERE, check=True, stdout=subprocess.DEVNULL )
+    return evaluate_table.parse_commands( commands )
+
+def random_rows( model, n, seed = 0 ):
+    rng = np.random.default_rng( seed )
+    (lo, hi) = model.trees[0].leaf_bounds() if isinstance( model, tree_model.Ensemble ) else model.leaf_bounds()
+    # values around the thresholds, within the domain
+    columns = []
+    for (f, name) in enumerate( model.feature_names ):
+        bounds = np.unique( np.concatenate( (lo[:, f], hi[:, f]) ))
+        bounds = bounds[ (bounds >= tree_model.DOMAIN[ name ]["min"]) & (bounds <= tree_model.DOMAIN[ name ]["max"]) ]
+        columns.append( np.clip( rng.choice( bounds, n ) + rng.integers( -1, 2, n ),
+            tree_model.DOMAIN[ name ]["min"], tree_model.DOMAIN[ name ]["max"] ))
+    X = np.column_stack( columns )
+    # the largest values of the match fields, e.g., an iat above 100 s
+    X[ 0:3, 0 ] = [100875888000, 2**40, tree_model.DOMAIN[ model.feature_names[0] ]["max"]]
+    X[ 3:6 ] = [tree_model.DOMAIN[ name ]["max"] for name in model.feature_names]
+    return X
+
+def test_pipeline_matches_tree( tmp_path ):
+    model = tree_model.load( MODEL_FILE )
+    pipeline = evaluate_table.Pipeline( generate( MODEL_FILE, str( tmp_path / "s1-commands.txt" )))
+    assert pipeline.get_n_entries() == model.get_n_leaves()
+
+    X = random_rows( model, 20000 )
+    assert not pipeline.misses( X ).any()
+    assert np.array_equal( pipeline.predict( X ), model.predict( X ))
+
+# the table of the repository is the one of its model, e.g., loaded by ../bmv2/controller.py
+def test_shipped_table():
+    model = tree_model.load( MODEL_FILE )
+    pipeline = evaluate_table.Pipeline( evaluate_table.parse_commands( os.path.join( HERE, "pcaps", "s1-commands.txt" )))
+    results = feature_store.load( os.path.join( HERE, "pcaps", "features.csv" ))
+    X = np.column_stack( [results[ name ] for name in results.dtype.names[0:-1]] )
+    assert not pipeline.misses( X ).any()
+    assert np.array_equal( pipeline.predict( X ), model.predict( X ))
+    X = random_rows( model, 20000, 2 )
+    assert np.array_equal( pipeline.predict( X ), model.predict( X ))
+
+def test_pipeline_matches_ensemble( tmp_path ):
+    dt = tree_model.load( MODEL_FILE )
+    model = tree_model.Ensemble( [dt, dt.prune( 40 ), dt.prune( 10 )], [1.0, 0.8, 0.5] )
+    model_file = str( tmp_path / ("ensemble" + tree_model.MODEL_EXT) )
+    tree_model.save( model, model_file )
+    pipeline = evaluate_table.Pipeline( generate( model_file, str( tmp_path / "s1-commands.txt" )))
+    assert len(pipeline.code) == 3
+
+    X = random_rows( model, 20000, 1 )
+    assert np.array_equal( pipeline.predict( X ), model.predict( X ))
+
+def test_budget( tmp_path ):
+    dt = tree_model.load( MODEL_FILE )
+    model = tree_model.Ensemble( [dt, dt.prune( 40 ), dt.prune( 10 )], [1.0, 0.8, 0.5] )
+    model_file = str( tmp_path / ("ensemble" + tree_model.MODEL_EXT) )
+    tree_model.save( model, model_file )
+    commands = str( tmp_path / "s1-commands.txt" )
+    generate( model_file, commands, ["--budget", "40"] )
+
+    evaluate = [sys.executable, os.path.join( HERE, "evaluate_table.py" ), "-i", model_file, "-c", commands]
+    # the entries are the ones of the pruned trees
+    assert subprocess.run( evaluate, cwd=HERE, stdout=subprocess.DEVNULL ).returncode == 1
+    assert subprocess.run( evaluate + ["--budget", "40"], cwd=HERE, stdout=subprocess.DEVNULL ).returncode == 0
+    verify = [sys.executable, os.path.join( HERE, "verify_table.py" ), "-i", model_file, "-c", commands, "--budget", "40"]
+    assert subprocess.run( verify, cwd=HERE, stdout=subprocess.DEVNULL ).returncode == 0
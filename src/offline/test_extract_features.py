@@ -0,0 +1,47 @@
+# The vectorized extraction (batch mode) must give exactly the rows of the per-packet one (see compute_features).
+
+from scapy.all import rdpcap
+import extract_features as ef, pcap_reader
+
+
+def serial_rows( ts, ip_len, classification ):
+    return list( ef.compute_features( zip( ts, ip_len ), classification ))
+
+def array_rows( results ):
+    return [tuple( r ) for r in results.tolist()]
+
+
+def test_batch_matches_serial( random_packets ):
+    (ts, ip_len) = random_packets( 5000 )
+    # nanosecond, as given by the readers
+    ts = [t * 1000 for t in ts]
+    assert array_rows( ef.compute_features_batch( ts, ip_len, 3 )) == serial_rows( ts, ip_len, 3 )
+
+def test_batch_first_packets():
+    # packets having no timestamp are skipped until the first one having a timestamp
+    ts     = [0, 0, 10, 5, 10, 30, 20, 40]
+    ip_len = [1, 2, 3, 4, 5, 6, 7, 8]
+    assert array_rows( ef.compute_features_batch( ts, ip_len, 1 )) == serial_rows( ts, ip_len, 1 )
+    assert len( ef.compute_features_batch( [0, 0], [1, 2], 1 )) == 0
+    assert len( ef.compute_features_batch( [5], [1], 1 )) == 0
+    assert len( ef.compute_features_batch( [], [], 1 )) == 0
+
+def test_array_matches_scapy( pcap_file, random_packets ):
+    (ts, ip_len) = random_packets( 2000, seed=1 )
+    path = pcap_file( ts, ip_len )
+    expected = list( ef.compute_features( ef.scapy_records( rdpcap( path )), 2 ))
+    assert array_rows( ef.extract_features_array( path, 2 )) == expected
+
+    with pcap_reader.open_pcap( path ) as pcap:
+        assert list( ef.compute_features( ef.native_records( pcap ), 2 )) == expected
+
+def test_modes_write_same_file( tmp_path, pcap_file, random_packets ):
+    (ts, ip_len) = random_packets( 3000, seed=2 )
+    path = pcap_file( ts, ip_len )
+    outputs = {}
+    for mode in ef.MODES:
+        outputs[ mode ] = str( tmp_path / (mode + ".csv") )
+        ef.extract_features_from_pcap( path, outputs[ mode ], 1, mode, batch_size=1000 )
+    contents = {mode: open( f ).read() for (mode, f) in outputs.items()}
+    assert len(set( contents.values() )) == 1
+    assert len(contents["memory"].splitlines()) > 2000
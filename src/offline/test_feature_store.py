@@ -0,0 +1,68 @@
+# Rows written to a columnar store, or to a csv file, must be read back unchanged.
+
+import os
+import numpy as np
+import pytest
+import extract_features as ef, feature_store
+
+
+def make_rows( n, seed = 0 ):
+    rng = np.random.default_rng( seed )
+    results = np.empty( n, dtype=ef.FEATURE_DTYPE )
+    results["iat"]     = rng.integers( 0, 10**12, n )
+    results["len"]     = rng.integers( 0, 0xFFFF, n )
+    results["diffLen"] = rng.integers( 0, 2 * 0xFFFF, n )
+    results["class"]   = rng.integers( 1, 4, n )
+    return results
+
+@pytest.mark.parametrize( "ext", [feature_store.STORE_EXT, ".csv"] )
+def test_round_trip( tmp_path, ext ):
+    path = str( tmp_path / ("features" + ext) )
+    parts = [make_rows( n, seed ) for (seed, n) in enumerate( [1000, 0, 1, 2500] )]
+    for results in parts:
+        feature_store.write( path, results, batch_size=300 )
+    expected = np.concatenate( parts )
+
+    assert feature_store.load( path ).tolist() == expected.tolist()
+    assert feature_store.load_feature_names( path ) == ["iat", "len", "diffLen"]
+
+    batches = list( feature_store.iter_batches( path, 700 ))
+    assert [len(b) for b in batches] == [700, 700, 700, 700, 700, 1]
+    assert np.concatenate( batches ).tolist() == expected.tolist()
+
+    (X, Y) = feature_store.load_xy( path )
+    assert np.array_equal( X, np.column_stack( [expected[ name ] for name in ["iat", "len", "diffLen"]] ))
+    assert np.array_equal( Y, expected["class"] )
+
+def test_csv_conversion( tmp_path ):
+    results = make_rows( 2000 )
+    # the csv file written by the extractor row by row
+    csv_file = str( tmp_path / "rows.csv" )
+    ef.write_rows( iter( results.tolist() ), csv_file, 500 )
+
+    store = str( tmp_path / "rows.store" )
+    feature_store.write( store, feature_store.load( csv_file ))
+    assert feature_store.load( store ).tolist() == results.tolist()
+
+    csv_copy = str( tmp_path / "copy.csv" )
+    feature_store.write( csv_copy, feature_store.load( store ))
+    assert open( csv_copy, "rb" ).read() == open( csv_file, "rb" ).read()
+
+def test_interrupted_append( tmp_path ):
+    path = str( tmp_path / "features.store" )
+    first = make_rows( 100 )
+    feature_store.append( path, first )
+    # an append interrupted before updating meta.json leaves extra bytes in a column
+    with open( os.path.join( path, "iat.bin" ), "ab" ) as f:
+        f.write( b"\x01" * 24 )
+    assert feature_store.load( path ).tolist() == first.tolist()
+
+    second = make_rows( 50, seed=1 )
+    feature_store.append( path, second )
+    assert feature_store.load( path ).tolist() == np.concatenate( (first, second) ).tolist()
+
+def test_columns_must_match( tmp_path ):
+    path = str( tmp_path / "features.store" )
+    feature_store.append( path, make_rows( 10 ))
+    with pytest.raises( Exception, match="columns do not match" ):
+        feature_store.append( path, np.zeros( 3, dtype=ef.get_dtype( 8 )))
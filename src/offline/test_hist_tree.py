@@ -0,0 +1,59 @@
+# A tree trained from histograms (see hist_tree.py) must be the one of sklearn when there are less
+#  distinct values than bins, as every threshold of sklearn is then a candidate one.
+
+import numpy as np
+import pytest
+from sklearn import tree
+import extract_features as ef, feature_store, hist_tree, tree_model
+
+
+def make_rows( n, seed = 0 ):
+    rng = np.random.default_rng( seed )
+    results = np.empty( n, dtype=ef.FEATURE_DTYPE )
+    results["iat"]     = rng.integers( 0, 60, n ) * 1000
+    results["len"]     = rng.integers( 28, 90, n )
+    results["diffLen"] = rng.integers( 0, 40, n )
+    # noisy classes, thus the gains of the splits are rarely equal
+    score = results["iat"] / 1000 + 2 * results["len"] - results["diffLen"] + rng.normal( 0, 15, n )
+    results["class"] = 1 + np.digitize( score, [150, 190] )
+    return results
+
+@pytest.fixture
+def dataset( tmp_path ):
+    results = make_rows( 3000 )
+    path = str( tmp_path / "features.csv" )
+    feature_store.write( path, results )
+    X = np.column_stack( [results[ name ] for name in ("iat", "len", "diffLen")] )
+    return (path, X, results["class"])
+
+@pytest.mark.parametrize( "max_depth", [1, 3, 5] )
+def test_same_tree_as_sklearn( tmp_path, dataset, max_depth ):
+    (path, X, Y) = dataset
+    dt = hist_tree.fit( path, max_depth=max_depth, batch_size=1000, work_dir=str( tmp_path ))
+    expected = tree_model.from_sklearn( tree.DecisionTreeClassifier( max_depth=max_depth, random_state=0 ).fit( X, Y ))
+
+    assert dt.get_n_leaves() == expected.get_n_leaves()
+    assert np.array_equal( dt.predict( X ), expected.predict( X ))
+    # the same partition of the rows, the thresholds differ only between the values of the rows
+    pairs = set( zip( dt.apply( X ).tolist(), expected.apply( X ).tolist() ))
+    assert len(pairs) == dt.get_n_leaves()
+
+def test_jobs( tmp_path, dataset ):
+    (path, X, Y) = dataset
+    store = str( tmp_path / ("features" + feature_store.STORE_EXT) )
+    feature_store.write( store, feature_store.load( path ))
+    dt = hist_tree.fit( path, max_depth=4, batch_size=500 )
+    parallel = hist_tree.fit( store, max_depth=4, batch_size=500, jobs=3 )
+    assert np.array_equal( parallel.threshold, dt.threshold ) and np.array_equal( parallel.leaf_class, dt.leaf_class )
+
+@pytest.mark.parametrize( "max_leaf_nodes", [2, 7, 20] )
+def test_max_leaf_nodes( dataset, max_leaf_nodes ):
+    (path, X, Y) = dataset
+    dt = hist_tree.fit( path, max_leaf_nodes=max_leaf_nodes, batch_size=1000 )
+    assert dt.get_n_leaves() == max_leaf_nodes
+    # the first split is the best one, as the root of sklearn
+    expected = tree.DecisionTreeClassifier( max_depth=1, random_state=0 ).fit( X, Y )
+    assert dt.feature[0] == expected.tree_.feature[0]
+    assert dt.threshold[0] == tree_model.int_bound( expected.tree_.threshold[0] )
+    # the training rows reach every leaf
+    assert (dt.n_samples[ dt.children_left == -1 ] > 0).all()
@@ -0,0 +1,99 @@
+# The labels given by the index of the rules (see labeling.RuleIndex) must be the ones of
+#  a linear scan of the rules, i.e., the class of the first rule matching all fields of a packet.
+
+import ipaddress, json
+from decimal import Decimal
+import numpy as np
+import pytest
+import labeling
+
+CLASSES = ["skype", "webex", "whatsapp", "botnet"]
+
+
+def random_rules( n, rng ):
+    rules = []
+    for i in range( n ):
+        rule = {"class": CLASSES[ rng.integers( len(CLASSES) ) ]}
+        # a rule matching all packets would hide the following ones
+        if rng.random() < 0.8:
+            prefixes = ["10.{0}.{1}.0/{2}".format( rng.integers( 4 ), rng.integers( 256 ), rng.integers( 15, 31 )) for j in range( rng.integers( 1, 3 ))]
+            rule["src"] = prefixes[0] if len(prefixes) == 1 else prefixes
+        if rng.random() < 0.4:
+            rule["dst"] = "192.168.{0}.0/{1}".format( rng.integers( 4 ), rng.integers( 16, 25 ))
+        if rng.random() < 0.5:
+            lo = int( rng.integers( 0, 2000 ))
+            rule["dport"] = [lo, lo + int( rng.integers( 0, 100 ))] if rng.random() < 0.5 else lo
+        if rng.random() < 0.3:
+            rule["sport"] = int( rng.integers( 0, 2000 ))
+        if rng.random() < 0.3:
+            rule["proto"] = [6, 17][ rng.integers( 2 ) ]
+        if rng.random() < 0.4:
+            start = float( rng.integers( 0, 1000 )) + 0.25
+            rule["from"] = start
+            if rng.random() < 0.7:
+                rule["to"] = start + float( rng.integers( 1, 200 ))
+        if len(rule) == 1:
+            rule["sport"] = int( rng.integers( 0, 2000 ))
+        rules.append( rule )
+    return rules
+
+def random_packets( n, rng ):
+    return {
+        "ts"   : rng.integers( 0, 1200 * 10**9, n ),
+        "src"  : int( ipaddress.IPv4Address( "10.0.0.0" )) + rng.integers( 0, 4 << 16, n ),
+        "dst"  : int( ipaddress.IPv4Address( "192.168.0.0" )) + rng.integers( 0, 4 << 8, n ),
+        "sport": rng.integers( 0, 2000, n ),
+        "dport": rng.integers( 0, 2000, n ),
+        "proto": np.array( [6, 17] )[ rng.integers( 0, 2, n ) ],
+    }
+
+def in_range( value, spec ):
+    if isinstance( spec, list ):
+        return spec[0] <= value <= spec[1]
+    return value == spec
+
+# label of a packet by a scan of the rules
+def scan( rules, classes, ts, src, dst, sport, dport, proto ):
+    for rule in rules:
+        if "src" in rule and not any( ipaddress.IPv4Address( src ) in ipaddress.IPv4Network( p, strict=False )
+                for p in ([rule["src"]] if isinstance( rule["src"], str ) else rule["src"] )):
+            continue
+        if "dst" in rule and not ipaddress.IPv4Address( dst ) in ipaddress.IPv4Network( rule["dst"], strict=False ):
+            continue
+        if any( field in rule and not in_range( value, rule[ field ] ) for (field, value) in (("sport", sport), ("dport", dport), ("proto", proto)) ):
+            continue
+        if "from" in rule and ts < Decimal( str( rule["from"] )) * 10**9:
+            continue
+        if "to" in rule and ts > Decimal( str( rule["to"] )) * 10**9:
+            continue
+        return classes[ rule["class"] ]
+    return labeling.NO_LABEL
+
+
+@pytest.mark.parametrize( "nb_rules", [1, 20, 150] )
+def test_index_matches_scan( monkeypatch, nb_rules ):
+    # several batches of packets
+    monkeypatch.setattr( labeling, "LABEL_BATCH", 1000 )
+    rng = np.random.default_rng( nb_rules )
+    rules = random_rules( nb_rules, rng )
+    packets = random_packets( 5000, rng )
+
+    index = labeling.RuleIndex( rules )
+    labels = index.label( packets["ts"], packets["src"], packets["dst"], packets["sport"], packets["dport"], packets["proto"] )
+    fields = ["ts", "src", "dst", "sport", "dport", "proto"]
+    expected = [scan( rules, index.classes, *values ) for values in zip( *[packets[ f ].tolist() for f in fields] )]
+    assert labels.tolist() == expected
+    # the rules are not too selective for the test to be meaningful
+    assert (labels != labeling.NO_LABEL).sum() > 0
+
+def test_classes_in_order_of_rules( tmp_path ):
+    rules = [{"class": "webex", "dport": 443}, {"class": "skype", "proto": 17}, {"class": "webex", "src": "10.0.0.0/8"}]
+    rulefile = tmp_path / "rules.json"
+    rulefile.write_text( json.dumps( rules ))
+    index = labeling.load_rules( str( rulefile ))
+    assert index.classes == {"webex": 1, "skype": 2}
+
+    src = int( ipaddress.IPv4Address( "10.1.2.3" ))
+    labels = index.label( np.array( [0, 0, 0, 0] ), np.array( [src, src, 0, 0] ), np.zeros( 4, dtype=np.int64 ),
+        np.zeros( 4, dtype=np.int64 ), np.array( [443, 80, 80, 443] ), np.array( [17, 17, 6, 6] ))
+    assert labels.tolist() == [1, 2, labeling.NO_LABEL, 1]
@@ -0,0 +1,36 @@
+# The number of entries of a candidate (see model_search.py) must be the number of entries written
+#  by generate_table_entries.py, which removes the leaves out of the domain.
+
+import os, subprocess, sys
+import numpy as np
+from sklearn import tree
+import model_search, tree_model
+
+HERE = os.path.dirname( os.path.abspath( __file__ ))
+
+
+def test_count_entries( tmp_path ):
+    rng = np.random.default_rng( 0 )
+    X = rng.integers( 0, 1000, (2000, 3) )
+    # negative values of iat, out of the domain, have their own leaves
+    X[ 0:500, 0 ] = -rng.integers( 1, 1000, 500 )
+    Y = np.where( X[:, 0] < 0, 1 + (X[:, 1] > 500), 3 )
+    dt = tree.DecisionTreeClassifier( random_state=0 ).fit( X, Y )
+    model_file = str( tmp_path / ("dt" + tree_model.MODEL_EXT) )
+    tree_model.save( tree_model.from_sklearn( dt ), model_file )
+    commands = str( tmp_path / "s1-commands.txt" )
+    subprocess.run( [sys.executable, os.path.join( HERE, "generate_table_entries.py" ), "-i", model_file, "-o", commands],
+        cwd=HERE, check=True, stdout=subprocess.DEVNULL )
+
+    nb_entries = sum( 1 for line in open( commands ) if line.startswith( "table_add" ))
+    assert model_search.count_entries( dt ) == nb_entries < dt.get_n_leaves()
+
+def test_choose_counted_entries():
+    rng = np.random.default_rng( 1 )
+    X = rng.integers( 0, 1000, (3000, 3) )
+    Y = 1 + (X[:, 0] > 300) + (X[:, 1] > 700)
+    results = model_search.evaluate( X, Y, model_search.get_candidates( [None], [4, 16], [1] ), feature_names=["iat", "len", "diffLen"] )
+    for (params, accuracy, entries, dt) in results:
+        assert entries == model_search.count_entries( dt )
+    assert model_search.choose( results, 3 ) is None
+    assert model_search.choose( results, 4 )[0]["max_leaf_nodes"] == 4
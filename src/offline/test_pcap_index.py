@@ -0,0 +1,90 @@
+# The index of a pcap file (see pcap_index.py) and the extraction of its byte ranges, which are stitched,
+#  must give the features of a sequential extraction.
+
+import os
+import numpy as np
+import pytest
+import extract_features as ef, pcap_index, pcap_reader
+
+NB_PACKETS = 25000
+STEP = 1000
+
+
+@pytest.fixture
+def large_pcap( pcap_file, random_packets ):
+    (ts, ip_len) = random_packets( NB_PACKETS, seed=3 )
+    return (pcap_file( ts, ip_len ), ts, ip_len)
+
+def sequential( path, outputfile, t1 = None, t2 = None ):
+    with pcap_reader.open_pcap( path ) as pcap:
+        records = [(ts, l) for (ts, l) in ef.native_records( pcap )
+            if (t1 is None or ts >= t1) and (t2 is None or ts <= t2)]
+    ef.write_rows( ef.compute_features( iter( records ), 1 ), outputfile )
+
+
+def test_build_index( large_pcap ):
+    (path, ts, ip_len) = large_pcap
+    with pcap_reader.PcapFile( path ) as pcap:
+        index  = pcap_index.build_index( pcap, STEP )
+        offsets = np.concatenate( list( pcap.offsets( chunk_size=777 )))
+        assert np.array_equal( index["offset"], offsets[ 0 :: STEP ] )
+        assert np.array_equal( index["ts"], np.array( ts[ 0 :: STEP ] ) * 1000 )
+        assert index["size"] == os.path.getsize( path )
+
+@pytest.mark.parametrize( "n", [1, 2, 3, 7, 100] )
+def test_split( large_pcap, n ):
+    (path, ts, ip_len) = large_pcap
+    with pcap_reader.PcapFile( path ) as pcap:
+        index = pcap_index.build_index( pcap, STEP )
+    ranges = pcap_index.split( index, n )
+    assert 1 <= len(ranges) <= n
+    # contiguous ranges starting at indexed records and covering all records
+    assert ranges[0][0] == index["offset"][0]
+    assert ranges[-1][1] == index["size"]
+    assert all( a[1] == b[0] for (a, b) in zip( ranges, ranges[1:] ))
+    assert all( s in index["offset"] for (s, e) in ranges )
+
+@pytest.mark.parametrize( "jobs", [1, 2] )
+def test_indexed_extraction( tmp_path, large_pcap, monkeypatch, jobs ):
+    (path, ts, ip_len) = large_pcap
+    # many small ranges, i.e., one per indexed record
+    monkeypatch.setattr( ef, "RANGE_SIZE", 1 )
+    monkeypatch.setattr( pcap_index.get_index, "__defaults__", (STEP,) )
+    expected = str( tmp_path / "expected.csv" )
+    sequential( path, expected )
+
+    output = str( tmp_path / "indexed.csv" )
+    ef.extract_features_indexed( path, output, 1, jobs=jobs )
+    assert open( output ).read() == open( expected ).read()
+
+@pytest.mark.parametrize( "window", [(None, 300), (200, None), (200, 300), (900, 901)] )
+def test_time_range( tmp_path, large_pcap, monkeypatch, window ):
+    (path, ts, ip_len) = large_pcap
+    monkeypatch.setattr( ef, "RANGE_SIZE", 1 )
+    monkeypatch.setattr( pcap_index.get_index, "__defaults__", (STEP,) )
+    # bounds in second => nanosecond
+    (t1, t2) = [t * 1000000000 if t is not None else None for t in window]
+    expected = str( tmp_path / "expected.csv" )
+    sequential( path, expected, t1, t2 )
+
+    output = str( tmp_path / "range.csv" )
+    ef.extract_features_indexed( path, output, 1, t1=t1, t2=t2 )
+    assert os.path.exists( expected ) == os.path.exists( output )
+    if os.path.exists( expected ):
+        assert open( output ).read() == open( expected ).read()
+
+def test_index_is_rebuilt( pcap_file, random_packets ):
+    (ts, ip_len) = random_packets( 3000 )
+    path = pcap_file( ts, ip_len )
+    with pcap_reader.PcapFile( path ) as pcap:
+        index = pcap_index.get_index( pcap, path, STEP )
+    assert os.path.exists( pcap_index.get_index_file( path ))
+
+    # same size, other timestamps
+    ts = [t + 1000000 for t in ts]
+    pcap_file( ts, ip_len )
+    os.utime( path, ns=(index["mtime"] + 1000, index["mtime"] + 1000) )
+    with pcap_reader.PcapFile( path ) as pcap:
+        rebuilt = pcap_index.get_index( pcap, path, STEP )
+    assert rebuilt["size"] == index["size"]
+    assert np.array_equal( rebuilt["ts"], index["ts"] + 1000000000 )
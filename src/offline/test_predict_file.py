@@ -0,0 +1,39 @@
+# The confusion matrix computed by batches (see predict_file.py) must be the one of sklearn on all rows,
+#  also when classes appear in later batches.
+
+import os
+import numpy as np
+import pytest
+from sklearn.metrics import confusion_matrix, precision_recall_fscore_support
+import feature_store, predict_file, tree_model
+
+HERE = os.path.dirname( os.path.abspath( __file__ ))
+MODEL_FILE = os.path.join( HERE, tree_model.MODEL_FILE )
+
+
+@pytest.mark.parametrize( "batch_size", [1, 13, 1000] )
+def test_confusion_grows( batch_size ):
+    rng = np.random.default_rng( batch_size )
+    # classes 1 and 2 first, then 0, 5 and 9 which are not known by the model
+    Y = np.concatenate( (rng.integers( 1, 3, 500 ), rng.choice( [0, 1, 2, 5, 9], 500 )))
+    P = np.where( rng.random( len(Y) ) < 0.7, Y, rng.choice( [1, 2, 3, 7], len(Y) ))
+    confusion = predict_file.Confusion( [1, 2, 3] )
+    for start in range( 0, len(Y), batch_size ):
+        confusion.add( Y[ start : start + batch_size ], P[ start : start + batch_size ] )
+
+    labels = np.union1d( np.union1d( Y, P ), [1, 2, 3] )
+    assert confusion.classes.tolist() == labels.tolist()
+    assert np.array_equal( confusion.matrix, confusion_matrix( Y, P, labels=labels ))
+    assert confusion.accuracy() == np.mean( Y == P )
+    (precision, recall, f1, support) = precision_recall_fscore_support( Y, P, labels=labels, zero_division=0 )
+    for (a, b) in zip( confusion.metrics(), (precision, recall, f1, support) ):
+        assert np.allclose( a, b )
+
+def test_score_by_batches():
+    dt = tree_model.load( MODEL_FILE )
+    path = os.path.join( HERE, "pcaps", "features.csv" )
+    results = feature_store.load( path )
+    X = np.column_stack( [results[ name ] for name in results.dtype.names[0:-1]] )
+    Y = results["class"]
+    (confusion, duration) = predict_file.score( dt, path, 100 )
+    assert np.array_equal( confusion.matrix, confusion_matrix( Y, dt.predict( X ), labels=confusion.classes ))
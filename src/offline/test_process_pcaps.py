@@ -0,0 +1,74 @@
+# The features extracted by several processes or cached per pcap file (see process_pcaps_cached) must be
+#  the ones of a serial run without cache, and only the new or changed pcap files are extracted again.
+
+import os
+import pytest
+import extract_features as ef, feature_store, process_pcaps
+
+
+def make_tasks( pcap_file, random_packets ):
+    tasks = []
+    for (i, name) in enumerate( ["skype.v1.pcap", "webex.v1.pcap", "skype.v2.pcap"] ):
+        (ts, ip_len) = random_packets( 1000 + 500 * i, seed=i )
+        tasks.append( (pcap_file( ts, ip_len, name ), 1 + i % 2) )
+    return tasks
+
+def test_get_classes():
+    (tasks, file_names) = process_pcaps.get_classes( ["./skype.v1.pcap", "./webex.v1.pcap", "./skype.v2.pcap"] )
+    # the files of a class are labeled by the index of the class, even when they are not consecutive
+    assert tasks == [("./skype.v1.pcap", 1), ("./webex.v1.pcap", 2), ("./skype.v2.pcap", 1)]
+    assert file_names == {"skype": 1, "webex": 2}
+
+@pytest.mark.parametrize( "mode", ["stream", "batch"] )
+@pytest.mark.parametrize( "ext", [".csv", feature_store.STORE_EXT] )
+def test_jobs_match_serial( tmp_path, pcap_file, random_packets, mode, ext ):
+    tasks = make_tasks( pcap_file, random_packets )
+    expected = str( tmp_path / ("expected" + ext) )
+    process_pcaps.process_pcaps( tasks, expected, mode, 1 )
+
+    parallel = str( tmp_path / ("parallel" + ext) )
+    process_pcaps.process_pcaps( tasks, parallel, mode, 3 )
+    if ext == ".csv":
+        assert open( parallel, "rb" ).read() == open( expected, "rb" ).read()
+    else:
+        assert feature_store.load( parallel ).tolist() == feature_store.load( expected ).tolist()
+
+def test_cache_matches_extraction( tmp_path, pcap_file, random_packets ):
+    tasks = make_tasks( pcap_file, random_packets )
+    expected = str( tmp_path / "expected.csv" )
+    process_pcaps.process_pcaps( tasks, expected, "stream", 1 )
+
+    cached = str( tmp_path / "cached.csv" )
+    process_pcaps.process_pcaps_cached( tasks, cached, 1, str( tmp_path / ".cache" ))
+    assert open( cached ).read() == open( expected ).read()
+
+def test_cache_extracts_changed_files( tmp_path, pcap_file, random_packets, capsys ):
+    tasks = make_tasks( pcap_file, random_packets )
+    cache_dir = str( tmp_path / ".cache" )
+    output = str( tmp_path / "features.store" )
+    process_pcaps.process_pcaps_cached( tasks, output, 1, cache_dir )
+    capsys.readouterr()
+
+    # rewrite the second file
+    (ts, ip_len) = random_packets( 700, seed=10 )
+    pcap_file( ts, ip_len, "webex.v1.pcap" )
+    feature_store.remove( output )
+    process_pcaps.process_pcaps_cached( tasks, output, 1, cache_dir )
+    lines = [l for l in capsys.readouterr().out.splitlines() if l.split()[1] in ("cached", "processing")]
+    assert [l.split()[1] for l in lines] == ["cached", "processing", "cached"]
+    # the sidecar of the former content is removed
+    assert len(os.listdir( cache_dir )) == len(tasks)
+
+    expected = str( tmp_path / "expected.store" )
+    process_pcaps.process_pcaps( tasks, expected, "batch", 1 )
+    assert feature_store.load( output ).tolist() == feature_store.load( expected ).tolist()
+
+def test_cache_window_stats( tmp_path, pcap_file, random_packets ):
+    tasks = make_tasks( pcap_file, random_packets )
+    expected = str( tmp_path / "expected.csv" )
+    process_pcaps.process_pcaps( tasks, expected, "stream", 1, window=8 )
+
+    cached = str( tmp_path / "cached.csv" )
+    process_pcaps.process_pcaps_cached( tasks, cached, 1, str( tmp_path / ".cache" ), window=8 )
+    assert open( cached ).read() == open( expected ).read()
+    assert tuple( open( cached ).readline().strip().split( "," )) == ef.get_dtype( 8 ).names
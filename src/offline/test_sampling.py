@@ -0,0 +1,45 @@
+# The reservoir (see sampling.py) keeps min(k, n) rows of each class, each row of a class
+#  with the same probability k / n, whatever the batches the rows are given by.
+
+import numpy as np
+import extract_features as ef, sampling
+
+
+# rows identified by their iat, of class 1 (n1 rows) then of class 2 (n2 rows), shuffled
+def make_rows( n1, n2, seed = 0 ):
+    results = np.zeros( n1 + n2, dtype=ef.FEATURE_DTYPE )
+    results["iat"]   = np.arange( n1 + n2 )
+    results["class"] = np.where( np.arange( n1 + n2 ) < n1, 1, 2 )
+    return results[ np.random.default_rng( seed ).permutation( n1 + n2 ) ]
+
+def sample( results, k, seed, batch_size ):
+    reservoir = sampling.Reservoir( k, seed )
+    for start in range( 0, len(results), batch_size ):
+        reservoir.add( results[ start : start + batch_size ] )
+    return reservoir
+
+def test_sample_size():
+    results = make_rows( 50, 7 )
+    for batch_size in (1, 6, 50, 1000):
+        reservoir = sample( results, 10, 0, batch_size )
+        sampled = reservoir.results()
+        assert reservoir.seen == {1: 50, 2: 7}
+        assert np.count_nonzero( sampled["class"] == 1 ) == 10
+        # a class having less rows than k is kept entirely
+        assert sorted( sampled["iat"][ sampled["class"] == 2 ].tolist() ) == list( range( 50, 57 ))
+        # a row is sampled once
+        assert len(np.unique( sampled["iat"] )) == len(sampled)
+
+def test_uniform():
+    (n, k, nb_seeds) = (50, 10, 4000)
+    results = make_rows( n, 0 )
+    counts = np.zeros( n, dtype=np.int64 )
+    for seed in range( nb_seeds ):
+        sampled = sample( results, k, seed, [1, 7, 23][ seed % 3 ] ).results()
+        counts += np.bincount( sampled["iat"], minlength=n )
+    # every row is chosen k / n times, 5 standard deviations at most
+    expected = nb_seeds * k / n
+    assert (counts > 0).all()
+    assert np.abs( counts - expected ).max() < 5 * np.sqrt( expected * (1 - k / n) )
+    # chi-square statistic, the mean of each term is 1 - k / n as k rows are sampled without replacement
+    assert ((counts - expected) ** 2 / expected).sum() < n * (1 - k / n) + 5 * np.sqrt( 2 * n )
@@ -0,0 +1,131 @@
+# The copies of a model (see tree_model.py) must predict as the model on the rows they keep,
+#  and the bounds and the rules of a leaf must describe the rows reaching it.
+
+import os, pickle, re
+import numpy as np
+import pytest
+import tree_model
+
+FEATURES = ["iat", "len", "diffLen"]
+
+HERE = os.path.dirname( os.path.abspath( __file__ ))
+MODEL_FILE = os.path.join( HERE, tree_model.MODEL_FILE )
+
+
+# a tree whose thresholds were moved beyond the ones of their ancestors, e.g., by snap_thresholds.py
+#  node 0: len <= 100, node 1: len <= 200 (its right child is unreachable), node 2: len <= 50 (its left child is unreachable)
+#  node 5: iat <= 10
+def snapped_tree():
+    feature     = [ 1,  1, -2, -2,  1,  0, -2, -2, -2]
+    threshold   = [100.5, 200.5, -2, -2, 50.5, 10.5, -2, -2, -2]
+    left        = [ 1,  2, -1, -1,  8,  6, -1, -1, -1]
+    right       = [ 4,  3, -1, -1,  5,  7, -1, -1, -1]
+    leaf_class  = [ 0,  0,  1,  2,  0,  0,  0,  1,  2]
+    return tree_model.TreeModel( feature, threshold, left, right, leaf_class, [1, 2, 3], FEATURES )
+
+def test_drop_unreachable():
+    dt = snapped_tree()
+    (copy, nb_removed) = dt.drop_unreachable()
+    assert nb_removed == 2
+    assert copy.get_n_leaves() == 3
+    (lo, hi) = copy.leaf_bounds()
+    leaves = copy.children_left == -1
+    assert (lo[ leaves ] <= hi[ leaves ]).all()
+
+    rng = np.random.default_rng( 0 )
+    X = np.column_stack( [rng.integers( 0, 30, 5000 ), rng.integers( 0, 300, 5000 ), rng.integers( 0, 10, 5000 )] )
+    assert np.array_equal( copy.predict( X ), dt.predict( X ))
+
+def test_drop_out_of_domain():
+    dt = snapped_tree()
+    domain = {name: {"min": 0, "max": 1000} for name in FEATURES}
+    domain["iat"] = {"min": 20, "max": 1000}
+    (copy, nb_removed) = tree_model.drop_unreachable_nodes( dt, domain )
+    # iat <= 10 cannot be reached
+    assert nb_removed == 3
+    X = np.column_stack( [np.full( 300, 20 ), np.arange( 300 ), np.zeros( 300, dtype=np.int64 )] )
+    assert np.array_equal( copy.predict( X ), dt.predict( X ))
+
+def test_drop_unreachable_ensemble():
+    dt = snapped_tree()
+    (copy, nb_removed) = tree_model.drop_unreachable_nodes( tree_model.Ensemble( [dt, dt], [1.0, 0.5] ))
+    assert nb_removed == 4
+    assert copy.weights.tolist() == [1.0, 0.5]
+
+
+def test_save_load( tmp_path ):
+    dt = snapped_tree()
+    model_file = str( tmp_path / ("dt" + tree_model.MODEL_EXT) )
+    tree_model.save( dt, model_file )
+    copy = tree_model.load( model_file )
+    assert copy.feature_names == FEATURES
+    assert np.array_equal( copy.threshold, dt.threshold ) and np.array_equal( copy.leaf_class, dt.leaf_class )
+
+# a pickle which would run a command when it is loaded
+class Command:
+    def __reduce__(self):
+        return (os.system, ("touch pwned",))
+
+def test_pickle_is_not_loaded( tmp_path ):
+    model_file = str( tmp_path / "dt.model" )
+    with open( model_file, 'wb' ) as f:
+        pickle.dump( Command(), f )
+    with pytest.raises( Exception, match="--legacy-pickle" ):
+        tree_model.load( model_file )
+    with pytest.raises( pickle.UnpicklingError ):
+        tree_model.load_legacy_pickle( model_file )
+    assert not os.path.exists( "pwned" )
+
+
+# rows inside the bounds of each leaf: its corners and random rows, within the domain
+def rows_of_leaves( dt, nb_rows = 20, seed = 0 ):
+    rng = np.random.default_rng( seed )
+    (lo, hi) = dt.leaf_bounds()
+    domain_lo = np.array( [tree_model.DOMAIN[ name ]["min"] for name in dt.feature_names] )
+    domain_hi = np.array( [min( tree_model.DOMAIN[ name ]["max"], 10**12 ) for name in dt.feature_names] )
+    (leaves, rows) = ([], [])
+    for leaf in np.flatnonzero( dt.children_left == -1 ).tolist():
+        (l, h) = (np.maximum( lo[ leaf ], domain_lo ), np.minimum( hi[ leaf ], domain_hi ))
+        assert (l <= h).all()
+        X = rng.integers( l, h + 1, (nb_rows, len(l)) )
+        X[0] = l
+        X[1] = h
+        leaves += [leaf] * nb_rows
+        rows.append( X )
+    return (np.array( leaves ), np.concatenate( rows ))
+
+# check a rule, e.g., ("93501 <= iat <= 131071", "len <= 47"), on a row
+def satisfies( rule, row, feature_names ):
+    values = dict( zip( feature_names, row ))
+    for condition in rule:
+        m = re.fullmatch( r"(-?\d+) <= (\w+) <= (-?\d+)|(\w+) (<=|>=) (-?\d+)", condition )
+        if m.group( 2 ) is not None:
+            ok = int( m.group( 1 )) <= values[ m.group( 2 ) ] <= int( m.group( 3 ))
+        elif m.group( 5 ) == "<=":
+            ok = values[ m.group( 4 ) ] <= int( m.group( 6 ))
+        else:
+            ok = values[ m.group( 4 ) ] >= int( m.group( 6 ))
+        if not ok:
+            return False
+    return True
+
+def test_leaf_bounds_and_rules():
+    dt = tree_model.load( MODEL_FILE )
+    (leaves, X) = rows_of_leaves( dt )
+    assert np.array_equal( dt.apply( X ), leaves )
+
+    rules = dt.explain( X )
+    assert list( rules ) == list( dt.leaf_rules()[ leaves ] )
+    assert all( satisfies( rule, row, dt.feature_names ) for (rule, row) in zip( rules, X.tolist() ))
+    # a row only satisfies the rule of its leaf
+    all_rules = dt.leaf_rules()[ np.flatnonzero( dt.children_left == -1 ) ]
+    for row in X[ 0 : len(X) : 7 ].tolist():
+        assert sum( satisfies( rule, row, dt.feature_names ) for rule in all_rules ) == 1
+
+def test_explain_ensemble():
+    dt = tree_model.load( MODEL_FILE )
+    model = tree_model.Ensemble( [dt, dt.prune( 10 )] )
+    (leaves, X) = rows_of_leaves( dt, 3 )
+    rules = model.explain( X )
+    assert rules.shape == (len(X), 2)
+    assert list( rules[:, 1] ) == list( model.trees[1].explain( X ))
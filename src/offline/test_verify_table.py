@@ -0,0 +1,129 @@
+# The errors reported by the verifier (see verify_table.py) must be the ones found by evaluating the tree
+#  and the entries on every feature vector of a small domain.
+
+import itertools, os, subprocess, sys
+import numpy as np
+import pytest
+import evaluate_table, tree_model, verify_table
+
+HERE = os.path.dirname( os.path.abspath( __file__ ))
+MODEL_FILE = os.path.join( HERE, tree_model.MODEL_FILE )
+
+FEATURES = ["iat", "len", "diffLen"]
+# small enough to enumerate all its vectors
+SMALL_DOMAIN = {name: {"min": 0, "max": 31} for name in FEATURES}
+
+
+@pytest.fixture
+def small_domain( monkeypatch ):
+    monkeypatch.setattr( verify_table, "DOMAIN", SMALL_DOMAIN )
+    return np.array( list( itertools.product( range( 32 ), repeat=len(FEATURES) )))
+
+def random_tree( rng, depth = 6 ):
+    nodes = []
+    def build( d, lo, hi ):
+        node = len(nodes)
+        nodes.append( None )
+        splittable = [f for f in range( len(FEATURES) ) if lo[ f ] < hi[ f ]]
+        if d == 0 or len(splittable) == 0 or rng.random() < 0.15:
+            nodes[ node ] = (-2, -2.0, -1, -1, int( rng.integers( 3 )))
+            return node
+        f = splittable[ rng.integers( len(splittable) ) ]
+        t = int( rng.integers( lo[ f ], hi[ f ] ))
+        left  = build( d - 1, lo, {**hi, f: t} )
+        right = build( d - 1, {**lo, f: t + 1}, hi )
+        # as sklearn, a threshold between 2 integers
+        nodes[ node ] = (f, t + 0.5, left, right, int( rng.integers( 3 )))
+        return node
+    build( depth, {f: 0 for f in range( 3 )}, {f: 31 for f in range( 3 )} )
+    (feature, threshold, left, right, leaf_class) = zip( *nodes )
+    return tree_model.TreeModel( feature, threshold, left, right, leaf_class, [1, 2, 3], FEATURES )
+
+# an entry per leaf, as generate_table_entries.py
+def tree_entries( dt ):
+    leaves = np.flatnonzero( dt.children_left == -1 )
+    (lo, hi) = dt.leaf_bounds()
+    lo = np.maximum( lo[ leaves ], 0 )
+    hi = np.minimum( hi[ leaves ], 31 )
+    classes = dt.classes[ dt.leaf_class[ leaves ]]
+    return [(list( zip( l, h )), [int( c )], i + 1) for (i, (l, h, c)) in enumerate( zip( lo.tolist(), hi.tolist(), classes.tolist() ))]
+
+# (has gaps, has overlaps, has mismatches) on all vectors of the domain
+def brute_force( dt, entries, X ):
+    entries = sorted( entries, key=lambda e: e[2] )
+    lo = np.array( [[k[0] for k in keys] for (keys, params, priority) in entries] )
+    hi = np.array( [[k[1] for k in keys] for (keys, params, priority) in entries] )
+    match = ((lo[ None ] <= X[:, None]) & (X[:, None] <= hi[ None ])).all( axis=2 )
+    nb_matches = match.sum( axis=1 )
+    values = np.array( [params[0] for (keys, params, priority) in entries] )
+    winners = values[ np.argmax( match, axis=1 ) ]
+    return (bool( (nb_matches == 0).any() ), bool( (nb_matches > 1).any() ),
+        bool( ((nb_matches > 0) & (winners != dt.predict( X ))).any() ))
+
+def reported( dt, entries ):
+    (result, examples) = verify_table.check_tree( dt, entries, FEATURES )
+    return (result["gaps"] > 0, result["overlaps"] > 0, result["mismatches"] > 0)
+
+
+def test_exact_entries( small_domain ):
+    rng = np.random.default_rng( 0 )
+    for i in range( 5 ):
+        dt = random_tree( rng )
+        entries = tree_entries( dt )
+        assert reported( dt, entries ) == brute_force( dt, entries, small_domain ) == (False, False, False)
+        assert verify_table.verify( dt, {evaluate_table.CODE_TABLES[0]: entries} )
+
+@pytest.mark.parametrize( "seed", range( 20 ))
+def test_modified_entries( small_domain, seed ):
+    rng = np.random.default_rng( seed )
+    dt = random_tree( rng )
+    entries = tree_entries( dt )
+    for k in range( 1 + seed % 3 ):
+        i = int( rng.integers( len(entries) ))
+        (keys, params, priority) = entries[ i ]
+        change = rng.integers( 4 )
+        if change == 0:
+            # a missing entry
+            entries.pop( i )
+        elif change == 1:
+            entries[ i ] = (keys, [1 + params[0] % 3], priority)
+        elif change == 2:
+            # an entry wider than its leaf, the mismatches depend on its priority
+            f = int( rng.integers( len(keys) ))
+            keys = [(max( 0, lo - 3 ), min( 31, hi + 3 )) if j == f else (lo, hi) for (j, (lo, hi)) in enumerate( keys )]
+            entries[ i ] = (keys, params, int( rng.integers( 0, 2 * len(entries) )))
+        else:
+            # an entry narrower than its leaf
+            f = int( rng.integers( len(keys) ))
+            keys = [(lo, max( lo, hi - 2 )) if j == f else (lo, hi) for (j, (lo, hi)) in enumerate( keys )]
+            entries[ i ] = (keys, params, priority)
+        if len(entries) == 0:
+            return
+    assert reported( dt, entries ) == brute_force( dt, entries, small_domain )
+
+def test_empty_entry( small_domain ):
+    dt = random_tree( np.random.default_rng( 1 ))
+    entries = tree_entries( dt ) + [([(5, 4), (0, 31), (0, 31)], [1], 1000)]
+    (result, examples) = verify_table.check_tree( dt, entries, FEATURES )
+    assert result["empty"] == 1
+    assert not verify_table.verify( dt, {evaluate_table.CODE_TABLES[0]: entries} )
+
+
+def test_generated_ensemble( tmp_path ):
+    dt = tree_model.load( MODEL_FILE )
+    model = tree_model.Ensemble( [dt, dt.prune( 30 )] )
+    model_file = str( tmp_path / ("ensemble" + tree_model.MODEL_EXT) )
+    commands = str( tmp_path / "s1-commands.txt" )
+    tree_model.save( model, model_file )
+    # the generator verifies the entries
+    subprocess.run( [sys.executable, os.path.join( HERE, "generate_table_entries.py" ), "-i", model_file, "-o", commands],
+        cwd=HERE, check=True, stdout=subprocess.DEVNULL )
+
+    tables = evaluate_table.parse_commands( commands )
+    assert verify_table.verify( model, tables )
+    assert verify_table.check_votes( model, tables[ evaluate_table.VOTE_TABLE ] ) == []
+    # a wrong vote
+    (keys, params, priority) = tables[ evaluate_table.VOTE_TABLE ][0]
+    tables[ evaluate_table.VOTE_TABLE ][0] = (keys, [params[0] % 3 + 1], priority)
+    assert len(verify_table.check_votes( model, tables[ evaluate_table.VOTE_TABLE ] )) == 1
+    assert not verify_table.verify( model, tables )
@@ -0,0 +1,56 @@
+# The statistics of an array computed at once (see add_window_stats_array) must be the ones of
+#  the update of each packet, also when the packets of a flow are given by several arrays.
+
+import numpy as np
+import pytest
+import extract_features as ef, window_stats
+
+
+def make_rows( n, seed = 0 ):
+    rng = np.random.default_rng( seed )
+    results = np.empty( n, dtype=ef.FEATURE_DTYPE )
+    results["iat"]     = rng.integers( 0, 10**7, n )
+    results["len"]     = rng.integers( 28, 1500, n )
+    results["diffLen"] = rng.integers( 0, 2 * 0xFFFF, n )
+    results["class"]   = 1
+    return results
+
+def serial( results, n, stats = None ):
+    rows = zip( results["iat"].tolist(), results["len"].tolist(), results["diffLen"].tolist(), results["class"].tolist() )
+    return list( window_stats.add_window_stats( rows, stats if stats is not None else window_stats.WindowStats( n )))
+
+@pytest.mark.parametrize( "n", [1, 2, 3, 8, 32, 100] )
+def test_array_matches_update( n ):
+    results = make_rows( 20000, n )
+    stats = window_stats.WindowStats( n )
+    # arrays of any size, a single row included, continue the same flow
+    rng = np.random.default_rng( n )
+    parts = []
+    start = 0
+    while start < len(results):
+        size = int( rng.choice( [1, 5, window_stats.MIN_ARRAY_ROWS, n, 2 * n + 1, 500, 3000] ))
+        parts.append( window_stats.add_window_stats_array( results[ start : start + size ], stats, ef.get_dtype( n )))
+        start += size
+    expected = window_stats.WindowStats( n )
+    assert [tuple( r ) for r in np.concatenate( parts ).tolist()] == serial( results, n, expected )
+    # the averages are the same floats, not only once rounded
+    assert (stats.count, stats.ewma_iat, stats.ewma_len) == (expected.count, expected.ewma_iat, expected.ewma_len)
+
+def test_window_covers_n_to_2n_packets():
+    n = 4
+    lens = [100, 1, 1, 1, 1, 1, 1, 1, 1, 1]
+    stats = window_stats.WindowStats( n )
+    min_max = [stats.update( 0, l )[3:5] for l in lens]
+    # the first block (packets 1-4) is kept until the end of the second one (packets 5-8)
+    assert [m for (m, M) in min_max] == [100, 1, 1, 1, 1, 1, 1, 1, 1, 1]
+    assert [M for (m, M) in min_max] == [100, 100, 100, 100, 100, 100, 100, 100, 1, 1]
+
+# averages whose rounding would depend on the order of the operations, i.e., close to x.5
+def test_array_matches_update_halves():
+    n = 7
+    results = make_rows( 5000 )
+    results["iat"] = np.where( np.arange( 5000 ) % 3 == 0, 1, 2 )
+    results["len"] = 100 + np.arange( 5000 ) % 2
+    stats = window_stats.WindowStats( n )
+    array = window_stats.add_window_stats_array( results, stats, ef.get_dtype( n ))
+    assert [tuple( r ) for r in array.tolist()] == serial( results, n )
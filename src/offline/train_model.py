@@ -1,57 +1,172 @@
 #!/usr/bin/env python3
 
-# Generate a decision tree from an input csv file which contains n features and its classification.
+# Generate a decision tree from an input csv file (or a columnar feature store, see feature_store.py)
+# which contains n features and its classification.
 # In the CSV file,
 # - the first n columns contain features (X)
 # - the last column contain classification (Y)
+#
+# With `--search`, several hyperparameters of the tree are tried in parallel, then the most accurate tree
+#  whose table fits in the switch (`--budget` entries) is kept (see model_search.py), e.g.,
+#  ./train_model.py --search -j 8 --budget 4096 --report ./pcaps/search.csv
+#
+# With `--snap`, the thresholds of the tree are moved to integer, or power-of-2 aligned, boundaries
+#  (see snap_thresholds.py).
+#
+# With `--hist`, the tree is trained out of core: the rows are read by batches and binned into
+#  histograms whose candidate thresholds are integers, then the tree is grown from the histograms
+#  (see hist_tree.py), e.g.,
+#  ./train_model.py --hist -i ./pcaps/features.store -j 8 --max-depth 12
+#
+# With `--ensemble`, several trees are trained, then compiled to several ml_code tables whose votes
+#  are combined in the switch (see ensemble.py), e.g.,
+#  ./train_model.py --ensemble boost --trees 3 --budget 4096
+#
+# The model is written in a compact file which is loaded without sklearn (see tree_model.py),
+#  it keeps the names of the features and of the classes (from map.json next to the input by default).
 
 import numpy as np
 import pandas as pd
-import argparse
+import argparse, os
 from sklearn.metrics import accuracy_score
 from sklearn import tree
-import pickle
 import matplotlib.pyplot as plt
+import ensemble, feature_store, hist_tree, model_search, snap_thresholds, tree_model
+
+# parse a comma-separated list of integers, "none" for no limit
+def int_list( text ):
+    return [None if v.lower() == "none" else int(v) for v in text.split(",")]
+
+def format_list( values ):
+    return ",".join( "none" if v is None else str(v) for v in values )
 
 
 parser = argparse.ArgumentParser()
 
 # Add argument
-parser.add_argument('-i', default="./pcaps/features.csv", help='path to csv. dataset')
-parser.add_argument('-o', default="./pcaps/dt.model", help='path to output model file')
+parser.add_argument('-i', default="./pcaps/features.csv", help='path to csv. dataset or .store directory')
+parser.add_argument('-o', default=tree_model.MODEL_FILE, help='path to output model file')
+parser.add_argument('-m', help='path to the map.json file giving the names of the classes, default: map.json in the directory of the input')
+parser.add_argument('--plot', default="./pcaps/dt.pdf", help='path to output pdf file visualizing the tree, empty to skip')
+parser.add_argument('--search', action='store_true', help='search hyperparameters of the tree under the budget of entries')
+parser.add_argument('--hist', action='store_true', help='train out of core from histograms of the features, without loading all rows')
+parser.add_argument('--bins', default=hist_tree.MAX_BINS, type=int, help='maximal number of candidate thresholds per feature with --hist')
+parser.add_argument('--work-dir', help='directory of the temporary binned rows with --hist, default: the one of the system')
+parser.add_argument('--ensemble', choices=ensemble.KINDS, help='train an ensemble of trees: random forest or boosted trees')
+parser.add_argument('--trees', default=ensemble.NB_TREES, type=int, help='number of trees with --ensemble')
+parser.add_argument('-j', '--jobs', default=1, type=int, help='number of worker processes with --search or --hist')
+parser.add_argument('--budget', default=model_search.BUDGET, type=int, help='maximum number of entries of ml_code table with --search, of all ml_code tables with --ensemble')
+parser.add_argument('--test-size', default=model_search.TEST_SIZE, type=float, help='fraction of rows held out to score the candidates with --search')
+parser.add_argument('--max-depth', default=format_list( model_search.MAX_DEPTH ), type=int_list, help='candidate values of max_depth with --search, its first value otherwise')
+parser.add_argument('--max-leaf-nodes', default=format_list( model_search.MAX_LEAF_NODES ), type=int_list, help='candidate values of max_leaf_nodes with --search, its first value otherwise')
+parser.add_argument('--min-samples-leaf', default=format_list( model_search.MIN_SAMPLES_LEAF ), type=int_list, help='candidate values of min_samples_leaf with --search, its first value otherwise')
+parser.add_argument('--report', help='path to output csv file containing the scores of all candidates with --search')
+parser.add_argument('--snap', choices=["int", "align"], help='snap the thresholds to integer or to power-of-2 aligned boundaries')
+parser.add_argument('--tolerance', default=0.0, type=float, help='fraction of rows of a node which might go to the other side with "--snap align"')
 args = parser.parse_args()
 
+if args.hist and args.search:
+    parser.error("--hist cannot be used with --search")
+if args.ensemble and (args.hist or args.search):
+    parser.error("--ensemble cannot be used with --hist or --search")
+# the thresholds of a tree trained from histograms are already integers
+if args.hist and args.snap == "align":
+    parser.error("--snap align needs all rows, it cannot be used with --hist")
+
 # extract argument
 inputfile  = args.i
 outputfile = args.o
 
+names  = feature_store.load_feature_names( inputfile )
 # Training set X and Y
-csv  = pd.read_csv(inputfile)
-data = csv.values.tolist()
-X = [i[0:-1] for i in data] #the columns before the last one are features
-Y = [i[-1]   for i in data] #last column is "classification"
+#  the columns before the last one are features
+#  last column is "classification"
+if not args.hist:
+    (X, Y) = feature_store.load_xy( inputfile )
 
 #print(X[0], Y[0])
 #print(X[-1], Y[-1])
 
-# prepare training and testing set
-X = np.array(X)
-Y = np.array(Y)
-
 # print(X)
 
-# decision tree: https://scikit-learn.org/stable/modules/tree.html#tree
-dt = tree.DecisionTreeClassifier()
-dt.fit(X, Y)
+if args.search:
+    candidates = model_search.get_candidates( args.max_depth, args.max_leaf_nodes, args.min_samples_leaf )
+    print("evaluate", len(candidates), "candidates")
+    results = model_search.evaluate( X, Y, candidates, args.jobs, args.test_size, feature_names=names )
+
+    front = model_search.pareto_front( results )
+    print("Pareto front:")
+    for r in front:
+        print("  ", model_search.format_result( r ))
+    if args.report:
+        print("write report to", args.report)
+        model_search.write_report( results, front, args.report )
+
+    best = model_search.choose( results, args.budget )
+    if best is None:
+        raise Exception("no candidate fits the budget of entries", args.budget)
+    print("chosen:", model_search.format_result( best ))
+    dt = best[3]
+elif args.ensemble:
+    # the trees share the budget of entries
+    max_leaf_nodes = args.max_leaf_nodes[0] if args.max_leaf_nodes[0] is not None else max( 2, args.budget // args.trees )
+    dt = ensemble.fit( X, Y, args.ensemble, args.trees, max_leaf_nodes, args.max_depth[0] )
+    print("train {0} trees, {1} leaves, {2}".format( len(dt.trees), dt.get_n_leaves(), ensemble.format_cost( ensemble.pipeline_cost( dt ))))
+    print("compile the P4 program with the number of trees, e.g., make run NB_TREES={0}".format( len(dt.trees) ))
+elif args.hist:
+    dt = hist_tree.fit( inputfile, args.max_depth[0], args.max_leaf_nodes[0], args.min_samples_leaf[0], args.bins,
+        args.jobs, work_dir=args.work_dir )
+    print("train {0} leaves from histograms".format( dt.get_n_leaves() ))
+else:
+    # decision tree: https://scikit-learn.org/stable/modules/tree.html#tree
+    dt = tree.DecisionTreeClassifier()
+    dt.fit(X, Y)
+if args.snap and args.ensemble:
+    for t in dt.trees:
+        (nb_changed, nb_moved) = snap_thresholds.snap( t, X, Y, args.snap == "align", args.tolerance )
+        print("snap {0} thresholds, {1} rows moved at their nodes".format( nb_changed, nb_moved ))
+elif args.snap and not args.hist:
+    (nb_changed, nb_moved) = snap_thresholds.snap( dt, X, Y, args.snap == "align", args.tolerance )
+    print("snap {0} thresholds, {1} rows moved at their nodes".format( nb_changed, nb_moved ))
+
+# keep names of the features as the input might contain more than the basic ones (see extract_features.FEATURE_SETS)
+dt.feature_names = names
+if args.ensemble:
+    for t in dt.trees:
+        t.feature_names = names
 
 # visualize the tree
-plt.figure( dpi=100 )
-tree.plot_tree( dt, filled=True, feature_names=["iat", "len", "diffLen"])
-plt.savefig("./pcaps/dt.pdf", format='pdf', bbox_inches='tight')
+if args.plot and (args.hist or args.ensemble):
+    print("cannot plot a tree trained from histograms or an ensemble, skip", args.plot)
+elif args.plot:
+    plt.figure( dpi=100 )
+    tree.plot_tree( dt, filled=True, feature_names=names)
+    plt.savefig(args.plot, format='pdf', bbox_inches='tight')
 
 #Predict_Y = dt.predict(X)
 #print(accuracy_score(Y, Predict_Y))
 
+# names of the classes
+mapfile = args.m
+if mapfile is None:
+    mapfile = os.path.join( os.path.dirname( os.path.abspath( inputfile )), "map.json" )
+    if not os.path.exists( mapfile ):
+        mapfile = None
+class_names = None
+if mapfile is not None:
+    class_names = tree_model.get_class_names( dt.classes if args.hist or args.ensemble else dt.classes_, tree_model.load_class_map( mapfile ))
+
+if args.hist or args.ensemble:
+    if class_names is not None:
+        dt.class_names = class_names
+else:
+    dt = tree_model.from_sklearn( dt, class_names )
+
+# snapped thresholds might leave branches which no row can reach
+if args.snap:
+    (dt, nb_removed) = tree_model.drop_unreachable_nodes( dt )
+    print("remove {0} unreachable leaves".format( nb_removed ))
+
 # dump model to f
 print("write model to", outputfile)
-pickle.dump(dt, open(outputfile, 'wb'))
\ No newline at end of file
+tree_model.save( dt, outputfile )
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+
+# Compact file format of a decision tree, which is loaded without sklearn, pandas nor pickle.
+#
+# A model file is a numpy .npz archive, e.g., pcaps/dt.npz, containing:
+#  - version       : version of this format
+#  - feature       : index of the feature tested by each node, -2 for a leaf (as in sklearn)
+#  - threshold     : threshold of each node, a row goes to the left child if float32(value) <= threshold
+#  - children_left, children_right: children of each node, -1 for a leaf
+#  - leaf_class    : index in `classes` of the class predicted by each node
+#  - classes       : class indices, e.g., [1, 2, 3]
+#  - class_names   : name of each class, e.g., ["skype", "whatsapp", "webex"], empty if unknown
+#  - feature_names : name of each feature, e.g., ["iat", "len", "diffLen"]
+#  - n_samples     : number of training rows reaching each node (optional)
+#
+# An ensemble of trees (see ensemble.py) is stored in a same archive: `nb_trees`, the `weights` of their votes,
+#  then the arrays of the i-th tree prefixed by "t<i>_", e.g., t0_feature.
+#
+# Only model files are loaded, as unpickling a file might run any code. A sklearn DecisionTreeClassifier
+#  pickled by a former version is converted once by this script, e.g.,
+#  ./tree_model.py --legacy-pickle -i pcaps/dt.model -o pcaps/dt.npz
+# its pickle is read by a restricted unpickler which allows only the classes of a tree and of numpy arrays,
+#  the tree is never built by sklearn, thus the conversion does not depend on the version of sklearn.
+#
+
+import argparse, heapq, json, os, pickle
+import numpy as np
+
+VERSION = 1
+
+# extension of the model files, and the default one of the tools
+MODEL_EXT  = ".npz"
+MODEL_FILE = "./pcaps/dt" + MODEL_EXT
+
+# names of the features of the models which do not keep them
+FEATURE_NAMES = ["iat", "len", "diffLen"]
+
+# range of possible values of each feature, and the width in bits of its match field in the tables
+#  (see ../p4pi/basic.p4 and generate_table_entries.py)
+#  the values of a 64-bit field are kept below the maximum of int64 as numpy computes bounds in int64,
+#  the last range of such a field is stretched to its width when the entries are written
+INT64_MAX = np.iinfo( np.int64 ).max
+DOMAIN = {
+    "iat" : {
+        "min": 0,
+        "max": INT64_MAX - 1, #nanoseconds, bit<64> in the switch
+        "bits": 64
+    },
+    "len" : {
+        "min": 0,
+        "max": 0xFFFF, #max size of an IP packet
+        "bits": 16
+    },
+    "diffLen" : {
+        "min": 0,
+        "max": 0xFFFFFFFF, #len + 0xFFFF - previous len, bit<32> in the switch
+        "bits": 32
+    },
+    # window statistics, see window_stats.py
+    "count" : {
+        "min": 0,
+        "max": 0xFFFFFFFF,
+        "bits": 32
+    },
+    "ewmaIat" : {
+        "min": 0,
+        "max": INT64_MAX - 1,
+        "bits": 64
+    },
+    "ewmaLen" : {
+        "min": 0,
+        "max": 0xFFFF,
+        "bits": 16
+    },
+    "minLen" : {
+        "min": 0,
+        "max": 0xFFFF,
+        "bits": 16
+    },
+    "maxLen" : {
+        "min": 0,
+        "max": 0xFFFF,
+        "bits": 16
+    },
+    "varLen" : {
+        "min": 0,
+        "max": 0xFFFFFFFF,
+        "bits": 32
+    }
+}
+
+
+# the greatest integer v such that float32(v) <= threshold
+#  sklearn sends v to the left child if and only if v <= int_bound(threshold)
+def int_bound( threshold ):
+    a = np.float32( threshold )
+    if float(a) > threshold:
+        a = np.nextafter( a, np.float32(-np.inf) )
+    b = np.nextafter( a, np.float32(np.inf) )
+    # integers below the middle of a and b are rounded to a or below
+    mid = (float(a) + float(b)) / 2
+    v = int( np.floor( mid ))
+    if v == mid and np.float32( v ) > a:
+        v -= 1
+    return v
+
+
+class TreeModel:
+    def __init__(self, feature, threshold, children_left, children_right, leaf_class, classes,
+            feature_names = None, class_names = None, n_samples = None):
+        self.feature        = np.asarray( feature,        dtype=np.int32 )
+        self.threshold      = np.asarray( threshold,      dtype=np.float64 )
+        self.children_left  = np.asarray( children_left,  dtype=np.int32 )
+        self.children_right = np.asarray( children_right, dtype=np.int32 )
+        self.leaf_class     = np.asarray( leaf_class,     dtype=np.int32 )
+        self.classes        = np.asarray( classes,        dtype=np.int64 )
+        self.feature_names  = list( feature_names ) if feature_names is not None else FEATURE_NAMES[ 0 : self.feature.max() + 1 ]
+        self.class_names    = list( class_names )   if class_names   is not None else [""] * len(self.classes)
+        self.n_samples      = np.asarray( n_samples, dtype=np.int64 ) if n_samples is not None else None
+        # bounds and rules of the leaves, computed at their first use (see clear_cache)
+        self._bounds = None
+        self._rules  = None
+
+    # forget the bounds and the rules of the leaves, once the thresholds are modified in place
+    def clear_cache(self):
+        self._bounds = None
+        self._rules  = None
+
+    def is_leaf(self, node):
+        return self.children_left[ node ] == self.children_right[ node ]
+
+    def get_n_leaves(self):
+        return int( np.count_nonzero( self.children_left == self.children_right ))
+
+    # get the class name of a class index, or the index if its name is unknown
+    def class_name(self, classification):
+        i = np.searchsorted( self.classes, classification )
+        if i < len(self.classes) and self.classes[ i ] == classification and self.class_names[ i ]:
+            return self.class_names[ i ]
+        return str( classification )
+
+    # get the leaf reached by each row of X
+    #  as sklearn, features are compared as float32
+    def apply(self, X):
+        X = np.asarray( X, dtype=np.float32 )
+        if X.ndim == 1:
+            X = X.reshape( 1, -1 )
+        node = np.zeros( len(X), dtype=np.int32 )
+        # rows which have not reached a leaf yet
+        rows = np.arange( len(X) )
+        while len(rows) > 0:
+            n = node[ rows ]
+            is_leaf = self.children_left[ n ] == self.children_right[ n ]
+            rows = rows[ ~is_leaf ]
+            n    = n[ ~is_leaf ]
+            go_left = X[ rows, self.feature[ n ] ] <= self.threshold[ n ]
+            node[ rows ] = np.where( go_left, self.children_left[ n ], self.children_right[ n ] )
+        return node
+
+    # get the nodes from the root to the leaf of each row of X
+    #  return an array of (number of rows, depth + 1) nodes, padded by -1 after the leaf
+    def decision_path(self, X):
+        X = np.asarray( X, dtype=np.float32 )
+        if X.ndim == 1:
+            X = X.reshape( 1, -1 )
+        node  = np.zeros( len(X), dtype=np.int32 )
+        paths = [node.copy()]
+        while True:
+            active = (node >= 0) & (self.children_left[ np.maximum( node, 0 ) ] != -1)
+            if not active.any():
+                break
+            rows = np.flatnonzero( active )
+            n = node[ rows ]
+            go_left = X[ rows, self.feature[ n ] ] <= self.threshold[ n ]
+            node = np.full( len(X), -1, dtype=np.int32 )
+            node[ rows ] = np.where( go_left, self.children_left[ n ], self.children_right[ n ] )
+            paths.append( node )
+        return np.column_stack( paths )
+
+    def predict(self, X):
+        return self.classes[ self.leaf_class[ self.apply( X ) ]]
+
+    # mean accuracy on X, Y
+    def score(self, X, Y):
+        return float( np.mean( self.predict( X ) == np.asarray( Y )))
+
+    # get the integer bounds of the features of each node: an integer row reaches a leaf n
+    #  if and only if lo[n] <= row <= hi[n], i.e., the tests of its path on a same feature are merged
+    def leaf_bounds(self):
+        if self._bounds is None:
+            info = np.iinfo( np.int64 )
+            lo = np.full( (len(self.feature), len(self.feature_names)), info.min, dtype=np.int64 )
+            hi = np.full( (len(self.feature), len(self.feature_names)), info.max, dtype=np.int64 )
+            stack = [0]
+            while len(stack) > 0:
+                node = stack.pop()
+                if self.children_left[ node ] == -1:
+                    continue
+                f = self.feature[ node ]
+                t = min( max( int_bound( self.threshold[ node ] ), info.min ), info.max - 1 )
+                (left, right) = (self.children_left[ node ], self.children_right[ node ])
+                lo[ left ]  = lo[ node ]
+                hi[ left ]  = hi[ node ]
+                hi[ left, f ] = min( hi[ node, f ], t )
+                lo[ right ] = lo[ node ]
+                hi[ right ] = hi[ node ]
+                lo[ right, f ] = max( lo[ node, f ], t + 1 )
+                stack.extend( (right, left) )
+            self._bounds = (lo, hi)
+        return self._bounds
+
+    # get the rule of each leaf as a tuple of conditions, e.g., ("93501 <= iat <= 131071", "len <= 47"), None for other nodes
+    def leaf_rules(self):
+        if self._rules is None:
+            (lo, hi) = self.leaf_bounds()
+            info  = np.iinfo( np.int64 )
+            rules = np.empty( len(self.feature), dtype=object )
+            for node in np.flatnonzero( self.children_left == -1 ):
+                conditions = []
+                for (name, l, h) in zip( self.feature_names, lo[ node ].tolist(), hi[ node ].tolist() ):
+                    if l > info.min and h < info.max:
+                        conditions.append( "{0} <= {1} <= {2}".format( l, name, h ))
+                    elif l > info.min:
+                        conditions.append( "{0} >= {1}".format( name, l ))
+                    elif h < info.max:
+                        conditions.append( "{0} <= {1}".format( name, h ))
+                rules[ node ] = tuple( conditions )
+            self._rules = rules
+        return self._rules
+
+    # get the rule of the leaf reached by each row of X
+    def explain(self, X):
+        return self.leaf_rules()[ self.apply( X ) ]
+
+    # get a copy of this tree having at most `max_leaves` leaves
+    #  pairs of sibling leaves are merged into their parent, first the ones of a same class as it changes
+    #  no prediction, then the ones reached by the less training rows
+    def prune(self, max_leaves):
+        left  = self.children_left.copy()
+        right = self.children_right.copy()
+        leaf_class = self.leaf_class.copy()
+        n_samples  = self.n_samples if self.n_samples is not None else np.zeros( len(left), dtype=np.int64 )
+        nb_leaves  = self.get_n_leaves()
+
+        def cost( node ):
+            if leaf_class[ left[ node ]] == leaf_class[ right[ node ]]:
+                return -1
+            return int( n_samples[ node ] )
+
+        parent = np.full( len(left), -1, dtype=np.int32 )
+        inner  = np.flatnonzero( left != -1 )
+        parent[ left[ inner ]]  = inner
+        parent[ right[ inner ]] = inner
+        is_leaf = lambda n: left[ n ] == -1
+        heap = [(cost( n ), int(n)) for n in inner if is_leaf( left[ n ] ) and is_leaf( right[ n ] )]
+        heapq.heapify( heap )
+        while nb_leaves > max( 1, max_leaves ) and len(heap) > 0:
+            (c, node) = heapq.heappop( heap )
+            if c < 0:
+                leaf_class[ node ] = leaf_class[ left[ node ]]
+            left[ node ]  = -1
+            right[ node ] = -1
+            nb_leaves -= 1
+            p = parent[ node ]
+            if p >= 0 and is_leaf( left[ p ] ) and is_leaf( right[ p ] ):
+                heapq.heappush( heap, (cost( p ), int(p)) )
+
+        return self._subtree( left, right, leaf_class )
+
+    # get a copy of this tree without the nodes which no integer row can reach,
+    #  e.g., after snapping thresholds (see snap_thresholds.py), a child whose range of values is empty
+    #  with `domain`, e.g., DOMAIN, the rows out of it are not considered
+    #  return (copy, number of removed leaves)
+    def drop_unreachable(self, domain = None):
+        (lo, hi) = self.leaf_bounds()
+        if domain is not None:
+            lo = np.maximum( lo, [domain[ name ]["min"] for name in self.feature_names] )
+            hi = np.minimum( hi, [domain[ name ]["max"] for name in self.feature_names] )
+        is_empty = (lo > hi).any( axis=1 )
+        left  = self.children_left.copy()
+        right = self.children_right.copy()
+
+        # nodes in depth-first order, then processed from the leaves: a node having an empty child
+        #  is replaced by its other child
+        order = []
+        stack = [0]
+        while len(stack) > 0:
+            node = stack.pop()
+            order.append( node )
+            if left[ node ] != -1:
+                stack.extend( (right[ node ], left[ node ]) )
+        replace = np.arange( len(left), dtype=np.int32 )
+        for node in reversed( order ):
+            if left[ node ] == -1:
+                continue
+            if is_empty[ left[ node ]]:
+                replace[ node ] = replace[ right[ node ]]
+            elif is_empty[ right[ node ]]:
+                replace[ node ] = replace[ left[ node ]]
+            else:
+                left[ node ]  = replace[ left[ node ]]
+                right[ node ] = replace[ right[ node ]]
+
+        tree = self._subtree( left, right, self.leaf_class, replace[ 0 ] )
+        return (tree, self.get_n_leaves() - tree.get_n_leaves())
+
+    # get a copy of the nodes reachable from `root` by children `left` and `right`, renumbered in depth-first order
+    def _subtree(self, left, right, leaf_class, root = 0):
+        order = []
+        stack = [root]
+        while len(stack) > 0:
+            node = stack.pop()
+            order.append( node )
+            if left[ node ] != -1:
+                stack.append( right[ node ] )
+                stack.append( left[ node ] )
+        order = np.array( order, dtype=np.int32 )
+        index = np.full( len(left), -1, dtype=np.int32 )
+        index[ order ] = np.arange( len(order) )
+        is_inner = left[ order ] != -1
+        return TreeModel( np.where( is_inner, self.feature[ order ], -2 ), np.where( is_inner, self.threshold[ order ], -2.0 ),
+            np.where( is_inner, index[ left[ order ]], -1 ), np.where( is_inner, index[ right[ order ]], -1 ),
+            leaf_class[ order ], self.classes, self.feature_names, self.class_names,
+            self.n_samples[ order ] if self.n_samples is not None else None )
+
+
+# trees whose predictions are (weighted) votes, see ensemble.py
+class Ensemble:
+    def __init__(self, trees, weights = None):
+        self.trees   = list( trees )
+        self.weights = np.asarray( weights if weights is not None else np.ones( len(self.trees) ), dtype=np.float64 )
+        self.classes       = self.trees[0].classes
+        self.feature_names = self.trees[0].feature_names
+        self.class_names   = self.trees[0].class_names
+
+    def get_n_leaves(self):
+        return sum( t.get_n_leaves() for t in self.trees )
+
+    def class_name(self, classification):
+        return self.trees[0].class_name( classification )
+
+    # get the class of each combination of votes: votes[i][j] is the class index voted by the i-th tree for row j
+    #  the class having the greatest sum of weights wins, the smallest class index if several
+    def vote(self, votes):
+        votes  = np.asarray( votes )
+        scores = np.zeros( (len(self.classes), votes.shape[1]) )
+        for (weight, v) in zip( self.weights, votes ):
+            scores[ v, np.arange( votes.shape[1] ) ] += weight
+        return np.argmax( scores, axis=0 )
+
+    def predict(self, X):
+        return self.classes[ self.vote( [t.leaf_class[ t.apply( X )] for t in self.trees] ) ]
+
+    def score(self, X, Y):
+        return float( np.mean( self.predict( X ) == np.asarray( Y )))
+
+    def leaf_rules(self):
+        return [t.leaf_rules() for t in self.trees]
+
+    # get the rules of the leaves reached by each row of X: an array of (number of rows, number of trees) rules
+    def explain(self, X):
+        return np.column_stack( [t.explain( X ) for t in self.trees] )
+
+
+# get a copy of a TreeModel or an Ensemble without the nodes which no integer row can reach
+#  return (copy, number of removed leaves)
+def drop_unreachable_nodes( model, domain = None ):
+    if isinstance( model, Ensemble ):
+        results = [t.drop_unreachable( domain ) for t in model.trees]
+        return (Ensemble( [t for (t, n) in results], model.weights ), sum( n for (t, n) in results ))
+    return model.drop_unreachable( domain )
+
+# get a copy of a TreeModel or an Ensemble having at most `max_leaves` leaves in all its trees
+#  they are shared by the trees proportionally to their number of leaves
+def prune_to_budget( model, max_leaves ):
+    trees = model.trees if isinstance( model, Ensemble ) else [model]
+    total = model.get_n_leaves()
+    if total <= max_leaves:
+        return model
+    trees = [t.prune( max_leaves * t.get_n_leaves() // total ) for t in trees]
+    return Ensemble( trees, model.weights ) if isinstance( model, Ensemble ) else trees[0]
+
+# get the model whose trees are written as table entries (see generate_table_entries.py):
+#  without the leaves out of DOMAIN, then pruned to `budget` entries if given
+#  return (model, number of removed leaves)
+def table_model( model, budget = None ):
+    (model, nb_removed) = drop_unreachable_nodes( model, DOMAIN )
+    if budget is not None:
+        model = prune_to_budget( model, budget )
+    return (model, nb_removed)
+
+
+# convert a sklearn DecisionTreeClassifier
+def from_sklearn( dt, class_names = None ):
+    tree = dt.tree_
+    return TreeModel( tree.feature, tree.threshold, tree.children_left, tree.children_right,
+        np.argmax( tree.value[:, 0, :], axis=1 ), dt.classes_,
+        getattr( dt, "feature_names", None ), class_names if class_names is not None else getattr( dt, "class_names", None ),
+        tree.n_node_samples )
+
+# get the names of the classes from a map class_name => class_index, e.g., pcaps/map.json
+def get_class_names( classes, class_map ):
+    names = {index: name for (name, index) in class_map.items()}
+    return [names.get( int(c), "" ) for c in classes]
+
+def load_class_map( mapfile ):
+    with open( mapfile ) as f:
+        return json.load( f )
+
+
+def _tree_arrays( model, prefix = "" ):
+    arrays = {
+        "feature"       : model.feature,
+        "threshold"     : model.threshold,
+        "children_left" : model.children_left,
+        "children_right": model.children_right,
+        "leaf_class"    : model.leaf_class,
+    }
+    if model.n_samples is not None:
+        arrays["n_samples"] = model.n_samples
+    return {prefix + name: a for (name, a) in arrays.items()}
+
+def _load_tree( data, classes, feature_names, class_names, prefix = "" ):
+    return TreeModel( data[prefix + "feature"], data[prefix + "threshold"], data[prefix + "children_left"],
+        data[prefix + "children_right"], data[prefix + "leaf_class"], classes, feature_names, class_names,
+        data[prefix + "n_samples"] if prefix + "n_samples" in data else None )
+
+# save a TreeModel or an Ensemble
+def save( model, outputfile ):
+    arrays = {
+        "version"      : np.int32( VERSION ),
+        "classes"      : model.classes,
+        "class_names"  : np.array( model.class_names, dtype=str ),
+        "feature_names": np.array( model.feature_names, dtype=str ),
+    }
+    if isinstance( model, Ensemble ):
+        arrays["nb_trees"] = np.int32( len(model.trees) )
+        arrays["weights"]  = model.weights
+        for (i, t) in enumerate( model.trees ):
+            arrays.update( _tree_arrays( t, "t{0}_".format( i )))
+    else:
+        arrays.update( _tree_arrays( model ))
+    # write to a temporary file first, thus a reader, e.g., predict_server.py, never sees a partial file
+    #  (np.savez would add the extension to a file name)
+    tmp_file = outputfile + ".{0}.tmp".format( os.getpid() )
+    with open( tmp_file, 'wb' ) as f:
+        np.savez_compressed( f, **arrays )
+    os.replace( tmp_file, outputfile )
+
+# load a model file
+def load( inputfile ):
+    with open( inputfile, 'rb' ) as f:
+        magic = f.read( 2 )
+    # a .npz archive is a zip file
+    if magic != b"PK":
+        raise Exception("not a {0} model file: {1}, a pickled model is converted by ./tree_model.py --legacy-pickle -i {1} -o <model{0}>".format(
+            MODEL_EXT, inputfile ))
+
+    with np.load( inputfile, allow_pickle=False ) as data:
+        if int( data["version"] ) != VERSION:
+            raise Exception("unsupported version of model file", int( data["version"] ))
+        classes       = data["classes"]
+        feature_names = data["feature_names"].tolist()
+        class_names   = data["class_names"].tolist()
+        if "nb_trees" in data:
+            trees = [_load_tree( data, classes, feature_names, class_names, "t{0}_".format( i ))
+                for i in range( int( data["nb_trees"] ))]
+            return Ensemble( trees, data["weights"] )
+        return _load_tree( data, classes, feature_names, class_names )
+
+
+# classes of a pickled DecisionTreeClassifier which are not built but whose state is kept
+_PICKLED_SKLEARN = {("sklearn.tree._classes", "DecisionTreeClassifier"), ("sklearn.tree.tree", "DecisionTreeClassifier"),
+    ("sklearn.tree._tree", "Tree")}
+# classes of the numpy arrays of a pickle
+_PICKLED_NUMPY = {("numpy", "ndarray"), ("numpy", "dtype"), ("numpy.core.multiarray", "_reconstruct"), ("numpy.core.multiarray", "scalar"),
+    ("numpy._core.multiarray", "_reconstruct"), ("numpy._core.multiarray", "scalar")}
+
+class _PickledState:
+    def __init__(self, *args):
+        self.args  = args
+        self.state = {}
+
+    def __setstate__(self, state):
+        self.state = state
+
+class _LegacyUnpickler( pickle.Unpickler ):
+    def find_class(self, module, name):
+        if (module, name) in _PICKLED_SKLEARN:
+            return _PickledState
+        if (module, name) in _PICKLED_NUMPY:
+            return super().find_class( module, name )
+        raise pickle.UnpicklingError("{0}.{1} is not allowed in a pickled model".format( module, name ))
+
+# load a DecisionTreeClassifier pickled by a former version (see above)
+def load_legacy_pickle( inputfile ):
+    with open( inputfile, 'rb' ) as f:
+        dt = _LegacyUnpickler( f ).load()
+    if not isinstance( dt, _PickledState ) or not isinstance( dt.state.get( "tree_" ), _PickledState ):
+        raise Exception("not a pickled DecisionTreeClassifier", inputfile)
+    nodes  = dt.state["tree_"].state["nodes"]
+    values = dt.state["tree_"].state["values"]
+    return TreeModel( nodes["feature"], nodes["threshold"], nodes["left_child"], nodes["right_child"],
+        np.argmax( values[:, 0, :], axis=1 ), dt.state["classes_"],
+        dt.state.get( "feature_names" ), dt.state.get( "class_names" ), nodes["n_node_samples"] )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', required=True, help='path to the input model')
+    parser.add_argument('-o', required=True, help='path to the output model file (' + MODEL_EXT + ')')
+    parser.add_argument('-m', help='path to the map.json file giving the names of the classes')
+    parser.add_argument('--legacy-pickle', action='store_true', help='the input is a DecisionTreeClassifier pickled by a former version')
+    args = parser.parse_args()
+
+    model = load_legacy_pickle( args.i ) if args.legacy_pickle else load( args.i )
+    if args.m:
+        model.class_names = get_class_names( model.classes, load_class_map( args.m ))
+    save( model, args.o )
+    print("write {0} leaves to {1} ({2} bytes)".format( model.get_n_leaves(), args.o, os.path.getsize( args.o )))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+# Verify that the generated table entries (see generate_table_entries.py) classify every feature vector
+#  of the domain (see tree_model.DOMAIN), i.e., every value of the match fields, exactly as the tree they are generated from.
+#  The values of a 64-bit field above the int64 maximum are read as this maximum, as their last range is.
+#
+# The thresholds of the tree and the bounds of the entries cut each feature into cells,
+#  the product of these breakpoints is a grid whose cells are classified identically by the tree,
+#  respectively by the table. Only the cells of each leaf are checked against the entries which
+#  intersect it, thus the grid is never built for the whole domain:
+#  - the pairs of intersecting (leaf, entry) are found at once for all leaves and entries
+#  - a leaf which is contained by a single entry of its class is valid, i.e., one cell
+#  - otherwise the cells of the leaf cut by the bounds of its entries are evaluated
+# It reports:
+#  - gaps      : cells matching no entry
+#  - overlaps  : pairs of entries matching a same cell
+#  - mismatches: cells whose winning entry, i.e., of smallest priority value, has another class than the leaf
+#  - empty     : entries whose range of a field is empty, i.e., lo > hi, which is not a valid key
+# and the entries of `MyIngress.ml_vote` of an ensemble which differ from its vote.
+#
+# It is run by generate_table_entries.py after writing the entries, or separately, e.g.,
+#  ./verify_table.py -i ./pcaps/dt.npz -c ./pcaps/s1-commands.txt
+#
+
+import argparse, sys, time
+import numpy as np
+import ensemble, evaluate_table, tree_model
+from tree_model import DOMAIN
+
+# number of leaves whose intersecting entries are searched at once
+BATCH_SIZE = 256
+
+# number of examples printed of each kind of error
+NB_EXAMPLES = 5
+
+
+# bounds of the entries of a range table, sorted by priority: the winning entries first
+def get_entries( entries ):
+    entries  = sorted( entries, key=lambda e: e[2] )
+    lo       = np.array( [[k[0] for k in keys] for (keys, params, priority) in entries], dtype=np.int64 ).reshape( len(entries), -1 )
+    hi       = np.array( [[k[1] for k in keys] for (keys, params, priority) in entries], dtype=np.int64 ).reshape( len(entries), -1 )
+    values   = np.array( [params[0] for (keys, params, priority) in entries], dtype=np.int64 )
+    priority = np.array( [priority for (keys, params, priority) in entries], dtype=np.int64 )
+    return (lo, hi, values, priority)
+
+# get the cells of the box [lo, hi] cut by the bounds of the entries: the first value of each cell
+def get_cells( lo, hi, entries_lo, entries_hi ):
+    starts = []
+    for f in range( len(lo) ):
+        points = np.concatenate( ([lo[ f ]], entries_lo[:, f], entries_hi[:, f] + 1) )
+        starts.append( np.unique( points[ (points >= lo[ f ]) & (points <= hi[ f ]) ] ))
+    grid = np.meshgrid( *starts, indexing="ij" )
+    return np.column_stack( [g.reshape( -1 ) for g in grid] )
+
+# check the entries of a range table against a tree
+#  return {"leaves", "cells", "gaps", "overlaps", "mismatches", "empty"}, examples of each kind of error
+def check_tree( dt, entries, feature_names ):
+    (entries_lo, entries_hi, values, priority) = get_entries( entries )
+    if entries_lo.shape[1] != len(feature_names):
+        raise Exception("entries have {0} fields, the tree has {1} features".format( entries_lo.shape[1], len(feature_names) ))
+    # entries whose range is empty never match
+    is_empty = (entries_lo > entries_hi).any( axis=1 )
+
+    domain_lo = np.array( [DOMAIN[ name ]["min"] for name in feature_names], dtype=np.int64 )
+    domain_hi = np.array( [DOMAIN[ name ]["max"] for name in feature_names], dtype=np.int64 )
+    leaves = np.flatnonzero( dt.children_left == -1 )
+    (lo, hi) = dt.leaf_bounds()
+    lo = np.maximum( lo[ leaves ], domain_lo )
+    hi = np.minimum( hi[ leaves ], domain_hi )
+    # leaves out of the domain
+    inside = (lo <= hi).all( axis=1 )
+    (leaves, lo, hi) = (leaves[ inside ], lo[ inside ], hi[ inside ])
+    classes = dt.classes[ dt.leaf_class[ leaves ]]
+
+    result   = {"leaves": len(leaves), "cells": 0, "gaps": 0, "overlaps": set(), "mismatches": 0, "empty": int( is_empty.sum() )}
+    examples = {"gaps": [], "overlaps": [], "mismatches": []}
+    for start in range( 0, len(leaves), BATCH_SIZE ):
+        end = min( start + BATCH_SIZE, len(leaves) )
+        # (leaf, entry) intersecting
+        intersect = ((np.maximum( lo[ start : end, None ], entries_lo[ None ] ) <= np.minimum( hi[ start : end, None ], entries_hi[ None ] )).all( axis=2 )
+            & ~is_empty[ None ] )
+        # a leaf is valid if its first intersecting entry contains it and has its class, and no other entry intersects it
+        count = intersect.sum( axis=1 )
+        first = np.argmax( intersect, axis=1 )
+        valid = ((count == 1) & (values[ first ] == classes[ start : end ])
+            & (entries_lo[ first ] <= lo[ start : end ]).all( axis=1 ) & (entries_hi[ first ] >= hi[ start : end ]).all( axis=1 ))
+        result["cells"] += int( valid.sum() )
+
+        for i in np.flatnonzero( ~valid ).tolist():
+            leaf = start + i
+            matching = np.flatnonzero( intersect[ i ] )
+            cells = get_cells( lo[ leaf ], hi[ leaf ], entries_lo[ matching ], entries_hi[ matching ] )
+            result["cells"] += len(cells)
+            # (cell, entry) matching
+            match = ((entries_lo[ matching ][ None ] <= cells[:, None]) & (cells[:, None] <= entries_hi[ matching ][ None ])).all( axis=2 )
+            nb_matches = match.sum( axis=1 )
+
+            gaps = np.flatnonzero( nb_matches == 0 )
+            result["gaps"] += len(gaps)
+            for c in gaps[ 0 : max( 0, NB_EXAMPLES - len(examples["gaps"]) ) ].tolist():
+                examples["gaps"].append( "{0} (leaf {1}, class {2}) matches no entry".format( cells[ c ].tolist(), leaves[ leaf ], classes[ leaf ] ))
+
+            for c in np.flatnonzero( nb_matches > 1 ).tolist():
+                e = matching[ match[ c ]]
+                for j in range( 1, len(e) ):
+                    pair = (int( priority[ e[0] ] ), int( priority[ e[ j ]] ))
+                    if pair not in result["overlaps"] and len(examples["overlaps"]) < NB_EXAMPLES:
+                        examples["overlaps"].append( "{0} matches entries of priority {1} and {2}".format( cells[ c ].tolist(), *pair ))
+                    result["overlaps"].add( pair )
+
+            # the leaf intersects no entry, i.e., it is a gap
+            if len(matching) == 0:
+                continue
+            # the winning entry is the first matching one
+            winners = matching[ np.argmax( match, axis=1 ) ]
+            wrong = np.flatnonzero( (nb_matches > 0) & (values[ winners ] != classes[ leaf ]) )
+            result["mismatches"] += len(wrong)
+            for c in wrong[ 0 : max( 0, NB_EXAMPLES - len(examples["mismatches"]) ) ].tolist():
+                examples["mismatches"].append( "{0}: entry of priority {1} gives {2}, leaf {3} gives {4}".format(
+                    cells[ c ].tolist(), priority[ winners[ c ]], values[ winners[ c ]], leaves[ leaf ], classes[ leaf ] ))
+    result["overlaps"] = len(result["overlaps"])
+    return (result, examples)
+
+# check the entries of ml_vote table against the vote of an ensemble
+#  return the combinations of votes whose entry is missing or differs
+def check_votes( model, entries ):
+    table = {tuple( keys ): params[0] for (keys, params, priority) in entries}
+    errors = []
+    for (votes, result) in ensemble.vote_entries( model ):
+        key = tuple( int( model.classes[ v ] ) for v in votes )
+        if table.get( key ) != model.classes[ result ]:
+            errors.append( "votes {0}: entry gives {1}, ensemble gives {2}".format( list( key ), table.get( key ), model.classes[ result ] ))
+    return errors
+
+# check all tables of a TreeModel or an Ensemble, print the errors
+#  return True if the tables are equivalent to the model
+def verify( model, tables ):
+    trees = model.trees if isinstance( model, tree_model.Ensemble ) else [model]
+    is_valid = True
+    for (i, dt) in enumerate( trees ):
+        name = evaluate_table.CODE_TABLES[ i ]
+        if not name in tables:
+            print("{0}: no entry".format( name ))
+            is_valid = False
+            continue
+        start = time.perf_counter()
+        (result, examples) = check_tree( dt, tables[ name ], model.feature_names )
+        print("{0}: {1} leaves, {2} cells checked in {3:.2f} s, {4} gaps, {5} overlaps, {6} mismatches, {7} empty entries".format(
+            name, result["leaves"], result["cells"], time.perf_counter() - start,
+            result["gaps"], result["overlaps"], result["mismatches"], result["empty"] ))
+        for kind in ("gaps", "overlaps", "mismatches"):
+            for e in examples[ kind ]:
+                print("  -", e)
+        if result["gaps"] or result["overlaps"] or result["mismatches"] or result["empty"]:
+            is_valid = False
+
+    if len(trees) > 1:
+        errors = check_votes( model, tables.get( evaluate_table.VOTE_TABLE, [] ))
+        print("{0}: {1} wrong combinations of votes".format( evaluate_table.VOTE_TABLE, len(errors) ))
+        for e in errors[ 0 : NB_EXAMPLES ]:
+            print("  -", e)
+        is_valid = is_valid and len(errors) == 0
+    return is_valid
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # Add argument
+    parser.add_argument('-i', default=tree_model.MODEL_FILE, help='path to the input model')
+    parser.add_argument('-c', default="./pcaps/s1-commands.txt", help='path to the entries of the tables')
+    parser.add_argument('--budget', type=int, help='the same budget as generate_table_entries.py, the trees are pruned as it')
+    args = parser.parse_args()
+
+    # the trees of the entries, see generate_table_entries.py
+    (model, nb_removed) = tree_model.table_model( tree_model.load( args.i ), args.budget )
+
+    if not verify( model, evaluate_table.parse_commands( args.c )):
+        sys.exit("the entries are not equivalent to the model")
+    print("the entries are equivalent to the model")